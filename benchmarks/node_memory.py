@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+''' Measure the memory used by waf nodes for a synthetic tree of UFOs '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+# Usage: python3 benchmarks/node_memory.py [-u ufos] [-g glyphs]
+# Builds a tree of UFOs in a temporary directory, globs every file in it into
+# a node tree, as smith does when hashing and finding sources, and reports the
+# memory the tree takes and the size of its pickle. The nodes are compared
+# with nodes as they used to be: a subclass with a __dict__ and names that
+# are not interned.
+
+import os, sys, pickle, tempfile, time, tracemalloc, argparse
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from waflib import Node
+
+def make_tree(base, ufos, glyphs) :
+    for u in range(ufos) :
+        ufo = os.path.join(base, 'source', 'Family-Style%d.ufo' % u)
+        gdir = os.path.join(ufo, 'glyphs')
+        os.makedirs(gdir)
+        for f in ('metainfo.plist', 'fontinfo.plist', 'groups.plist', 'kerning.plist', 'lib.plist', 'layercontents.plist') :
+            with open(os.path.join(ufo, f), 'w') as fh :
+                fh.write('<plist/>\n')
+        with open(os.path.join(gdir, 'contents.plist'), 'w') as fh :
+            fh.write('<plist/>\n')
+        for g in range(glyphs) :
+            with open(os.path.join(gdir, 'uni%04X.glif' % (0x100 + g)), 'w') as fh :
+                fh.write('<glyph/>\n')
+
+def old_init(self, name, parent) :
+    self.name = name
+    self.parent = parent
+    if parent :
+        parent.children[name] = self
+
+def measure(cls, base) :
+    cls.ctx = None
+    tracemalloc.start()
+    start = time.time()
+    root = cls('', None)
+    top = root.find_dir(base)
+    nodes = top.ant_glob('**/*', dir=True)
+    elapsed = time.time() - start
+    mem = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    Node.Nod3 = cls
+    size = len(pickle.dumps(root, pickle.HIGHEST_PROTOCOL))
+    return (len(nodes), mem, size, elapsed)
+
+def main() :
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument('-u', '--ufos', type = int, default = 50, help = 'number of UFOs [50]')
+    parser.add_argument('-g', '--glyphs', type = int, default = 500, help = 'glyphs per UFO [500]')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as base :
+        make_tree(base, args.ufos, args.glyphs)
+        variants = [('__slots__', type('Nod3', (Node.Node,), {'__slots__' : ()})),
+                    ('old', type('Nod3', (Node.Node,), {'__init__' : old_init}))]
+        print("%-10s %8s %12s %12s %8s" % ("nodes", "count", "memory(kB)", "pickle(kB)", "time(s)"))
+        for name, cls in variants :
+            cls.__module__ = 'waflib.Node'
+            count, mem, size, elapsed = measure(cls, base)
+            print("%-10s %8d %12.0f %12.0f %8.2f" % (name, count, mem / 1024., size / 1024., elapsed))
+
+if __name__ == '__main__' :
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+''' Time the ordering of a synthetic group of 20k tasks '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+# Usage: python3 benchmarks/task_order.py [-f fonts] [-t tests] [-m modifiers] [--old]
+# Makes a group of tasks like a project with many fonts: for each font a task
+# that builds it, a chain of modify() tasks on it, many test tasks that read
+# it, an index that reads all the test results and a late modify() that runs
+# after the index. Then it times inject_modifiers(), top_sort() and
+# prioritise() on the group, as smith does before running it, and checks that
+# each test was put after the last modifier that doesn't run after it. With
+# --old it also times finding the place in each chain by walking run_after
+# for each question, as inject_modifiers() used to.
+
+import os, sys, time, argparse
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from waflib import Task
+from smithlib import taskorder
+
+class Gen(object) :
+    update_outputs = False
+
+class Node(object) :
+    def __init__(self, name) :
+        self.name = name
+
+class FakeTask(Task.Task) :
+    def __init__(self, name, inputs = (), outputs = (), tempcopy = None) :
+        super(FakeTask, self).__init__(generator = Gen(), env = None)
+        self.name = name
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        if tempcopy :
+            self.tempcopy = tempcopy
+
+    def __repr__(self) :
+        return self.name
+
+def make_group(fonts, tests, modifiers) :
+    tasks = []
+    lasts = []
+    for f in range(fonts) :
+        font = Node('font%d.ttf' % f)
+        tmp = Node('font%d.ttf.tmp' % f)
+        build = FakeTask('build%d' % f, outputs = [font])
+        tasks.append(build)
+        mods = [FakeTask('modify%d_%d' % (f, m), tempcopy = (tmp, font)) for m in range(modifiers)]
+        tasks.extend(mods)
+        results = []
+        for t in range(tests) :
+            res = Node('test%d_%d.html' % (f, t))
+            test = FakeTask('test%d_%d' % (f, t), inputs = [font], outputs = [res])
+            # as set_file_constraints would have it
+            test.set_run_after(build)
+            tasks.append(test)
+            results.append(res)
+        index = FakeTask('index%d' % f, inputs = results, outputs = [Node('index%d.html' % f)])
+        for t in tasks[-tests:] :
+            index.set_run_after(t)
+        tasks.append(index)
+        late = FakeTask('latemodify%d' % f, tempcopy = (tmp, font))
+        late.set_run_after(index)
+        tasks.append(late)
+        lasts.append(mods[-1] if mods else build)
+    return tasks, lasts
+
+def old_inject_modifiers(tasks) :
+    """ The chain search as it was, walking run_after for each question """
+    tmap = {}
+    for t in tasks :
+        for n in getattr(t, 'outputs', []) :
+            tmap.setdefault(id(n), []).append(t)
+    for t in tasks :
+        tmpnode, outnode = getattr(t, 'tempcopy', (None, None))
+        if outnode :
+            if id(outnode) in tmap :
+                t.set_run_after(tmap[id(outnode)][-1])
+                tmap[id(outnode)].append(t)
+            else :
+                tmap[id(outnode)] = [t]
+    for t in tasks :
+        for n in getattr(t, 'inputs', []) :
+            if id(n) in tmap :
+                entry = tmap[id(n)]
+                res = len(entry)
+                for i in range(res) :
+                    if taskorder.runs_after(entry[i], t) or id(entry[i]) == id(t) :
+                        res = i
+                        break
+                if res :
+                    t.set_run_after(entry[res - 1])
+
+def check(tasks, lasts, fonts, tests, modifiers) :
+    bad = 0
+    for f in range(fonts) :
+        base = f * (tests + modifiers + 3) + 1 + modifiers
+        for t in tasks[base:base + tests] :
+            if lasts[f] not in t.run_after :
+                bad += 1
+    return bad
+
+def run(name, inject, args) :
+    tasks, lasts = make_group(args.fonts, args.tests, args.modifiers)
+    start = time.perf_counter()
+    inject(tasks)
+    injected = time.perf_counter()
+    order = taskorder.prioritise(taskorder.top_sort(tasks), {})
+    done = time.perf_counter()
+    pos = dict((id(t), i) for i, t in enumerate(order))
+    backwards = sum(1 for t in tasks for a in t.run_after if id(a) in pos and pos[id(a)] > pos[id(t)])
+    print("%s: %d tasks, inject %.3fs, sort %.3fs, %d misplaced tests, %d links out of order"
+          % (name, len(tasks), injected - start, done - injected, check(tasks, lasts, args.fonts, args.tests, args.modifiers), backwards))
+
+def main() :
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', '--fonts', type = int, default = 40, help = 'Number of fonts [40]')
+    parser.add_argument('-t', '--tests', type = int, default = 490, help = 'Number of tests of each font [490]')
+    parser.add_argument('-m', '--modifiers', type = int, default = 7, help = 'Number of modify() tasks on each font [7]')
+    parser.add_argument('--old', action = 'store_true', help = 'Also time walking run_after as it used to')
+    args = parser.parse_args()
+    run("indexed", taskorder.inject_modifiers, args)
+    if args.old :
+        run("walked", old_inject_modifiers, args)
+
+if __name__ == '__main__' :
+    main()
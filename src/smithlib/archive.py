@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+''' Incremental release archives '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+from waflib import Logs, Utils
+import os, json, lzma, struct, tarfile, time, zipfile, zlib
+from concurrent.futures import ThreadPoolExecutor
+
+# A manifest is kept for each package of what went into its last zip and
+# tarball: the archive path, the base directory in the archive and, for each
+# member (named relative to that base), a key made from the hash of its source
+# file. Members of the new zip whose key is unchanged are copied, still
+# compressed, from the old zip. An archive whose members are all unchanged is
+# not rewritten at all.
+#
+# Compression runs in threads (zlib and lzma release the GIL): each new zip
+# member is deflated on its own and an xz is written as a run of independently
+# compressed blocks, which xz and python both read as one stream. Block
+# boundaries don't depend on the number of threads, so neither does the
+# output. A deterministic archive also gets fixed timestamps and ownership.
+#
+# zipfile has no public way to read or write a member's compressed bytes, so
+# read_raw() and write_raw() use its internals. If this python's zipfile
+# doesn't have them, members are compressed afresh and added with writestr().
+
+XZBLOCK = 8 * 1024 * 1024
+
+def manifest_path(bld, name) :
+    return os.path.join(bld.bldnode.abspath(), '.smitharchive-{}.json'.format(name))
+
+def load_manifest(path) :
+    try :
+        with open(path) as f :
+            return json.load(f)
+    except (OSError, ValueError) :
+        return {}
+
+def save_manifest(path, data) :
+    try :
+        with open(path + '.tmp', 'w') as f :
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(path + '.tmp', path)
+    except OSError as e :
+        Logs.warn("Could not save archive manifest: %s" % e)
+
+class Options(object) :
+    """ How to compress an archive """
+    def __init__(self, threads = 0, deterministic = False) :
+        self.threads = int(threads or os.cpu_count() or 1)
+        self.deterministic = bool(deterministic)
+        epoch = os.environ.get('SOURCE_DATE_EPOCH', '')
+        # zip can't store anything before 1980
+        self.epoch = max(int(epoch) if epoch.isdigit() else 0, 315532800)
+
+    def date_time(self, path) :
+        """ The timestamp to give a zip member """
+        if self.deterministic :
+            return time.gmtime(self.epoch)[:6]
+        return time.localtime(os.stat(path).st_mtime)[:6]
+
+    def pool(self) :
+        return ThreadPoolExecutor(self.threads) if self.threads > 1 else None
+
+def pmap(pool, fn, items, window) :
+    """ Like map() but in the pool, keeping at most window results in hand """
+    if pool is None :
+        for x in items :
+            yield fn(x)
+        return
+    pending = []
+    for x in items :
+        pending.append(pool.submit(fn, x))
+        if len(pending) >= window :
+            yield pending.pop(0).result()
+    for f in pending :
+        yield f.result()
+
+class XZWriter(object) :
+    """ A write only file that xz compresses its contents in parallel blocks """
+    def __init__(self, fobj, opts, preset = 6) :
+        self.fobj = fobj
+        self.preset = preset
+        self.buf = []
+        self.buflen = 0
+        self.executor = opts.pool()
+        self.pending = []
+        self.window = 2 * opts.threads
+
+    def _compress(self, data) :
+        return lzma.compress(data, format=lzma.FORMAT_XZ, preset=self.preset)
+
+    def _flush(self) :
+        if not self.buflen : return
+        data = b"".join(self.buf)
+        self.buf = []
+        self.buflen = 0
+        if self.executor is None :
+            self.fobj.write(self._compress(data))
+            return
+        self.pending.append(self.executor.submit(self._compress, data))
+        while len(self.pending) >= self.window :
+            self.fobj.write(self.pending.pop(0).result())
+
+    def write(self, data) :
+        self.buf.append(bytes(data))
+        self.buflen += len(data)
+        if self.buflen >= XZBLOCK :
+            self._flush()
+        return len(data)
+
+    def close(self) :
+        try :
+            self._flush()
+            for f in self.pending :
+                self.fobj.write(f.result())
+        finally :
+            self.pending = []
+            if self.executor is not None :
+                self.executor.shutdown()
+            self.fobj.close()
+
+def open_tarxz(path, opts) :
+    """ Returns (tarfile, writer) for writing a .tar.xz. Close both, tar first """
+    w = XZWriter(open(path, 'wb'), opts)
+    return (tarfile.open(fileobj=w, mode='w|', format=tarfile.PAX_FORMAT), w)
+
+def tarfilter(opts) :
+    """ Returns a tarfile filter that normalises an entry if opts is deterministic """
+    if not opts.deterministic : return None
+    def fn(info) :
+        info.mtime = opts.epoch
+        info.uid = info.gid = 0
+        info.uname = info.gname = ''
+        if info.isfile() or info.isdir() :
+            info.mode = 0o755 if info.isdir() or info.mode & 0o100 else 0o644
+        return info
+    return fn
+
+def write_tarxz(path, entries, opts) :
+    """ Write a .tar.xz of entries, which are (file path, name in the archive) """
+    tmp = path + '.tmp'
+    tar, w = open_tarxz(tmp, opts)
+    try :
+        filt = tarfilter(opts)
+        for f, arcname in entries :
+            tar.add(f, arcname = arcname, filter = filt)
+    finally :
+        try :
+            tar.close()
+        finally :
+            w.close()
+    os.replace(tmp, path)
+
+class Member(object) :
+    """ A file to go into an archive """
+    def __init__(self, name, arcname, path, text) :
+        self.name = name            # relative to the archive base directory
+        self.arcname = arcname
+        self.path = path
+        self.text = text
+        self.isfile = os.path.isfile(path)
+        self.key = (Utils.to_hex(Utils.h_file(path)) + ('t' if text else 'b')) if os.path.exists(path) else ''
+
+def manifest(path, base, members, opts) :
+    return {'path' : path, 'base' : base, 'deterministic' : opts.deterministic,
+            'members' : dict((m.name, m.key) for m in members)}
+
+def unchanged(old, path, base, members) :
+    """ Is the archive at path exactly what the manifest old says? """
+    if old.get('path') != path or old.get('base') != base or not os.path.exists(path) :
+        return False
+    return old.get('members', {}) == dict((m.name, m.key) for m in members)
+
+_rawmodule = ('sizeFileHeader', 'stringFileHeader', 'structFileHeader', '_FH_FILENAME_LENGTH', '_FH_EXTRA_FIELD_LENGTH')
+_rawzipfile = ('fp', 'start_dir', '_lock', '_writecheck', '_didModify', 'filelist', 'NameToInfo')
+
+def can_raw(zf) :
+    """ Does zipfile have the internals that read_raw() and write_raw() use? """
+    return all(hasattr(zipfile, x) for x in _rawmodule) and all(hasattr(zf, x) for x in _rawzipfile) \
+        and hasattr(zipfile.ZipInfo, 'FileHeader')
+
+def read_raw(zf, info) :
+    """ Returns the compressed data of a zip member """
+    fp = zf.fp
+    fp.seek(info.header_offset)
+    header = fp.read(zipfile.sizeFileHeader)
+    if len(header) != zipfile.sizeFileHeader or header[0:4] != zipfile.stringFileHeader :
+        raise zipfile.BadZipFile("Bad local header for %s" % info.filename)
+    fields = struct.unpack(zipfile.structFileHeader, header)
+    fp.seek(fields[zipfile._FH_FILENAME_LENGTH] + fields[zipfile._FH_EXTRA_FIELD_LENGTH], 1)
+    return fp.read(info.compress_size)
+
+def write_raw(zf, info, data) :
+    """ Add an already compressed member to a zip being written """
+    with zf._lock :
+        zf.fp.seek(zf.start_dir)
+        info.header_offset = zf.fp.tell()
+        zf._writecheck(info)
+        zf._didModify = True
+        zf.fp.write(info.FileHeader(info.file_size > zipfile.ZIP64_LIMIT or info.compress_size > zipfile.ZIP64_LIMIT))
+        zf.fp.write(data)
+        zf.start_dir = zf.fp.tell()
+        zf.filelist.append(info)
+        zf.NameToInfo[info.filename] = info
+
+def copy_member(oldzip, oldinfo, arcname, zf) :
+    info = zipfile.ZipInfo(arcname, oldinfo.date_time)
+    for a in ('compress_type', 'CRC', 'compress_size', 'file_size', 'internal_attr',
+              'external_attr', 'create_system') :
+        setattr(info, a, getattr(oldinfo, a))
+    info.flag_bits = oldinfo.flag_bits & ~0x08      # sizes are in the local header
+    write_raw(zf, info, read_raw(oldzip, oldinfo))
+
+def member_data(m, opts) :
+    """ Returns the ZipInfo and uncompressed data for a member """
+    data = None
+    text = m.text
+    if text :
+        try :
+            data = ascrlf(m.path).encode("utf-8")
+        except UnicodeDecodeError as e :
+            Logs.warn("Badly encoded file {}, {}. Storing as binary".format(m.path, str(e)))
+    if data is None :
+        with open(m.path, 'rb') as f :
+            data = f.read()
+    info = zipfile.ZipInfo(m.arcname, opts.date_time(m.path))
+    info.compress_type = zipfile.ZIP_DEFLATED
+    info.file_size = len(data)
+    info.CRC = zlib.crc32(data)
+    info.internal_attr = 1 if text else 0
+    info.external_attr = 0
+    info.create_system = 0   # pretend we are windows
+    return (info, data)
+
+def compress_member(m, opts) :
+    """ Returns the ZipInfo and deflated data for a member """
+    info, data = member_data(m, opts)
+    c = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    data = c.compress(data) + c.flush()
+    info.compress_size = len(data)
+    return (info, data)
+
+def ascrlf(fname) :
+    res = ""
+    with open(fname, "r") as f :
+        res = "\r\n".join([x.rstrip("\n") for x in f.readlines()]) + "\r\n"
+    return res
+
+def write_zip(path, base, members, old, opts) :
+    """ Write the zip, reusing what we can from the last one. Returns the new manifest """
+    members = [m for m in members if m.isfile]
+    if old.get('deterministic', False) != opts.deterministic :
+        old = {}
+    if unchanged(old, path, base, members) :
+        Logs.info("%s is up to date" % path)
+        return old
+    oldzip = None
+    oldmembers = old.get('members', {})
+    if old.get('path') and os.path.exists(old['path']) :
+        try :
+            oldzip = zipfile.ZipFile(old['path'])
+        except (OSError, zipfile.BadZipFile) :
+            oldzip = None
+    reusable = []
+    for m in members :
+        oldinfo = None
+        if oldzip is not None and oldmembers.get(m.name) == m.key :
+            try :
+                oldinfo = oldzip.getinfo(os.path.join(old['base'], m.name))
+            except KeyError :
+                pass
+        if oldinfo is not None and (oldinfo.compress_type != zipfile.ZIP_DEFLATED or oldinfo.flag_bits & 0x01) :
+            oldinfo = None
+        reusable.append(oldinfo)
+    tmp = path + '.tmp'
+    zf = zipfile.ZipFile(tmp, 'w', compression=zipfile.ZIP_DEFLATED)
+    if not can_raw(zf) :
+        Logs.debug("archive: no raw member access in zipfile, compressing %s afresh" % path)
+        try :
+            for m in members :
+                zf.writestr(*member_data(m, opts))
+        finally :
+            zf.close()
+            if oldzip is not None :
+                oldzip.close()
+        os.replace(tmp, path)
+        return manifest(path, base, members, opts)
+    reused = len([x for x in reusable if x is not None])
+    pool = opts.pool()
+    try :
+        fresh = pmap(pool, lambda m: compress_member(m, opts),
+                     [m for m, o in zip(members, reusable) if o is None], 2 * opts.threads)
+        for m, oldinfo in zip(members, reusable) :
+            if oldinfo is not None :
+                copy_member(oldzip, oldinfo, m.arcname, zf)
+            else :
+                write_raw(zf, *next(fresh))
+    finally :
+        if pool is not None :
+            pool.shutdown()
+        zf.close()
+        if oldzip is not None :
+            oldzip.close()
+    os.replace(tmp, path)
+    Logs.info("%s: %d of %d members reused" % (path, reused, len(members)))
+    return manifest(path, base, members, opts)
+
+def write_tar(path, base, members, old, opts) :
+    """ Write the tarball unless nothing in it has changed. Returns the new manifest """
+    members = [m for m in members if not m.arcname.startswith('..')]
+    if old.get('deterministic', False) == opts.deterministic and unchanged(old, path, base, members) :
+        Logs.info("%s is up to date" % path)
+        return old
+    write_tarxz(path, [(m.path, m.arcname) for m in members], opts)
+    return manifest(path, base, members, opts)
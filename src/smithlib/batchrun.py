@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+''' Run many invocations of one command as a single task '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+from waflib import Task, Errors, Logs, Utils
+from waflib.TaskGen import feature, before
+from smithlib.tabledeps import task_tables, keyed, table_digest
+from smithlib import zygote, tasklogs
+import os, sys, pickle, shutil
+
+try :
+    from pypdf import PdfReader, PdfWriter
+except ImportError :
+    PdfReader = PdfWriter = None
+
+# A test command such as cmptxtrender runs once per test file for each font
+# and shaper, loading python, the fonts and the glyph data each time. A batch
+# task generator (features = 'cmdbatch') instead takes a rule and a list of
+# items, each a list of input nodes and an output node, and makes one task
+# that runs the rule for every item whose output is out of date. Each item
+# has its own signature, of its command line and inputs, kept in task_sigs
+# and given to its output node, so items are rerun just as if each had its
+# own task. If all the commands call the same python console script, one
+# python process imports it and forks a child to run each command, as the
+# zygote does, so that no command sees what an earlier one left behind;
+# otherwise each is run as usual.
+
+def batch_key(node) :
+    return ('batch', node.abspath())
+
+class cmdbatch(Task.Task) :
+    color = 'BLUE'
+    nocache = True
+
+    def commands(self) :
+        """ The command line for each item, as its own task would run it """
+        try :
+            return self.cmds
+        except AttributeError :
+            pass
+        tg = self.generator
+        fun, dvars = Task.compile_fun(tg.batchrule, getattr(tg, 'shell', True))
+        res = []
+        for inputs, output in tg.items :
+            t = Task.Task(env = self.env, generator = tg)
+            t.inputs = list(inputs)
+            t.outputs = [output]
+            t.exec_command = lambda cmd, **kw : res.append(cmd) or 0
+            fun(t)
+        self.cmds = res
+        self.dvars = dvars
+        return res
+
+    def item_sig(self, i) :
+        inputs, output = self.generator.items[i]
+        m = Utils.md5()
+        cmd = self.commands()[i]
+        # a rule with shell = False gives a list
+        m.update((cmd if isinstance(cmd, str) else repr(cmd)).encode('utf-8'))
+        for v in self.dvars :
+            m.update(repr(self.env[v]).encode('utf-8'))
+        tables = task_tables(self)
+        for x in inputs :
+            if tables is not None and keyed(self, x) :
+                m.update(table_digest(x.abspath(), tables))
+                continue
+            try :
+                m.update(x.get_bld_sig())
+            except (AttributeError, TypeError) :
+                raise Errors.WafError('Missing node signature for %r (required by %r)' % (x, self))
+        # just the tasks that make this item's inputs, or that make none of the batch's
+        for t in getattr(self, 'intasks', []) :
+            if any(x in inputs for x in t.outputs) or not any(x in self.inputs for x in t.outputs) :
+                m.update(t.signature())
+        return m.digest()
+
+    def signature(self) :
+        try :
+            return self.cache_sig
+        except AttributeError :
+            pass
+        self.sigs = [self.item_sig(i) for i in range(len(self.generator.items))]
+        m = Utils.md5()
+        for s in self.sigs :
+            m.update(s)
+        self.cache_sig = m.digest()
+        return self.cache_sig
+
+    def runnable_status(self) :
+        for t in self.run_after :
+            if not t.hasrun :
+                return Task.ASK_LATER
+        try :
+            self.signature()
+        except Errors.TaskNotReady :
+            return Task.ASK_LATER
+        bld = self.generator.bld
+        self.stale = []
+        for i, (inputs, output) in enumerate(self.generator.items) :
+            if bld.task_sigs.get(batch_key(output)) != self.sigs[i] or getattr(output, 'sig', None) != self.sigs[i] \
+                    or not os.path.exists(output.abspath()) :
+                self.stale.append(i)
+        return Task.RUN_ME if self.stale else Task.SKIP_ME
+
+    def run(self) :
+        bld = self.generator.bld
+        items = self.generator.items
+        res = 0
+        statuses = self.run_items(self.stale)
+        for i, status in zip(self.stale, statuses) :
+            output = items[i][1]
+            if not status and not os.path.exists(output.abspath()) :
+                Logs.error('-> missing file: %r' % output.abspath())
+                status = 1
+            if status :
+                bld.task_sigs.pop(batch_key(output), None)
+                res = res or status
+            else :
+                output.sig = self.sigs[i]
+                bld.task_sigs[batch_key(output)] = self.sigs[i]
+        return res
+
+    def run_items(self, stale) :
+        """ Runs the given items, returning their exit statuses """
+        cmds = self.commands()
+        return run_commands(self, [cmds[i] for i in stale])
+
+    def post_run(self) :
+        # the outputs were signed as their items finished
+        pass
+
+# XeTeX has no resident mode, and most of the time of a small test document
+# goes in starting it and loading the fonts. If pypdf is available, a texbatch
+# task typesets all its stale documents as one job: a driver file inputs each
+# in turn within a group, with \bye redefined to finish the document's pages
+# and record the page count. XeTeX loads each font, at each size, only once.
+# The joint pdf is then split into each document's pdf. If the job fails, the
+# documents are run one at a time as cmdbatch would, to find which failed.
+
+texdriver = r'''\newcount\smithpages \newif\ifsmithdone \newwrite\smithlog
+\immediate\openout\smithlog=\jobname.pages
+\let\smithshipout=\shipout \def\shipout{\global\advance\smithpages by 1 \smithshipout}
+\let\smithbye=\bye
+\def\bye{\ifsmithdone\else\par\vfill\supereject\immediate\write\smithlog{\the\smithpages}\global\smithdonetrue\fi\endinput}
+\def\smithtest#1{\global\smithdonefalse\begingroup\input #1 \endgroup}
+'''
+
+class texbatch(cmdbatch) :
+
+    def run_items(self, stale) :
+        if PdfReader is not None and len(stale) > 1 :
+            res = self.run_joined(stale)
+            if res is not None :
+                return res
+        return cmdbatch.run_items(self, stale)
+
+    def run_joined(self, stale) :
+        """ Typesets the stale documents in one job and splits the result.
+            Returns their statuses or None if the job failed """
+        bld = self.generator.bld
+        items = self.generator.items
+        outdir = items[stale[0]][0][0].parent.get_bld()
+        jobname = items[stale[0]][1].name.rpartition('.')[0] + "_joined"
+        with open(os.path.join(outdir.abspath(), jobname + ".tex"), "w", encoding = "utf-8") as f :
+            f.write(texdriver)
+            for i in stale :
+                f.write("\\smithtest{./%s}\n" % items[i][0][0].bldpath())
+            f.write("\\immediate\\closeout\\smithlog\n\\smithbye\n")
+        cmd = Utils.to_list(self.env.XETEX) + ['--interaction=batchmode', '--output-directory=./' + outdir.bldpath(),
+                './' + os.path.join(outdir.bldpath(), jobname + ".tex")]
+        if self.exec_command(cmd, cwd = bld.variant_dir, env = self.env.env or None) :
+            return None
+        base = os.path.join(outdir.abspath(), jobname)
+        try :
+            with open(base + ".pages") as f :
+                counts = [int(l) for l in f if l.strip()]
+            reader = PdfReader(base + ".pdf")
+        except (OSError, ValueError) :
+            return None
+        if len(counts) != len(stale) :
+            return None
+        res = []
+        start = 0
+        for i, end in zip(stale, counts) :
+            if end <= start :
+                Logs.error("No pages of output for %s" % items[i][0][0].bldpath())
+                res.append(1)
+                continue
+            writer = PdfWriter()
+            for p in range(start, end) :
+                writer.add_page(reader.pages[p])
+            with open(items[i][1].abspath(), "wb") as f :
+                writer.write(f)
+            start = end
+            res.append(0)
+        os.remove(base + ".pdf")
+        return res
+
+@feature('cmdbatch')
+@before('process_taskgens')
+def process_cmdbatch(tg) :
+    inputs = []
+    for srcs, output in tg.items :
+        inputs.extend(x for x in srcs if x not in inputs)
+    tg.create_task(getattr(tg, 'batchclass', 'cmdbatch'), inputs, [x[1] for x in tg.items])
+
+def run_commands(task, cmds) :
+    """ Run the shell commands and return their exit statuses """
+    cwd = task.generator.bld.variant_dir
+    env = task.env.env or None
+    res = []
+    argvs = [zygote.command_argv(c) for c in cmds]
+    if hasattr(os, 'fork') and argvs and all(argvs) and len(set(a[0] for a in argvs)) == 1 :
+        exe = argvs[0][0] if os.path.isabs(argvs[0][0]) else shutil.which(argvs[0][0])
+        entry = zygote.script_entry(exe) if exe else None
+        if entry is not None :
+            cap = tasklogs.start_capture(task)
+            res = []
+            try :
+                res = run_batch(entry, [[exe] + a[1:] for a in argvs], cwd, env, cap.w if cap else None)
+            finally :
+                tasklogs.end_capture(task, cap, any(res) or len(res) < len(cmds))
+    # anything the batch didn't get to is run on its own
+    for c in cmds[len(res):] :
+        res.append(task.exec_command(c, cwd = cwd, env = env))
+    return res
+
+def run_batch(entry, argvs, cwd, env, output = None) :
+    """ Call a console script entry point with each argv from one process,
+        its output to the fd output if given. Returns the exit statuses of
+        those it ran """
+    r, w = os.pipe()
+    srcdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    boot = "import sys; sys.path.insert(0, %r); from smithlib.batchrun import serve; serve()" % srcdir
+    try :
+        proc = Utils.subprocess.Popen([sys.executable, '-c', boot, str(w)], stdin = Utils.subprocess.PIPE,
+                        cwd = cwd, env = env, pass_fds = (w,), close_fds = True, stdout = output, stderr = output)
+    except OSError :
+        os.close(r)
+        os.close(w)
+        return []
+    os.close(w)
+    res = []
+    with os.fdopen(r, 'rb') as results :
+        try :
+            pickle.dump((entry, argvs), proc.stdin, pickle.HIGHEST_PROTOCOL)
+            proc.stdin.close()
+        except OSError :
+            pass
+        while len(res) < len(argvs) :
+            try :
+                res.append(pickle.load(results))
+            except Exception :
+                break
+    Utils.wait_process(proc)
+    return res
+
+def serve() :
+    """ The batch process: reads the entry point and argvs from stdin, forks
+        a child to call the entry point with each argv and writes each exit
+        status to the fd in sys.argv[1] """
+    import importlib, traceback
+    resfd = int(sys.argv[1])
+    entry, argvs = pickle.load(sys.stdin.buffer)
+    nul = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(nul, 0)
+    os.close(nul)
+    try :
+        importlib.import_module(entry[0])
+    except Exception :
+        pass
+    for argv in argvs :
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0 :
+            status = 1
+            try :
+                sys.argv = list(argv)
+                sys.path[0] = os.path.dirname(argv[0])
+                status = zygote.call_script(getattr(importlib.import_module(entry[0]), entry[1]))
+            except BaseException :
+                traceback.print_exc()
+            try :
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally :
+                os._exit(status & 0xff)
+        _, st = os.waitpid(pid, 0)
+        status = -os.WTERMSIG(st) if os.WIFSIGNALED(st) else os.WEXITSTATUS(st)
+        os.write(resfd, pickle.dumps(status, pickle.HIGHEST_PROTOCOL))
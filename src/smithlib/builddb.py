@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+''' sqlite build database '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+from waflib import Build, Context, Logs, Node
+import io, os, pickle, threading
+
+try :
+    import sqlite3
+except ImportError :
+    sqlite3 = None
+
+# The build database (Context.SQLDBFILE in the build directory) replaces the
+# pickle of Build.SAVED_ATTRS. Rather than the whole node tree it holds just
+# the signatures of nodes in the build directory, keyed by their path from it.
+# The other saved attributes are each a table of pickled keys and values that
+# is read a key at a time as the build asks for them, and only the keys that
+# changed are written back. Nodes inside values are stored as their absolute
+# path. The database is in WAL mode so that other commands can read it while a
+# build writes. An existing pickle is migrated on first use and then removed.
+
+TABLES = [x for x in Build.SAVED_ATTRS if x != 'root']
+_missing = object()
+
+class Pickler(pickle.Pickler) :
+    def persistent_id(self, obj) :
+        if isinstance(obj, Node.Node) :
+            return obj.abspath()
+        return None
+
+class Unpickler(pickle.Unpickler) :
+    def __init__(self, f, root) :
+        pickle.Unpickler.__init__(self, f)
+        self.root = root
+
+    def persistent_load(self, pid) :
+        return self.root.make_node([x for x in Node.split_path(pid) if x])
+
+def dumps(obj) :
+    f = io.BytesIO()
+    Pickler(f, pickle.HIGHEST_PROTOCOL).dump(obj)
+    return f.getvalue()
+
+class LazyTable(dict) :
+    """ A dict that fetches missing keys from its table in the database and
+        remembers which keys have changed """
+
+    def __init__(self, db, name, data = None) :
+        dict.__init__(self)
+        self.db = db
+        self.name = name
+        self.changed = set()
+        self.complete = False
+        if data :
+            for k, v in data.items() :
+                self[k] = v
+
+    def _fetch(self, key) :
+        v = self.db.fetch(self.name, key)
+        if v is _missing :
+            return _missing
+        return dict.setdefault(self, key, v)
+
+    def __missing__(self, key) :
+        v = _missing if self.complete else self._fetch(key)
+        if v is _missing :
+            raise KeyError(key)
+        return v
+
+    def get(self, key, default = None) :
+        try :
+            return self[key]
+        except KeyError :
+            return default
+
+    def __contains__(self, key) :
+        return self.get(key, _missing) is not _missing
+
+    def __setitem__(self, key, value) :
+        dict.__setitem__(self, key, value)
+        self.changed.add(key)
+
+    def __delitem__(self, key) :
+        self[key]       # raises KeyError if it is nowhere
+        dict.__delitem__(self, key)
+        self.changed.add(key)
+
+    # dict's own versions of these don't go through the methods above, so
+    # would miss the database and leave changes unrecorded
+
+    def pop(self, key, *default) :
+        try :
+            v = self[key]
+        except KeyError :
+            if default :
+                return default[0]
+            raise
+        del self[key]
+        return v
+
+    def popitem(self) :
+        self.load_all()
+        k, v = dict.popitem(self)
+        self.changed.add(k)
+        return (k, v)
+
+    def setdefault(self, key, default = None) :
+        v = self.get(key, _missing)
+        if v is _missing :
+            self[key] = v = default
+        return v
+
+    def update(self, *args, **kw) :
+        for k, v in dict(*args, **kw).items() :
+            self[k] = v
+
+    def clear(self) :
+        self.load_all()
+        self.changed.update(dict.keys(self))
+        dict.clear(self)
+
+    def load_all(self) :
+        if self.complete : return
+        for k, v in self.db.fetch_all(self.name) :
+            if k not in self.changed :
+                dict.setdefault(self, k, v)
+        self.complete = True
+
+    def keys(self) :
+        self.load_all()
+        return dict.keys(self)
+
+    def values(self) :
+        self.load_all()
+        return dict.values(self)
+
+    def items(self) :
+        self.load_all()
+        return dict.items(self)
+
+    def __iter__(self) :
+        self.load_all()
+        return dict.__iter__(self)
+
+    def __len__(self) :
+        self.load_all()
+        return dict.__len__(self)
+
+class BuildDB(object) :
+
+    def __init__(self, bld, path) :
+        self.bld = bld
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout = 60, check_same_thread = False, isolation_level = None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS nodes (path TEXT PRIMARY KEY, sig BLOB)")
+        for t in TABLES :
+            self.conn.execute("CREATE TABLE IF NOT EXISTS %s (key BLOB PRIMARY KEY, value BLOB)" % t)
+        self.nodesigs = {}
+
+    def unpickle(self, data) :
+        return Unpickler(io.BytesIO(data), self.bld.root).load()
+
+    def fetch(self, table, key) :
+        with self.lock :
+            row = self.conn.execute("SELECT value FROM %s WHERE key=?" % table, (dumps(key),)).fetchone()
+            if row is None :
+                return _missing
+            return self.unpickle(row[0])
+
+    def fetch_all(self, table) :
+        with self.lock :
+            rows = self.conn.execute("SELECT key, value FROM %s" % table).fetchall()
+            return [(self.unpickle(k), self.unpickle(v)) for k, v in rows]
+
+    def load_nodes(self) :
+        """ Give the build directory nodes their stored signatures """
+        bldnode = self.bld.bldnode
+        with self.lock :
+            rows = self.conn.execute("SELECT path, sig FROM nodes").fetchall()
+        for path, sig in rows :
+            n = bldnode.make_node(path.split('/'))
+            n.sig = sig
+            self.nodesigs[path] = sig
+
+    def node_sigs(self) :
+        """ Returns {path from the build dir: sig} of nodes in the build dir """
+        res = {}
+        stack = [(self.bld.bldnode, '')]
+        while stack :
+            n, p = stack.pop()
+            for k, c in getattr(n, 'children', {}).items() :
+                cp = p + '/' + k if p else k
+                sig = getattr(c, 'sig', None)
+                if sig is not None :
+                    res[cp] = sig
+                stack.append((c, cp))
+        return res
+
+    def attach(self, migrate = False) :
+        """ Install lazy tables for the saved attributes. If migrate, the
+            attributes already hold everything, loaded from the pickle """
+        if migrate :
+            for t in TABLES :
+                d = getattr(self.bld, t, {})
+                setattr(self.bld, t, LazyTable(self, t, d))
+                getattr(self.bld, t).complete = True
+            with self.lock :
+                for t in TABLES + ['nodes'] :
+                    self.conn.execute("DELETE FROM %s" % t)
+        else :
+            self.load_nodes()
+            for t in TABLES :
+                setattr(self.bld, t, LazyTable(self, t))
+
+    def store(self) :
+        """ Write back what has changed """
+        writes = {}
+        replace = set()
+        for t in TABLES :
+            d = getattr(self.bld, t, {})
+            if isinstance(d, LazyTable) and d.db is self :
+                writes[t] = [(k, dict.get(d, k, _missing)) for k in d.changed]
+            else :
+                # the attribute was replaced, e.g. by clean()
+                replace.add(t)
+                writes[t] = list(d.items())
+        sigs = self.node_sigs()
+        nodewrites = [(k, v) for k, v in sigs.items() if self.nodesigs.get(k) != v]
+        nodedels = [k for k in self.nodesigs if k not in sigs]
+        with self.lock :
+            c = self.conn
+            c.execute("BEGIN IMMEDIATE")
+            try :
+                for t in TABLES :
+                    if t in replace :
+                        c.execute("DELETE FROM %s" % t)
+                    for k, v in writes[t] :
+                        if v is _missing :
+                            c.execute("DELETE FROM %s WHERE key=?" % t, (dumps(k),))
+                        else :
+                            c.execute("INSERT OR REPLACE INTO %s (key, value) VALUES (?, ?)" % t, (dumps(k), dumps(v)))
+                c.executemany("DELETE FROM nodes WHERE path=?", [(k,) for k in nodedels])
+                c.executemany("INSERT OR REPLACE INTO nodes (path, sig) VALUES (?, ?)", nodewrites)
+                c.execute("COMMIT")
+            except Exception :
+                c.execute("ROLLBACK")
+                raise
+        for t in TABLES :
+            d = getattr(self.bld, t)
+            if isinstance(d, LazyTable) :
+                d.changed = set()
+        self.nodesigs = sigs
+        Logs.debug('builddb: wrote %d values and %d node signatures' % (sum(len(v) for v in writes.values()), len(nodewrites)))
+
+    def close(self) :
+        with self.lock :
+            self.conn.close()
+
+def add_builddb() :
+    """ Keep the build data in sqlite rather than a pickle """
+    if sqlite3 is None :
+        return
+    old_restore = Build.BuildContext.restore
+    old_store = Build.BuildContext.store
+
+    def restore(bld) :
+        picklefile = os.path.join(bld.variant_dir, Context.DBFILE)
+        dbfile = os.path.join(bld.variant_dir, Context.SQLDBFILE)
+        # a pickle newer than the database was written by an older smith
+        migrate = os.path.exists(picklefile) and (not os.path.exists(dbfile)
+                    or os.path.getmtime(picklefile) > os.path.getmtime(dbfile))
+        if not migrate and os.path.exists(picklefile) :
+            os.remove(picklefile)
+        old_restore(bld)            # loads the pickle if there is one
+        if not os.path.isdir(bld.variant_dir) :
+            return                  # nothing built yet, and nowhere to store anything
+        try :
+            bld.builddb = BuildDB(bld, dbfile)
+            bld.builddb.attach(migrate)
+        except sqlite3.Error as e :
+            Logs.warn("Could not open the build database %s: %s" % (dbfile, e))
+            bld.builddb = None
+        if migrate and bld.builddb is not None :
+            Logs.info("Migrating %s to %s" % (Context.DBFILE, Context.SQLDBFILE))
+            store(bld)
+
+    def store(bld) :
+        db = getattr(bld, 'builddb', None)
+        if db is None :
+            return old_store(bld)
+        db.store()
+        picklefile = os.path.join(bld.variant_dir, Context.DBFILE)
+        if os.path.exists(picklefile) :
+            os.remove(picklefile)
+
+    Build.BuildContext.restore = restore
+    Build.BuildContext.store = store
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+''' Content addressed build cache '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+from waflib import Task, Logs, Options, Utils
+import os, json, hashlib, shutil, tempfile, threading
+
+# The cache directory (WAFCACHE) holds:
+#   blobs/xx/<sha256>       file contents, stored once however many tasks produce them
+#   manifests/<uid><sig>    json list of the blobs a task produced, in output order
+#   stats.json              cumulative hit/miss counts per task name
+# A task may be retrieved from the cache if a manifest exists for its uid and
+# signature and all the blobs it refers to are present. modify() tasks have no
+# outputs, instead they rewrite their tempcopy target in place. That target is
+# treated as the output of the task so that each step in a chain is cached
+# against its own signature.
+
+defaultsize = 5 * 1024 * 1024 * 1024
+_caches = {}
+_cachelock = threading.Lock()
+
+def parse_size(s) :
+    """ Convert a size such as 500M or 10G into a number of bytes """
+    if not s : return defaultsize
+    s = str(s).strip().upper()
+    mult = 1
+    for i, c in enumerate("KMGT") :
+        if s.endswith(c) or s.endswith(c + "B") :
+            mult = 1024 ** (i + 1)
+            s = s[:s.index(c)]
+            break
+    try :
+        return int(float(s) * mult)
+    except ValueError :
+        Logs.warn("Can't parse cache size %s, using the default" % s)
+        return defaultsize
+
+def task_name(task) :
+    return getattr(task.generator, 'name', None) or task.__class__.__name__
+
+def cache_nodes(task) :
+    """ Returns the nodes whose contents make up the results of a task """
+    res = list(getattr(task, 'outputs', []))
+    tempcopy = getattr(task, 'tempcopy', None)
+    if tempcopy :
+        outnode = tempcopy[1].get_bld()
+        if outnode not in res :
+            res.append(outnode)
+    return res
+
+class BuildCache(object) :
+
+    def __init__(self, root, maxsize = defaultsize) :
+        self.root = root
+        self.maxsize = maxsize
+        self.blobdir = os.path.join(root, 'blobs')
+        self.mandir = os.path.join(root, 'manifests')
+        self.tmpdir = os.path.join(root, 'tmp')
+        for d in (self.blobdir, self.mandir, self.tmpdir) :
+            if not os.path.exists(d) :
+                os.makedirs(d)
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.stored = 0
+
+    def blobpath(self, h) :
+        return os.path.join(self.blobdir, h[:2], h)
+
+    def manifestpath(self, task) :
+        return os.path.join(self.mandir, Utils.to_hex(task.uid()) + Utils.to_hex(task.signature()))
+
+    def count(self, task, hit) :
+        name = task_name(task)
+        with self.lock :
+            s = self.stats.setdefault(name, [0, 0])
+            s[0 if hit else 1] += 1
+
+    def _tempfile(self) :
+        fd, path = tempfile.mkstemp(dir=self.tmpdir)
+        os.close(fd)
+        return path
+
+    def put_blob(self, path) :
+        """ Store the contents of path, returning its hash """
+        m = hashlib.sha256()
+        with open(path, 'rb') as f :
+            while True :
+                dat = f.read(1 << 20)
+                if not dat : break
+                m.update(dat)
+        h = m.hexdigest()
+        dest = self.blobpath(h)
+        if os.path.exists(dest) :
+            os.utime(dest, None)
+            return h
+        tmp = self._tempfile()
+        try :
+            shutil.copyfile(path, tmp)
+            if not os.path.exists(os.path.dirname(dest)) :
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+            os.replace(tmp, dest)
+        except OSError :
+            if os.path.exists(tmp) : os.remove(tmp)
+            raise
+        return h
+
+    def retrieve(self, task) :
+        """ Copy the results of a task out of the cache. Returns True on success """
+        nodes = cache_nodes(task)
+        if not nodes : return None
+        try :
+            with open(self.manifestpath(task)) as f :
+                manifest = json.load(f)
+        except (OSError, ValueError) :
+            self.count(task, False)
+            return None
+        entries = manifest.get('outputs', [])
+        if len(entries) != len(nodes) or any(not os.path.exists(self.blobpath(e['hash'])) for e in entries) :
+            self.count(task, False)
+            return None
+        try :
+            for n, e in zip(nodes, entries) :
+                blob = self.blobpath(e['hash'])
+                dest = n.abspath()
+                tmp = dest + '.smithcache'
+                shutil.copyfile(blob, tmp)
+                os.chmod(tmp, e.get('mode', 0o644))
+                os.replace(tmp, dest)
+                os.utime(blob, None)        # keep it recently used
+        except OSError as e :
+            Logs.debug('cache: failed retrieving %r: %s' % (task, e))
+            self.count(task, False)
+            return None
+        self.count(task, True)
+        return True
+
+    def store(self, task) :
+        """ Add the results of a task to the cache """
+        nodes = cache_nodes(task)
+        if not nodes : return None
+        entries = []
+        try :
+            for n in nodes :
+                path = n.abspath()
+                entries.append({'name' : n.name, 'hash' : self.put_blob(path),
+                                'mode' : os.stat(path).st_mode & 0o777})
+            tmp = self._tempfile()
+            with open(tmp, 'w') as f :
+                json.dump({'task' : task_name(task), 'outputs' : entries}, f)
+            os.replace(tmp, self.manifestpath(task))
+        except OSError as e :
+            Logs.debug('cache: failed storing %r: %s' % (task, e))
+            return None
+        with self.lock :
+            self.stored += 1
+        return True
+
+    def trim(self) :
+        """ Remove the least recently used blobs until the cache fits in maxsize """
+        blobs = []
+        total = 0
+        for dp, ds, fs in os.walk(self.blobdir) :
+            for f in fs :
+                p = os.path.join(dp, f)
+                try :
+                    st = os.stat(p)
+                except OSError :
+                    continue
+                blobs.append((st.st_mtime, st.st_size, p))
+                total += st.st_size
+        if total <= self.maxsize : return 0
+        blobs.sort()
+        removed = set()
+        limit = self.maxsize * 0.9      # leave some headroom for the next build
+        for mtime, size, p in blobs :
+            if total <= limit : break
+            try :
+                os.remove(p)
+            except OSError :
+                continue
+            total -= size
+            removed.add(os.path.basename(p))
+        for f in os.listdir(self.mandir) :
+            p = os.path.join(self.mandir, f)
+            try :
+                with open(p) as fh :
+                    hashes = [e['hash'] for e in json.load(fh).get('outputs', [])]
+            except (OSError, ValueError) :
+                hashes = None
+            if hashes is None or any(h in removed for h in hashes) :
+                try : os.remove(p)
+                except OSError : pass
+        Logs.debug('cache: evicted %d blobs' % len(removed))
+        return len(removed)
+
+    def save_stats(self) :
+        """ Merge this session's statistics into the cumulative ones """
+        path = os.path.join(self.root, 'stats.json')
+        try :
+            with open(path) as f :
+                allstats = json.load(f)
+        except (OSError, ValueError) :
+            allstats = {}
+        with self.lock :
+            for k, v in self.stats.items() :
+                s = allstats.setdefault(k, [0, 0])
+                s[0] += v[0]
+                s[1] += v[1]
+        tmp = self._tempfile()
+        with open(tmp, 'w') as f :
+            json.dump(allstats, f, indent=1, sort_keys=True)
+        os.replace(tmp, path)
+
+    def report(self) :
+        hits = sum(v[0] for v in self.stats.values())
+        misses = sum(v[1] for v in self.stats.values())
+        if hits or misses or self.stored :
+            Logs.info("cache: %d hits, %d misses, %d stored" % (hits, misses, self.stored))
+        for k in sorted(self.stats.keys()) :
+            Logs.debug("cache: %s %d hits %d misses" % (k, self.stats[k][0], self.stats[k][1]))
+
+    def finish(self) :
+        self.report()
+        try :
+            self.save_stats()
+            self.trim()
+        except OSError as e :
+            Logs.warn("Failed to update the build cache: %s" % e)
+        self.stats = {}
+        self.stored = 0
+
+def get_cache(bld) :
+    """ Returns the BuildCache for a build context, or None if caching is off """
+    if not bld.cache_global or bld.nocache :
+        return None
+    root = os.path.abspath(bld.cache_global)
+    with _cachelock :
+        if root not in _caches :
+            _caches[root] = BuildCache(root, parse_size(getattr(Options.options, 'cachesize', None)))
+        return _caches[root]
+
+def finish_cache(bld) :
+    """ Report on and trim the cache once a build is done """
+    c = get_cache(bld)
+    if c is not None : c.finish()
+
+def add_build_cache() :
+    """ Replace the waf whole file cache with the content addressed cache """
+
+    def can_retrieve_cache(self) :
+        if getattr(self, 'cache_missed', False) : return None
+        c = get_cache(self.generator.bld)
+        if c is None or c.retrieve(self) is None :
+            self.cache_missed = True
+            return None
+        sig = self.signature()
+        for node in self.outputs :
+            node.sig = sig
+            if self.generator.bld.progress_bar < 1 :
+                self.generator.bld.to_log('restoring from cache %r\n' % node.abspath())
+        self.cached = True
+        return True
+
+    def put_files_cache(self) :
+        # post_run may be wrapped more than once in derived task classes
+        if getattr(self, 'cached', None) : return None
+        c = get_cache(self.generator.bld)
+        if c is not None and c.store(self) :
+            self.cached = True
+
+    Task.Task.can_retrieve_cache = can_retrieve_cache
+    Task.Task.put_files_cache = put_files_cache
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+''' Copying files without running cp '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+from waflib import Logs
+import os, shutil, errno
+
+try :
+    import fcntl
+except ImportError :
+    fcntl = None
+
+# Many tasks do nothing but copy a file, and each modify() step copies the
+# font it changes. Rather than run cp for each, copy_rule and link_rule are
+# task rules that copy in process. copy_file() clones the file (a reflink,
+# sharing the data until either copy is changed) where the filesystem can,
+# and otherwise copies it with the fastest means the platform offers.
+# link_file() hard links, for copies that nothing writes to, falling back
+# to copy_file(). Devices that can't clone are remembered so that we don't
+# keep trying.
+
+FICLONE = 0x40049409        # _IOW(0x94, 9, int) from linux/fs.h
+
+_noclone = set()
+
+def clone_file(src, dst) :
+    """ Reflinks dst to src. Returns False if the filesystem can't """
+    if fcntl is None or not hasattr(fcntl, 'ioctl') :
+        return False
+    dev = os.stat(src).st_dev
+    if dev in _noclone :
+        return False
+    try :
+        with open(src, 'rb') as s, open(dst, 'wb') as d :
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        return True
+    except OSError as e :
+        if e.errno in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.EXDEV, errno.ENOSYS, errno.EPERM) :
+            if e.errno != errno.EXDEV :
+                _noclone.add(dev)
+            try :
+                os.remove(dst)
+            except OSError :
+                pass
+            return False
+        raise
+
+def copy_file(src, dst) :
+    """ Copies src to dst, replacing any dst """
+    if os.path.lexists(dst) :
+        os.remove(dst)
+    if not clone_file(src, dst) :
+        shutil.copyfile(src, dst)
+        shutil.copymode(src, dst)
+
+def link_file(src, dst) :
+    """ Hard links dst to src, replacing any dst, or copies if we can't """
+    if os.path.lexists(dst) :
+        os.remove(dst)
+    try :
+        os.link(src, dst)
+    except OSError :
+        Logs.debug("fastcopy: copying %s" % dst)
+        copy_file(src, dst)
+
+def copy_rule(task) :
+    """ Task rule to copy the input to the output """
+    copy_file(task.inputs[0].abspath(), task.outputs[0].abspath())
+    return 0
+
+def link_rule(task) :
+    """ Task rule to link the output to the input, for outputs that are only read """
+    link_file(task.inputs[0].abspath(), task.outputs[0].abspath())
+    return 0
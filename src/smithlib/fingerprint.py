@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+''' Whole project fingerprint for skipping unchanged builds '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+from waflib import Context, Logs, Scripting, Utils
+import os, sys, shlex, time
+
+FPFILE = '.smithfingerprint-%d' % Context.ABI
+
+# After a successful plain 'smith build' we record two digests: one of
+# everything that could change what the build does (command line, environment,
+# the smith and waf sources, and the stat of every file in the project tree
+# including the wscripts and git state) taken before the build started, and one
+# of the stat of every file in the build directory afterwards. If the next
+# 'smith build' finds both unchanged it stops before even loading the wscript.
+# Any other command, or a build that fails, removes the fingerprint.
+
+volatile_env = ('PWD', 'OLDPWD', 'SHLVL', '_', 'COLUMNS', 'LINES', 'TERM',
+                'SSH_CLIENT', 'SSH_CONNECTION', 'SSH_TTY', 'WINDOWID', 'TMUX_PANE')
+skipdirs = ('.git', '.hg', '.svn', '__pycache__')
+SETTLE = 2          # seconds a file must be unchanged to be trusted
+
+_pending = None
+
+def fpfile() :
+    return os.path.join(Context.out_dir, FPFILE)
+
+def commands() :
+    """ The non option arguments, which are only certainly commands if the
+        options used take no separate values """
+    args = sys.argv[1:]
+    extra = os.getenv('SMITHARGS')
+    if extra is not None :
+        args = args + shlex.split(extra)
+    return [a for a in args if not a.startswith('-')]
+
+def is_plain_build() :
+    return commands() in ([], ['build']) and '--nofingerprint' not in sys.argv
+
+def walk(m, top, exclude = (), prefix = '') :
+    """ Add the stat of every file under top to m. Returns the newest mtime """
+    newest = 0
+    try :
+        entries = sorted(os.scandir(top), key=lambda e: e.name)
+    except OSError :
+        return newest
+    for e in entries :
+        p = e.path
+        if e.name in skipdirs or p in exclude or (prefix and e.name.startswith(prefix)) :
+            continue
+        try :
+            if e.is_dir(follow_symlinks=False) :
+                m.update(("d" + e.name + "\0").encode("utf-8", "surrogateescape"))
+                newest = max(newest, walk(m, p, exclude, prefix))
+                m.update(b"\1")
+                continue
+            st = e.stat()
+        except OSError :
+            continue
+        m.update(("%s\0%d\0%d\0%d\0" % (e.name, st.st_ino, st.st_mtime_ns, st.st_size)).encode("utf-8", "surrogateescape"))
+        newest = max(newest, st.st_mtime_ns)
+    return newest
+
+def add_file(m, path) :
+    try :
+        with open(path, 'rb') as f :
+            m.update(f.read())
+    except OSError :
+        pass
+    m.update(b"\0")
+
+def git_state(m, top) :
+    """ The checked out commit and the index, which the version strings depend on """
+    gitdir = os.path.join(top, '.git')
+    if not os.path.isdir(gitdir) : return
+    head = os.path.join(gitdir, 'HEAD')
+    add_file(m, head)
+    try :
+        with open(head) as f :
+            ref = f.read().strip()
+    except OSError :
+        ref = ''
+    if ref.startswith('ref:') :
+        add_file(m, os.path.join(gitdir, ref[4:].strip()))
+    add_file(m, os.path.join(gitdir, 'packed-refs'))
+    try :
+        st = os.stat(os.path.join(gitdir, 'index'))
+        m.update(("%d\0%d\0" % (st.st_mtime_ns, st.st_size)).encode("utf-8"))
+    except OSError :
+        pass
+
+def inputs_digest() :
+    """ Returns (digest, newest mtime) of everything a build depends on """
+    m = Utils.md5()
+    m.update(repr(sys.argv[1:]).encode("utf-8"))
+    m.update(repr(sorted((k, v) for k, v in os.environ.items() if k not in volatile_env)).encode("utf-8", "surrogateescape"))
+    m.update(sys.version.encode("utf-8"))
+    smithdir = os.path.dirname(os.path.abspath(__file__))
+    walk(m, smithdir)
+    walk(m, os.path.join(os.path.dirname(smithdir), 'waflib'))
+    newest = walk(m, Context.top_dir, exclude = (os.path.abspath(Context.out_dir),))
+    git_state(m, Context.top_dir)
+    return (m.hexdigest(), newest)
+
+def outputs_digest() :
+    m = Utils.md5()
+    walk(m, Context.out_dir, exclude = (os.path.join(Context.out_dir, '.tmp'),), prefix = '.smith')
+    return m.hexdigest()
+
+def load() :
+    try :
+        with open(fpfile()) as f :
+            return f.read().split()
+    except OSError :
+        return None
+
+def remove() :
+    try :
+        os.remove(fpfile())
+    except OSError :
+        pass
+
+def check() :
+    """ Returns True if a plain build would do nothing. Otherwise prepares to
+        record the fingerprint if this is a plain build. """
+    global _pending
+    _pending = None
+    if not Context.out_dir or not os.path.isdir(Context.out_dir) :
+        return False
+    if not is_plain_build() :
+        remove()
+        return False
+    start = time.time()
+    old = load()
+    digest, newest = inputs_digest()
+    if old == [digest, outputs_digest()] :
+        Logs.debug('fingerprint: unchanged (%.3fs)' % (time.time() - start))
+        return True
+    remove()
+    # a file changed within the timestamp granularity might change again unseen
+    if newest < (start - SETTLE) * 1e9 :
+        _pending = digest
+    return False
+
+def save() :
+    global _pending
+    if _pending is None : return
+    try :
+        with open(fpfile() + '.tmp', 'w') as f :
+            f.write(_pending + "\n" + outputs_digest() + "\n")
+        os.replace(fpfile() + '.tmp', fpfile())
+    except OSError as e :
+        Logs.warn("Could not save the build fingerprint: %s" % e)
+    _pending = None
+
+def add_fingerprint() :
+    old_set_main_module = Scripting.set_main_module
+    old_run_command = Scripting.run_command
+
+    def set_main_module(file_path) :
+        if check() :
+            Logs.info("'build' finished successfully (nothing changed)")
+            sys.exit(0)
+        old_set_main_module(file_path)
+
+    def run_command(cmd_name) :
+        ctx = old_run_command(cmd_name)
+        if cmd_name == 'build' :
+            save()
+        return ctx
+
+    Scripting.set_main_module = set_main_module
+    Scripting.run_command = run_command
@@ -11,10 +11,13 @@ from waflib import Context, Logs
 from smithlib.wafplus import modify, ismodified, nulltask
 from smithlib.smith import get_all_sources, initobj, initval, defer, undeffered
 import smithlib.font_tests as font_tests
+from smithlib import varfont
+from smithlib.fastcopy import copy_rule
 import sys, os, re
 from random import randint
 
 progset = set()
+stampdir = "stamped"        # where fonts stamped with a late build label go
 
 class Font(object) :
     fonts = []
@@ -107,16 +110,20 @@ class Font(object) :
         tarname = None
         srcnode = bld.path.find_or_declare(self.source)
         parms = getattr(self, 'params', "")
-        if self.source.endswith(".ttf") :
+        if self.source.endswith(".ttf") and not parms :
+            bgen = bld(rule = copy_rule, source = srcnode, target = targetnode, name=self.target+"_ttf")
+        elif self.source.endswith(".ttf") :
             bgen = bld(rule = "${COPY} " + parms + " '${SRC}' '${TGT}'", source = srcnode, target = targetnode, name=self.target+"_ttf", shell=True)
         elif self.source.endswith(".ufo") and not hasattr(self, 'buildusingfontforge') :
             bgen = bld(rule = "${PSFUFO2TTF} -q " + parms + " '${SRC}' '${TGT}'", source = srcnode, target = targetnode, name=self.target+"_ttf", shell=True)
         elif self.source.endswith(".designspace") :
-            bgen = bld(rule = "${FONTMAKE} " + parms + " -o variable -m '${SRC}' --output-path '${TGT}'", source = srcnode, target = targetnode, name=self.target+"_ttf", shell=True)
+            bgen = varfont.build_masters(bld, self, srcnode, targetnode, parms) if getattr(self, 'buildmasters', False) else None
+            if bgen is None :
+                bgen = bld(rule = "${FONTMAKE} " + parms + " -o variable -m '${SRC}' --output-path '${TGT}'", source = srcnode, target = targetnode, name=self.target+"_ttf", shell=True)
         else :
             if getattr(self, "sfd_master", None) and self.sfd_master != self.source:
                 tarname = self.source + "_"
-                bld(rule = "${COPY} '${SRC}' '${TGT}'", source = srcnode, target = tarname, shell=True)
+                bld(rule = copy_rule, source = srcnode, target = tarname)
                 modify("${SFDMELD} ${SRC} ${DEP} ${TGT}", tarname, [self.sfd_master], path = basepath, before = self.target + "_sfd")
             bgen = bld(rule = "${FONTFORGE} " + parms + " -nosplash -quiet -lang=py -c 'import sys; f=open(sys.argv[1]); f.encoding=\"Original\"; f.generate(sys.argv[2])' ${SRC} ${TGT}", source = tarname or srcnode, target = self.target, name = self.target + "_ttf") # for old fontforges
             # bgen = bld(rule = "${FONTFORGE} -quiet -lang=ff -c 'Open($1); Generate($2)' ${SRC} ${TGT}", source = tarname or srcnode, target = self.target, name = self.target + "_sfd")
@@ -124,6 +131,13 @@ class Font(object) :
         if hasattr(self, 'version') :
             if isinstance(self.version, (list, tuple)) :
                 ttfsetverparms = "-n -d '" + self.version[1] + "' " + self.version[0]
+            elif self.package.buildversion != '' and getattr(self.package, 'latestamp', False) :
+                # the build label changes with every commit, so only the
+                # copy that is shipped gets it, after everything else
+                ttfsetverparms = str(self.version)
+                self.stamped = os.path.join(stampdir, self.target)
+                bld(rule = "${{TTFSETVER}} -n -d '{1}' {0} '${{SRC}}' '${{TGT}}'".format(str(self.version), self.package.buildversion),
+                    source = targetnode, target = self.stamped, name = self.target + "_stamp", shell = True)
             elif self.package.buildversion != '' :
                 ttfsetverparms = "-n -d '{1}' {0}".format(str(self.version), self.package.buildversion)
             else :
@@ -143,7 +157,7 @@ class Font(object) :
                 elif not hasattr(self.ap, 'isGenerated') and (hasattr(self, 'classes') or ismodified(self.ap, path = basepath)) :
                     origap = self.ap
                     self.ap = self.ap + ".smith"
-                    bld(rule="${COPY} '${SRC}' '${TGT}'", source = origap, target = self.ap, shell=True)
+                    bld(rule = copy_rule, source = origap, target = self.ap)
             # if hasattr(self, 'classes') :
             #     modify("${ADD_CLASSES} -c ${SRC} ${DEP} > ${TGT}", self.ap, [self.classes], shell = 1, path = basepath)
 
@@ -211,6 +225,8 @@ class DesignInstance(object):
         return get_all_sources(self, ctx, 'dspace')
 
     def build(self, bld, targetap):
+        if self.design.kw.get('instancebatch', False):
+            return self.design.build_instances(bld)
         # -o .tmp is a dummy so that the ../source in the base path to the designspace file removes the ..
         bld(rule="psfcreateinstances -q -l '{0}_createinstance.log' -o .tmp -i '{0}' {1} ${{SRC}}".format(self.name, self.params), source=self.dspace, target=self.target) 
 
@@ -395,7 +411,7 @@ class _Fea(Internal) :
                 else:
                     bld(rule = "${MAKEFEA} -q -o ${TGT} " + cmd + " ${SRC[" + str(ind) + "]}", shell = 1, source = srcs + [srctarget], target = self.source, deps = depends, name=font.target+"_fea")
                 if getattr(self, 'to_ufo', False) and font.source.lower().endswith('.ufo'):
-                    bld(rule = "${CP} ${SRC} ${TGT}", target = os.path.join(bld.path.find_or_declare(font.source).bldpath(), "features.fea"), source = self.source)
+                    bld(rule = copy_rule, target = os.path.join(bld.path.find_or_declare(font.source).bldpath(), "features.fea"), source = self.source)
             doit(self.source, keeps)
         elif self.master :
             doit(self.master, keeps)
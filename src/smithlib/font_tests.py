@@ -11,6 +11,11 @@ except NameError:
 
 from waflib import Context, Utils, Node, Errors, Logs, Options
 from smithlib import templates
+from smithlib.procpool import pool_rule
+from smithlib.tabledeps import shaping
+from smithlib import refshape, batchrun
+from smithlib.fontvariants import font_variant
+from smithlib.fastcopy import copy_rule
 import os, shutil, codecs, re
 from functools import partial
 from itertools import combinations
@@ -50,6 +55,57 @@ def node_from(n, oldp, newp, newext) :
     else : p += newext
     return newp.find_or_declare(p)
 
+def make_ftml(task) :
+    temps = templates.FtmlTestCommand
+    ftmldat = unicode(temps['head'])
+    testf = codecs.open(task.inputs[0].abspath(), encoding='utf-8')
+    count = 1
+    for l in testf.readlines() :
+        ftmldat += unicode(temps['content']).format(count, l.strip())
+        count += 1
+    testf.close()
+    ftmldat += temps['tail']
+    ftest = codecs.open(task.outputs[0].abspath(), "w", encoding="utf-8")
+    ftest.write(ftmldat)
+    ftest.close()
+    return 0
+
+def make_tex(mf, target, size, task) :
+    texdat = templates.TexTestCommand['txt'].format(target, mf, texprotect(target),
+                texprotect(mf), time.strftime("%H:%M %a %d %b %Y %Z"),
+                texprotect(task.inputs[0].bldpath()), task.inputs[0].bldpath(), size)
+    task.outputs[0].write(texdat)
+    return 0
+
+def make_from_htex(mf, font, task) :
+    texdat = templates.TexTestCommand['htex'].format(font, mf, task.inputs[0].bldpath())
+    task.outputs[0].write(texdat)
+    return 0
+
+def make_waterfall(mf, target, featstr, sizes, sizefactor, text, task) :
+    temps = templates.Waterfall
+    texdat = unicode(temps['head']).format(texprotect(target), texprotect(mf), texprotect(featstr), time.strftime("%H:%M %a %d %b %Y %Z"))
+
+    for s in sizes :
+        texdat += unicode(temps['content']).format(target, mf, featstr, s, s * sizefactor, text)
+    texdat += temps['tail']
+    ftest = codecs.open(task.outputs[0].abspath(), "w", encoding="utf-8")
+    ftest.write(texdat)
+    ftest.close()
+    return 0
+
+def make_crossfont(mf, targets, featstr, size, text, task) :
+    temps = templates.CrossFont
+    texdat = unicode(temps['head']).format(texprotect(mf), texprotect(featstr), time.strftime("%H:%M %a %d %b %Y %Z"))
+
+    for t in targets :
+        texdat += unicode(temps['content']).format(t, mf, featstr, size, texprotect(t), text)
+    texdat += temps['tail']
+    ftest = codecs.open(task.outputs[0].abspath(), "w", encoding="utf-8")
+    ftest.write(texdat)
+    ftest.close()
+    return 0
+
 def initdefaults(self, ctx, **info) :
     for k, v in info.items() :
         if not hasattr(self, k) :
@@ -116,10 +172,10 @@ class FontTests(object) :
         self.addTestCmd('pdfs', type='TeX')
         self.addTestCmd('waterfall', type='Waterfall')
         self.addTestCmd('xfont', type='CrossFont')
-        self.addTestCmd('xtest', shapers=2, extracmds=['cmptxtrender'],
+        self.addTestCmd('xtest', shapers=2, extracmds=['cmptxtrender'], tables=shaping,
                 cmd='${CMPTXTRENDER} -p -k -e ${shaper} -s "${script}" -l "${lang}" -e ${altshaper} -s "${altscript}" -L ${shaper} -L ${altshaper}'
                     ' -t "${SRC[0]}" -o "${TGT}" --copy=fonts --strip -g ../source/glyph_data.csv "${SRC[1]}" "${SRC[1]}"')
-        self.addTestCmd('test', usestandards=True, extracmds=['cmptxtrender'], shapers=1,
+        self.addTestCmd('test', usestandards=True, extracmds=['cmptxtrender'], shapers=1, tables=shaping,
                 cmd='${CMPTXTRENDER} -p -k -e ${shaper} -e ${shaper} -s "${script}" -l "${lang}" -t "${SRC[0]}" -L reference'
                     ' -L result -o "${TGT}" --copy fonts_${shaper} --strip -g ../source/glyph_data.csv "${SRC[2]}" "${SRC[1]}"')
         self.addTestCmd('ftml', type='FTML')
@@ -286,6 +342,7 @@ class TestCommand(object) :
         self._fonts = []
         self._filesLoaded = False
         self._srcsSet = False
+        self._origins = {}      # intermediate node: the test file it came from
         self._fontTests = fontTests
 
     def getFontGroup(self, name, font, once = False) :
@@ -411,7 +468,7 @@ class TestCommand(object) :
                     for f in files :
                         s = self.build_intermediate(ctx, f, t, resultsnode)
                         if s is not None :
-                            s.origin = f
+                            self._origins[s] = f
                             srcs.append(s)
                     t.setSrcs(srcs)
             else :
@@ -419,7 +476,7 @@ class TestCommand(object) :
                 for f in files :
                     s = self.build_intermediate(ctx, f, None, resultsnode)
                     if s is not None :
-                        s.origin = f
+                        self._origins[s] = f
                         srcs.append(s)
                 for t in self._tests :
                     t.setSrcs(srcs)
@@ -432,7 +489,7 @@ class TestCommand(object) :
         for t in self._tests :
             if not getattr(t._font, 'no_test', False):
                 if t._font not in perfont : perfont[t._font] = {}
-                perfont[t._font][t] = {(k.origin if k is not None else ""): v for k,v in self.build_test(ctx, t, resultsnode, resultsroot,
+                perfont[t._font][t] = {(self._origins[k] if k is not None else ""): v for k,v in self.build_test(ctx, t, resultsnode, resultsroot,
                                                                               optional=optional).items()}
         res = ""
         temps = templates.TestCommand
@@ -485,12 +542,25 @@ class TestCommand(object) :
         results = {}
         # srcs = test._srcs if len(test._srcs) else [None]
         srcs = test._srcs if len(test._srcs) else []
+        self._batch = []
         for s in srcs :
             res = self.do_build(ctx, s, test, targetdir, optional=optional)
             if res is not None :
                 results[s] = tostr(res)
+        if len(self._batch) :
+            self.build_batch(ctx, test, self._batch)
         return results
 
+    def build_batch(self, ctx, test, items) :
+        """ Creates tasks that each run cmd for some of the (sources, target) items,
+            as many tasks as jobs that can run at once """
+        fonts = test.kw.get('font', [])
+        fonts = fonts if test.kw.get('multifonts', False) or isinstance(fonts, list) else [fonts]
+        n = max(1, min(ctx.jobs, len(items)))
+        for i in range(n) :
+            ctx(features = 'cmdbatch', batchrule = self.cmd.parse(ctx, test.kw), items = items[i::n],
+                taskgens = [x.target+"_final" for x in fonts if hasattr(x, 'target')], **test.kw)
+
     def do_build(self, ctx, srcnode, test, targetdir, optional=False) :
         """ Does the actual taskgen creation for running a particular test. This method is intended to be subclassed """
         if srcnode is None:
@@ -515,6 +585,16 @@ class TestCommand(object) :
                     Logs.error("Cannot find corresponding reference to {} in references dir {}/".format(f.target, stddir))
                     raise Errors.BuildError()
                 srcs.append(t)
+            if test.kw.get('refcache', False) and test.kw.get('shaper', None) == 'ot' and refshape.hb is not None \
+                    and srcnode is not None and len(fonts) == 1 :
+                ctx(rule = pool_rule(refshape.compare, os.path.join(ctx.bldnode.abspath(), refshape.CACHEDIR),
+                                     test.kw.get('script', ''), test.kw.get('lang', ''), test.kw.get('featstr', '')),
+                    source = srcs, target = target, taskgens = [x.target+"_final" for x in fonts if hasattr(x, 'target')],
+                    tables = test.kw.get('tables', None), shaper = 'ot')
+                return target
+        if test.kw.get('batch', getattr(Options.options, 'batchtests', False)) :
+            self._batch.append((srcs, target))
+            return target
         gen = self.cmd.build(ctx, srcs, target, dep = fonts,
                              taskgens = [x.target+"_final" for x in fonts if hasattr(x, 'target')],
                              **test.kw)
@@ -549,21 +629,6 @@ class FtmlTestCommand(TestCommand) :
         super(FtmlTestCommand, self).__init__(_cmd, fontTests, **kw)
         self._xsls = []
 
-    def _make_ftml(self, task) :
-        temps = templates.FtmlTestCommand
-        ftmldat = unicode(temps['head'])
-        testf = codecs.open(task.inputs[0].abspath(), encoding='utf-8')
-        count = 1
-        for l in testf.readlines() :
-            ftmldat += unicode(temps['content']).format(count, l.strip())
-            count += 1
-        testf.close()
-        ftmldat += temps['tail']
-        ftest = codecs.open(task.outputs[0].abspath(), "w", encoding="utf-8")
-        ftest.write(ftmldat)
-        ftest.close()
-        return 0
-
     def build(self, ctx, resultsroot, optional=False, testfiles=None) :
         self.fmap = {}
         resultsnode = self.get_resultsnode(ctx)
@@ -572,17 +637,16 @@ class FtmlTestCommand(TestCommand) :
         targdisp = resultsnode.find_or_declare('displayftml.html')
         if not os.path.exists(targdisp.abspath()) :
             shutil.copy(os.path.join(os.path.dirname(__file__), "displayftml.html"), targdisp.abspath())
-        # go through fonts setting up cp or ttftable type contexts to get copies into the tests/ftml tree
+        # go through fonts getting copies, stripped for each shaper, into the tests/ftml tree
         for f in [x for x in self._fonts if not getattr(x, 'no_test', False)] :
             fname = str(f.target)
             if self.shapers == 0 :
-                target = fontresults.find_or_declare(fname)
-                ctx(rule="${CP} ${SRC} ${TGT}", source = f.target, target = target)
+                target = font_variant(ctx, f.target, fontresults.find_or_declare(fname))
                 self.fmap[str(f.target)] = {"" : target}
             elif self.shapers == 1 :
                 if hasattr(f, 'graphite') :
-                    target = fontresults.find_or_declare(fname.replace(".", "_gr.", 1))
-                    ctx(rule="${TTFTABLE} -d opentype ${SRC} ${TGT}", source = f.target, target = target)
+                    target = font_variant(ctx, f.target, fontresults.find_or_declare(fname.replace(".", "_gr.", 1)),
+                                          delete = 'opentype', tables = shaping['gr'])
                     if fname not in self.fmap : self.fmap[fname] = {}
                     self.fmap.setdefault(fname, {})['gr'] = target
                 if hasattr(f, 'opentype') and not getattr(f.opentype, 'no_test', False) :
@@ -591,9 +655,9 @@ class FtmlTestCommand(TestCommand) :
                     else :
                         scripts = [None]
                     for s in scripts :
-                        target = fontresults.find_or_declare(fname.replace(".", "_ot" + ("_"+s if s else "") + ".", 1))
                         rem = ",".join(x for x in scripts if x != s)
-                        ctx(rule="${{TTFTABLE}} -d graphite {} ${{SRC}} ${{TGT}}".format("-s " + rem if rem else ""), source=f.target, target=target)
+                        target = font_variant(ctx, f.target, fontresults.find_or_declare(fname.replace(".", "_ot" + ("_"+s if s else "") + ".", 1)),
+                                              delete = 'graphite', scripts = rem, tables = shaping['ot'])
                         self.fmap.setdefault(fname, {})['ot'+(s or "")] = target
         # go through copying all the xsl files as well, sigh
         xslresults = resultsnode.find_or_declare('xsl')
@@ -613,11 +677,11 @@ class FtmlTestCommand(TestCommand) :
         elif str(src).endswith(".ftml") or str(src).endswith('.xml') :
             return f.node
             targ = resultsnode.find_or_declare(src.name)
-            ctx(rule="${CP} ${SRC} ${TGT}", source=src, target=targ)
+            ctx(rule=copy_rule, source=src, target=targ)
         elif str(src).endswith(".txt") :
             targname = src.name.replace('.txt', '.ftml')
             targ = resultsnode.find_or_declare(targname)
-            ctx(rule = self._make_ftml, target = targ, source = src)
+            ctx(rule = pool_rule(make_ftml), target = targ, source = src)
         else :
             return None
         return targ
@@ -664,7 +728,7 @@ class FtmlTestCommand(TestCommand) :
                     else :
                         scripts = [""]
                     for s in scripts :
-                        self._tests.append(Test(allf, "{}_ot{}".format(kw['name'], ("_"+script if script else "")),
+                        self._tests.append(Test(allf, "{}_ot{}".format(kw['name'], ("_"+s if s else "")),
                                 script=s, shaper='ot', **kw))
 
     def addTest(self, font, label, **kw) :
@@ -690,17 +754,11 @@ class TexTestCommand(TestCommand) :
         if 'supports' not in kw : kw['supports'] = ['.txt', '.htex', '.htxt']
         super(TexTestCommand, self).__init__(_cmd, fontTests, **kw)
 
-    def _make_tex(self, mf, font, task) :
-        texdat = templates.TexTestCommand['txt'].format(font.target, mf, texprotect(font.target),
-                    texprotect(mf), time.strftime("%H:%M %a %d %b %Y %Z"),
-                    texprotect(task.inputs[0].bldpath()), task.inputs[0].bldpath(), self.size)
-        task.outputs[0].write(texdat)
-        return 0
+    def _make_tex(self, mf, font) :
+        return pool_rule(make_tex, mf, str(font.target), self.size)
 
-    def _make_from_htex(self, mf, font, task) :
-        texdat = templates.TexTestCommand['htex'].format(font, mf, task.inputs[0].bldpath())
-        task.outputs[0].write(texdat)
-        return 0
+    def _make_from_htex(self, mf, font) :
+        return pool_rule(make_from_htex, mf, str(font))
 
     def build_intermediate(self, ctx, f, test, resultsnode) :
         if f is None :
@@ -724,7 +782,7 @@ class TexTestCommand(TestCommand) :
         if len(mf) :
             attrs += ":" + "&".join(mf)
         targ = resultsnode.find_or_declare(targname)
-        ctx(rule = curry_fn(fn, attrs, test._font), target = targ, source = src)
+        ctx(rule = fn(attrs, test._font), target = targ, source = src)
         return targ
 
     def do_build(self, ctx, srcnode, test, targetdir, deps = None, optional=False) :
@@ -739,12 +797,31 @@ class TexTestCommand(TestCommand) :
                     deps.extend(f.opentype.get_sources(ctx))
                 else :
                     deps.extend(f.get_sources(ctx))
+                deps.append(str(f.target))
         target = srcnode.change_ext('.pdf')
+        if test.kw.get('batch', getattr(Options.options, 'batchtests', False)) :
+            # the fonts and their sources are inputs so that each item is signed by them
+            srcs = [srcnode] + [x for x in (ctx.path.find_resource(d) for d in deps) if x is not None]
+            self._texbatch.setdefault(test.kw.get('shaper', None), []).append((srcs, target, test.fid))
+            return target
         ctx(rule = '${XETEX} --interaction=batchmode --output-directory=./' + srcnode.bld_dir() + ' ./${SRC[0].bldpath()}',
                 source = [srcnode], target = target, deps = deps,
-                taskgens = [test.fid])
+                taskgens = [test.fid], tables = shaping, shaper = test.kw.get('shaper', None))
         return target
 
+    def build(self, ctx, resultsroot, optional=False, testfiles=None) :
+        self._texbatch = {}
+        res = super(TexTestCommand, self).build(ctx, resultsroot, optional=optional, testfiles=testfiles)
+        # batched documents from all the fonts, a few tasks for each shaper
+        for shaper, items in sorted(self._texbatch.items(), key=lambda x: str(x[0])) :
+            n = max(1, min(ctx.jobs, len(items)))
+            for i in range(n) :
+                part = items[i::n]
+                ctx(features = 'cmdbatch', batchclass = 'texbatch', items = [x[:2] for x in part],
+                    batchrule = '${XETEX} --interaction=batchmode --output-directory=./${SRC[0].bld_dir()} ./${SRC[0].bldpath()}',
+                    taskgens = sorted(set(x[2] for x in part)), tables = shaping, shaper = shaper)
+        return res
+
 @FontTests.aTestCommand
 class Waterfall(TexTestCommand) :
 
@@ -759,17 +836,8 @@ class Waterfall(TexTestCommand) :
         kw['notestfiles'] = 1
         super(Waterfall, self).__init__(_cmd, fontTests, **kw)
 
-    def _make_tex(self, mf, font, task) :
-        temps = templates.Waterfall
-        texdat = unicode(temps['head']).format(texprotect(font.target), texprotect(mf), texprotect(self.kw.get('featstr', '')), time.strftime("%H:%M %a %d %b %Y %Z"))
-
-        for s in self.sizes :
-            texdat += unicode(temps['content']).format(font.target, mf, self.kw.get('featstr', ''), s, s * self.sizefactor, self.text)
-        texdat += temps['tail']
-        ftest = codecs.open(task.outputs[0].abspath(), "w", encoding="utf-8")
-        ftest.write(texdat)
-        ftest.close()
-        return 0
+    def _make_tex(self, mf, font) :
+        return pool_rule(make_waterfall, mf, str(font.target), self.kw.get('featstr', ''), self.sizes, self.sizefactor, self.text)
 
     def build(self, ctx, resultsroot, optional=False, testfiles=None) :
         """ Main entry point to the test system """
@@ -802,15 +870,5 @@ class CrossFont(Waterfall) :
     def get_sources(self, ctx) :
         return []
 
-    def _make_tex(self, mf, font, task) :
-        temps = templates.CrossFont
-        featstr = self.kw.get('featstr', '')
-        texdat = unicode(temps['head']).format(texprotect(mf), texprotect(featstr), time.strftime("%H:%M %a %d %b %Y %Z"))
-
-        for f in font :
-            texdat += unicode(temps['content']).format(f.target, mf, featstr, self.size, texprotect(f.target), self.text)
-        texdat += temps['tail']
-        ftest = codecs.open(task.outputs[0].abspath(), "w", encoding="utf-8")
-        ftest.write(texdat)
-        ftest.close()
-        return 0
+    def _make_tex(self, mf, font) :
+        return pool_rule(make_crossfont, mf, [str(f.target) for f in font], self.kw.get('featstr', ''), self.size, self.text)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+''' A shared store of fonts with some tables or scripts stripped '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+from waflib import Task, Utils
+from waflib.TaskGen import feature, before
+from smithlib.modifiers import table_tags, read_sfnt, write_sfnt
+from smithlib.fastcopy import copy_file, link_file
+import os
+
+try :
+    from fontTools.ttLib import TTFont, newTable
+except ImportError :
+    TTFont = None
+
+# Tests that render with one shaper want a copy of the font without the
+# tables of the other, or without the OpenType scripts other than the one
+# being tested, as ttftable makes. Rather than a ttftable task for each such
+# copy, font_variant() adds the copy to a single task for the font, shared by
+# all the test commands. The task reads the font once and makes each variant
+# from its tables. Variants are kept in VARIANTDIR in the build directory,
+# keyed by the contents of the font and what is stripped, and hard linked to
+# where each test wants them, so unchanged variants are not made again.
+
+VARIANTDIR = '.smithvariants'
+
+def font_variant(ctx, font, target, delete = '', scripts = '', tables = None) :
+    """ Have target be a copy of the font (a path in the build directory)
+        without the tables or table groups in delete or the OpenType scripts
+        in scripts, both comma separated strings. The task depends on only
+        the tables of the font given in tables. """
+    try :
+        gens = ctx.fontvariants
+    except AttributeError :
+        gens = ctx.fontvariants = {}
+    font = str(font)
+    spec = (delete, scripts)
+    tg = gens.get(font, None)
+    if tg is None :
+        tg = gens[font] = ctx(features = 'fontvariants', font = font, variants = [], tablesets = [])
+    if any(v[1] == target for v in tg.variants) :
+        return target
+    tg.variants.append((spec, target))
+    tg.tablesets.append(tables)
+    return target
+
+class fontvariants(Task.Task) :
+    color = 'CYAN'
+    nocache = True
+
+    def cmdline(self, spec, target) :
+        """ The ttftable command to make the variant if we can't """
+        res = Utils.to_list(self.env.TTFTABLE)
+        if spec[0] :
+            res += ['-d', spec[0]]
+        if spec[1] :
+            res += ['-s', spec[1]]
+        return res + [self.inputs[0].abspath(), target]
+
+    def strip_scripts(self, font, tables, scripts) :
+        """ Returns tables with the given scripts removed from GSUB and GPOS """
+        res = dict(tables)
+        for tag in ('GSUB', 'GPOS') :
+            if tag not in tables :
+                continue
+            t = newTable(tag)
+            t.decompile(tables[tag], font)
+            if t.table.ScriptList is None :
+                continue
+            t.table.ScriptList.ScriptRecord = [r for r in t.table.ScriptList.ScriptRecord if r.ScriptTag not in scripts]
+            t.table.ScriptList.ScriptCount = len(t.table.ScriptList.ScriptRecord)
+            res[tag] = t.compile(font)
+        return res
+
+    def run(self) :
+        src = self.inputs[0].abspath()
+        storedir = os.path.join(self.generator.bld.bldnode.abspath(), VARIANTDIR)
+        os.makedirs(storedir, exist_ok = True)
+        fontsig = Utils.h_file(src)
+        base = self.inputs[0].bldpath().replace(os.sep, '_')
+        sfnt = None
+        font = None
+        keep = set()
+        for spec, target in self.generator.variants :
+            m = Utils.md5()
+            m.update(fontsig)
+            m.update(repr(spec).encode('utf-8'))
+            stored = os.path.join(storedir, "{}.{}".format(Utils.to_hex(m.digest()), base))
+            keep.add(os.path.basename(stored))
+            if not os.path.exists(stored) :
+                temp = "{}.{}".format(stored, os.getpid())
+                if sfnt is None and spec != ('', '') :
+                    sfnt = read_sfnt(src) or False
+                strip = table_tags(spec[0]) if spec[0] else ()
+                if spec == ('', '') :
+                    copy_file(src, temp)
+                elif sfnt and strip is not None and (not spec[1] or TTFont is not None) :
+                    tables = dict((k, v) for k, v in sfnt[1].items() if k not in strip)
+                    if spec[1] :
+                        if font is None :
+                            font = TTFont(src, lazy = True)
+                        tables = self.strip_scripts(font, tables, spec[1].split(','))
+                    write_sfnt(temp, sfnt[0], tables)
+                else :
+                    ret = self.exec_command(self.cmdline(spec, temp), cwd = self.generator.bld.variant_dir)
+                    if ret :
+                        return ret
+                os.replace(temp, stored)
+            link_file(stored, target.abspath())
+        # the variants of older versions of the font are no longer wanted
+        for f in os.listdir(storedir) :
+            key, _, name = f.partition(".")
+            if name == base and len(key) == 32 and f not in keep :
+                try :
+                    os.remove(os.path.join(storedir, f))
+                except OSError :
+                    pass
+        return 0
+
+@feature('fontvariants')
+@before('process_taskgens')
+def process_fontvariants(tg) :
+    # depend on the union of the tables each variant wants, or the whole font
+    if all(x is not None for x in tg.tablesets) :
+        tg.tables = sorted(set(t for x in tg.tablesets for t in x))
+    tg.create_task('fontvariants', tg.to_nodes([tg.font]), [x[1] for x in tg.variants])
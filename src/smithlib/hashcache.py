@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+''' Persistent stat keyed file hash cache '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+from waflib import Build, Context, Logs, Utils
+import os, pickle, threading, time
+
+HASHFILE = '.smithhashes-%d' % Context.ABI
+
+class HashCache(object) :
+    """ Maps a file path to the hash of its contents, keyed on the inode,
+        modification time and size of the file so that a file is only read
+        again when it changes. Directories (UFOs) hash the names and contents
+        of all the files in them. """
+
+    def __init__(self) :
+        self.entries = {}
+        self.used = set()
+        self.lock = threading.Lock()
+        self.dirty = False
+
+    def load(self, fname) :
+        try :
+            with open(fname, 'rb') as f :
+                data = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError) :
+            Logs.debug('hashcache: could not load %s' % fname)
+            return
+        with self.lock :
+            for k, v in data.items() :
+                self.entries.setdefault(k, v)
+
+    def save(self, fname, prefix) :
+        """ Write out the entries under prefix that are in use or still exist """
+        with self.lock :
+            items = list(self.entries.items())
+            used = set(self.used)
+        data = {}
+        for k, v in items :
+            if not k.startswith(prefix) : continue
+            if k in used or os.path.exists(k) :
+                data[k] = v
+        tmp = fname + '.tmp'
+        with open(tmp, 'wb') as f :
+            pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, fname)
+        self.dirty = False
+
+    def hash_file(self, path, st = None) :
+        if st is None : st = os.stat(path)
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        e = self.entries.get(path, None)
+        self.used.add(path)
+        if e is not None and e[:3] == key :
+            return e[3]
+        m = Utils.md5()
+        with open(path, 'rb') as f :
+            while True :
+                dat = f.read(1 << 20)
+                if not dat : break
+                m.update(dat)
+        res = m.digest()
+        # a file changed within the granularity of its timestamp may change again
+        # without its key changing, so only remember files that have settled
+        if st.st_mtime_ns < (time.time() - 2) * 1e9 :
+            with self.lock :
+                self.entries[path] = key + (res,)
+                self.dirty = True
+        return res
+
+    def hash_dir(self, path) :
+        m = Utils.md5()
+        for dp, ds, fs in os.walk(path) :
+            ds.sort()
+            rel = os.path.relpath(dp, path)
+            m.update(rel.encode("utf-8"))
+            for f in sorted(fs) :
+                p = os.path.join(dp, f)
+                try :
+                    st = os.stat(p)
+                except OSError :
+                    continue
+                m.update(f.encode("utf-8"))
+                m.update(self.hash_file(p, st))
+        return m.digest()
+
+    def h_file(self, filename) :
+        if os.path.isdir(filename) :
+            return self.hash_dir(filename)
+        return self.hash_file(filename)
+
+filehashes = HashCache()
+
+def h_file(filename) :
+    return filehashes.h_file(filename)
+
+def save_hashes(bld) :
+    """ Save the hash cache once a build is done, if it has changed """
+    if filehashes.dirty :
+        try :
+            filehashes.save(os.path.join(bld.variant_dir, HASHFILE), bld.srcnode.abspath() + os.sep)
+        except OSError as e :
+            Logs.warn("Could not save file hashes: %s" % e)
+
+def add_hash_cache() :
+    """ Use the hash cache for all file signatures and keep it alongside the
+        build database. """
+    Utils.h_file = h_file
+
+    old_restore = Build.BuildContext.restore
+
+    def restore(bld) :
+        old_restore(bld)
+        filehashes.load(os.path.join(bld.variant_dir, HASHFILE))
+
+    Build.BuildContext.restore = restore
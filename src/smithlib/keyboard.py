@@ -12,6 +12,7 @@ from .smith import get_all_sources
 from waflib import Errors
 import os, uuid, re
 from . import package
+from .fastcopy import copy_rule, link_rule
 
 class Keyboard(object) :
    
@@ -90,7 +91,7 @@ class Keyboard(object) :
         if self.target[-4:] != '.kmn' :
             raise Errors.WafError("The target is where you want to copy the source file. You have declared it to be %s which is not a .kmn file" % self.target)
        
-        bld(rule = "${CP} ${SRC} ${TGT}", source = self.source, target = self.target)
+        bld(rule = copy_rule, source = self.source, target = self.target)
         if bld.env['KMFLCOMP'] and not hasattr(self, 'nokmfl') :
             bld(rule = '${KMFLCOMP} ${SRC}', source = self.target, target = self.kmfl)
         if hasattr(self, 'kbdfont') and not getattr(self, 'nopdf', False): self.build_pdf(bld)
@@ -127,7 +128,7 @@ class Keyboard(object) :
         font = str(self.font)
         infont = font if os.path.isabs(font) else bld.bldnode.find_or_declare(font)
         bld(rule = '${KMN2XML} ' + args + ' ${SRC} > ${TGT}', shell = 1, source = self.source, target = xml)
-        bld(rule = '${CP} ${SRC} ${TGT}', source = infont, target = self.kbdfont)
+        bld(rule = link_rule, source = infont, target = self.kbdfont)
         bld(rule = '${KMNXML2SVG} -s ' + str(self.fontsize) + ' -f "' + self.fontname + '" ${SRC} ${TGT}', source = xml, target = svg)
 
     def build_test(self, bld, test='test') :
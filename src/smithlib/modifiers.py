@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+''' In process implementations of modify() commands '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+from waflib import Logs
+from smithlib.procpool import pool_rule
+from smithlib.tabledeps import sfntversions
+import shlex, struct
+
+try :
+    from fontTools.ttLib import TTFont
+except ImportError :
+    TTFont = None
+
+# Each modify() on a font is a task that moves the font aside, runs a program
+# that reads the whole font and writes it back. Where a run of consecutive
+# modify() commands on one target are all ones we know how to do in process,
+# group_modifys() replaces them with a single task that reads the font once,
+# makes each change in turn and writes it once. Other commands run as before.
+# Commands are recognised by parsers, keyed by the program variable they start
+# with, that return an operation (a tuple of an entry in operations and its
+# arguments) or None if they don't understand the command.
+#
+# The output must be what the program would have written, byte for byte, or
+# the fonts would differ from those built without smith. So only ttftable -d
+# is done here: a font that only has tables deleted is written as Font::TTF
+# writes an sfnt of unread tables (see write_sfnt()), rather than through
+# fontTools, which would recompile the tables it touches. ttfsetver and
+# ttfname rewrite tables by rules of their own that can't be checked against
+# the real tools here, so they always run as given.
+
+# The table groups ttftable knows. Any other name that isn't a whole tag is
+# left for ttftable to make sense of.
+tablegroups = {
+    'graphite' : ('Silf', 'Glat', 'Gloc', 'Feat', 'Sill', 'Sile'),
+    'opentype' : ('GDEF', 'GSUB', 'GPOS', 'BASE', 'JSTF'),
+    'volt' : ('TSIV', 'TSID', 'TSIP', 'TSIS'),
+    'vtt' : ('TSI0', 'TSI1', 'TSI2', 'TSI3', 'TSI5'),
+}
+
+def table_tags(tables) :
+    """ Returns the tags in a comma separated list of tags or groups, or None
+        if there is anything else in it """
+    tags = []
+    for t in tables.split(',') :
+        if t in tablegroups :
+            tags.extend(tablegroups[t])
+        elif len(t) == 4 and all(' ' <= c <= '~' for c in t) :
+            tags.append(t)
+        else :
+            return None
+    return tuple(tags)
+
+def parse_ttftable(args) :
+    """ ttftable -d tables, where tables is a comma separated list of tags or groups """
+    if len(args) != 4 or args[0] not in ('-d', '-delete') or args[2:] != ['${DEP}', '${TGT}'] :
+        return None
+    tags = table_tags(args[1])
+    return ('delete', tags) if tags is not None else None
+
+parsers = {'TTFTABLE' : parse_ttftable}
+
+def read_sfnt(path) :
+    """ Returns (sfnt version, {tag: bytes}) for the font at path, or None
+        if it isn't an sfnt """
+    with open(path, 'rb') as f :
+        data = f.read()
+    if len(data) < 12 or data[:4] not in sfntversions :
+        return None
+    num = struct.unpack(">H", data[4:6])[0]
+    tables = {}
+    for i in range(num) :
+        tag, _, offset, length = struct.unpack(">4sLLL", data[12+16*i:28+16*i])
+        tables[tag.decode('latin-1')] = data[offset:offset+length]
+    return (data[:4], tables)
+
+def checksum(data) :
+    data += b"\0" * (-len(data) % 4)
+    return sum(struct.unpack(">%dL" % (len(data) // 4), data)) & 0xFFFFFFFF
+
+def write_sfnt(path, version, tables) :
+    """ Writes an sfnt of the given tables, with the head checksum adjusted """
+    tags = sorted(tables.keys())
+    num = len(tags)
+    if 'head' in tables :
+        tables = dict(tables)
+        tables['head'] = tables['head'][:8] + b"\0\0\0\0" + tables['head'][12:]
+    entry = 1 << (num.bit_length() - 1) if num else 0
+    header = version + struct.pack(">HHHH", num, entry * 16, max(0, entry.bit_length() - 1), num * 16 - entry * 16)
+    offset = 12 + 16 * num
+    directory = []
+    body = []
+    for t in tags :
+        d = tables[t]
+        directory.append(struct.pack(">4sLLL", t.encode('latin-1'), checksum(d), offset, len(d)))
+        body.append(d + b"\0" * (-len(d) % 4))
+        offset += len(d) + (-len(d) % 4)
+    data = header + b"".join(directory) + b"".join(body)
+    if 'head' in tables :
+        headoffset = struct.unpack(">L", directory[tags.index('head')][8:12])[0]
+        adjust = (0xB1B0AFBA - checksum(data)) & 0xFFFFFFFF
+        data = data[:headoffset+8] + struct.pack(">L", adjust) + data[headoffset+12:]
+    with open(path, 'wb') as f :
+        f.write(data)
+
+def delete_tables(font, tags) :
+    for t in tags :
+        if t in font :
+            del font[t]
+
+operations = {'delete' : delete_tables}
+
+def parse(cmd) :
+    """ Returns the operation for a modify() command, or None """
+    if not isinstance(cmd, str) : return None
+    try :
+        args = shlex.split(cmd)
+    except ValueError :
+        return None
+    if not args or not args[0].startswith('${') or not args[0].endswith('}') :
+        return None
+    p = parsers.get(args[0][2:-1], None)
+    return p(args[1:]) if p is not None else None
+
+def apply_modifiers(ops, task) :
+    """ Load the font being modified, make the changes and save it """
+    if all(op[0] == 'delete' for op in ops) :
+        sfnt = read_sfnt(task.dep.abspath())
+        if sfnt is not None :
+            tags = set(t for op in ops for t in op[1])
+            write_sfnt(task.tgt.abspath(), sfnt[0], dict((k, v) for k, v in sfnt[1].items() if k not in tags))
+            return 0
+    font = TTFont(task.dep.abspath())
+    for op in ops :
+        operations[op[0]](font, *op[1:])
+    font.save(task.tgt.abspath(), reorderTables = False)
+    font.close()
+    return 0
+
+def fusable(step) :
+    """ Only simple steps with no other inputs or ordering constraints """
+    cmd, inputs, shell, kw = step
+    return not inputs and not (set(kw.keys()) - set(['late'])) and parse(cmd) is not None
+
+def group_modifys(steps) :
+    """ Returns the list of modify() steps, (cmd, inputs, shell, kw), for a
+        target with each run of in process commands replaced by one step """
+    if TTFont is None :
+        return steps
+    res = []
+    run = []
+    def flush() :
+        if not run : return
+        ops = tuple(parse(s[0]) for s in run)
+        Logs.debug("modify: in process %r" % (ops,))
+        res.append((pool_rule(apply_modifiers, ops), [], 0, dict(run[-1][3])))
+        del run[:]
+    for s in steps :
+        if fusable(s) :
+            run.append(s)
+        else :
+            flush()
+            res.append(s)
+    flush()
+    return res
@@ -8,7 +8,8 @@ __license__ = 'Released under the 3-Clause BSD License (https://opensource.org/l
 
 from waflib import Context, Build, Errors, Node, Options, Logs, Utils
 from smithlib.smith import isList, formatvars, create, defer
-from smithlib import wafplus, font_tests, font, templater
+from smithlib import wafplus, font_tests, font, templater, timings, archive
+from smithlib.procpool import pool_rule
 import os, sys, shutil, time, fnmatch, subprocess, re, json
 from xml.etree import ElementTree as et
 
@@ -21,7 +22,8 @@ keyfields = ('version', 'appname', 'desc_short',
             'desc_long', 'outdir', 'desc_name', 'docdir')
 optkeyfields = ('company', 'instdir', 'zipfile', 'zipdir', 'readme',
             'contact', 'url', 'testfiles', 'buildlabel', 'buildformat',
-            'package_files', 'buildversion', 'sile_path', 'sile_scale', 'noalltests')
+            'package_files', 'buildversion', 'sile_path', 'sile_scale', 'noalltests',
+            'compress_threads', 'deterministic', 'latestamp')
 
 def formatdesc(s) :
     res = []
@@ -39,12 +41,6 @@ def formattz(tzsec) :
     if tzmin < 0 : tzmin = -tzmin
     return "{0:+03d}{1:02d}".format(tzhr, tzmin)
 
-def ascrlf(fname) :
-    res = ""
-    with open(fname, "r") as f :
-        res = "\r\n".join([x.rstrip("\n") for x in f.readlines()]) + "\r\n"
-    return res
-
 def prettydict(data, indent, ink, oneline=False, oneliners=None):
     res = ["{"]
     thisoneline = oneline and (oneliners is None or ink not in oneliners)
@@ -323,60 +319,52 @@ class Package(object) :
         if not hasattr(self, 'zipfile') :
             self.zipfile = "{}/{}.zip".format(self.zipdir, self.get_basearc())
 
-    def execute_tar(self, bld) :
-        import tarfile
-        self.set_zip()
-        tnode = bld.path.find_or_declare(self.zipfile.replace(".zip", ".tar.xz"))
-        tar = tarfile.open(tnode.abspath(), "w:xz")
-        tarfiles  = set()
+    def get_members(self, bld) :
+        """ Returns the archive.Members for the files in the release archives,
+            sorted by archive name with duplicates removed """
+        res = {}
         basearc = self.get_basearc()
-        for t in sorted(self.get_files(bld), key=lambda x:x[1]) :
+        # fonts whose build label is stamped late ship the stamped copy
+        stamped = dict((f.target, f.stamped) for p in Package.packages() for f in p.fonts if hasattr(f, 'stamped'))
+        for t in self.get_files(bld) :
             d, x = t[0], t[1]
             if not x : continue
             r = os.path.relpath(os.path.join(d, x), bld.bldnode.abspath())
-            y = bld.path.find_or_declare(r)
-            archive_name = os.path.join(basearc, t[2] if len(t) > 2 else x)
-            if archive_name in tarfiles:
+            y = bld.path.find_or_declare(stamped.get(r, r))
+            name = t[2] if len(t) > 2 else x
+            archive_name = os.path.join(basearc, name)
+            if archive_name in res and res[archive_name].isfile :
                 continue
-            if not archive_name.startswith('..') :
-                tar.add(y.abspath(), arcname = archive_name)
-            tarfiles.add(archive_name)
-        tar.close()
+            res[archive_name] = archive.Member(name, archive_name, y.abspath(), self.isTextFile(r))
+        return [res[k] for k in sorted(res.keys())]
 
-    def execute_zip(self, bld) :
-        import zipfile
+    def archive_options(self) :
+        return archive.Options(getattr(self, 'compress_threads', 0), getattr(self, 'deterministic', False))
+
+    def execute_archives(self, bld, dozip = True, dotar = True) :
+        """ Create the release zip and/or tarball from a single pass over the
+            files, reusing what is unchanged from the previous archives """
         self.set_zip()
         znode = bld.path.find_or_declare(self.zipfile)      # create dirs
-        zip = zipfile.ZipFile(znode.abspath(), 'w', compression=zipfile.ZIP_DEFLATED)
-        zipfiles  = set()
+        if dozip :
+            self.build_manifest(bld)
+        members = self.get_members(bld)
         basearc = self.get_basearc()
-        self.build_manifest(bld)
+        mpath = archive.manifest_path(bld, self.appname)
+        manifest = archive.load_manifest(mpath)
+        opts = self.archive_options()
+        if dozip :
+            manifest['zip'] = archive.write_zip(znode.abspath(), basearc, members, manifest.get('zip', {}), opts)
+        if dotar :
+            tpath = bld.path.find_or_declare(self.zipfile.replace(".zip", ".tar.xz")).abspath()
+            manifest['tar'] = archive.write_tar(tpath, basearc, members, manifest.get('tar', {}), opts)
+        archive.save_manifest(mpath, manifest)
 
-        for t in sorted(self.get_files(bld), key=lambda x:x[2] if len(x) > 2 else x[1]) :
-            d, x = t[0], t[1]
-            if not x : continue
-            r = os.path.relpath(os.path.join(d, x), bld.bldnode.abspath())
-            y = bld.path.find_or_declare(r)
-            archive_name = os.path.join(basearc, t[2] if len(t) > 2 else x)
-            if os.path.isfile(y.abspath()) :
-                if archive_name in zipfiles:
-                    continue
-                if self.isTextFile(r) :
-                    try:
-                        s = ascrlf(y.abspath())
-                        zip.writestr(archive_name, s, zipfile.ZIP_DEFLATED)
-                    except UnicodeDecodeError as e:
-                        print("Badly encoded file {}, {}. Storing as binary".format(r, str(e)))
-                        zip.write(y.abspath(), archive_name, zipfile.ZIP_DEFLATED)
-                    inf = zip.getinfo(archive_name)
-                    inf.internal_attr = 1
-                else :
-                    zip.write(y.abspath(), archive_name, zipfile.ZIP_DEFLATED)
-                    inf = zip.getinfo(archive_name)
-                inf.external_attr = 0
-                inf.create_system = 0   # pretend we are windows
-                zipfiles.add(archive_name)
-        zip.close()
+    def execute_tar(self, bld) :
+        self.execute_archives(bld, dozip = False)
+
+    def execute_zip(self, bld) :
+        self.execute_archives(bld, dotar = False)
 
     def _get_arcfile(self, bld, path) :
         if path is None : return None
@@ -574,6 +562,63 @@ def _let(ex, **kw):
     return eval(ex, globals(), kw)
 let = defer(_let)
 
+class _DSCache(object):
+    """ What makefonts derives from each designspace file, kept in the build
+        directory. An entry is keyed by the hash of the designspace and the
+        parameters that affect what is derived from it, and also records the
+        hash of each master fontinfo.plist that was read. """
+    fname = '.smithdscache.json'
+    _data = None
+
+    @classmethod
+    def path(cls):
+        if not Context.out_dir or not os.path.isdir(Context.out_dir):
+            return None
+        return os.path.join(Context.out_dir, cls.fname)
+
+    @classmethod
+    def data(cls):
+        if cls._data is None:
+            cls._data = {}
+            path = cls.path()
+            if path is not None:
+                try:
+                    with open(path) as f:
+                        cls._data = json.load(f)
+                except (OSError, ValueError):
+                    pass
+        return cls._data
+
+    @staticmethod
+    def hashfile(fname):
+        try:
+            return Utils.to_hex(Utils.h_file(fname))
+        except (OSError, IOError):
+            return ''
+
+    @classmethod
+    def get(cls, dspace, key):
+        e = cls.data().get(os.path.abspath(dspace), None)
+        if e is None or e.get('key') != key:
+            return None
+        if any(cls.hashfile(f) != h for f, h in e['deps'].items()):
+            return None
+        return e['fonts']
+
+    @classmethod
+    def put(cls, dspace, key, deps, fonts):
+        path = cls.path()
+        if path is None:
+            return
+        cls.data()[os.path.abspath(dspace)] = {'key': key, 'fonts': fonts,
+                'deps': dict((os.path.abspath(f), cls.hashfile(f)) for f in deps)}
+        try:
+            with open(path + '.tmp', 'w') as f:
+                json.dump(cls._data, f, separators=(',', ':'))
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            Logs.warn("Could not save designspace cache: %s" % e)
+
 class DesignSpace(object):
     _modifiermap = {'DASH': lambda x: x.replace(' ', '-'),
                     'BASE': lambda x: os.path.splitext(os.path.basename(x))[0],
@@ -583,96 +628,171 @@ class DesignSpace(object):
         self.dspace = dspace
         self.kw = kw
         self.fonts = []
-        self.axesmap = {}
         self.makefonts()
         self.isbuilt = False
 
     def makefonts(self):
-        self.doc = et.parse(self.dspace)
-        self.srcs = {}
-        for axis in self.doc.getroot().findall('axes/axis'):
+        params = [self.kw.get(x, None) for x in ('instances', 'shortcircuit', 'instanceparams')]
+        params.append('source' in self.kw)
+        m = Utils.md5()
+        m.update(json.dumps(params, sort_keys=True, default=str).encode('utf-8'))
+        m.update(_DSCache.hashfile(self.dspace).encode('utf-8'))
+        key = m.hexdigest()
+        insts = _DSCache.get(self.dspace, key)
+        if insts is None:
+            deps = set()
+            insts = self._parse(deps)
+            _DSCache.put(self.dspace, key, sorted(deps), insts)
+        for inst in insts:
+            self._makefont(inst)
+
+    def _parse(self, deps):
+        """ Returns a list of what each instance needs from the designspace.
+            Adds any other files read to deps """
+        doc = et.parse(self.dspace)
+        axesmap = {}
+        srcs = {}
+        for axis in doc.getroot().findall('axes/axis'):
             k = axis.get('name', None)
             v = axis.get('tag', None)
             d = axis.get('default', None)
             a = _Axis(k, v, d)
             if k is not None and v is not None:
-                self.axesmap[k] = a
+                axesmap[k] = a
                 for m in axis.findall('map'):
                     a.addmapping(m.get("input", 0), m.get("output", 0))
         allaxes = {}
-        for src in self.doc.getroot().findall('.//sources/source'):
+        for src in doc.getroot().findall('.//sources/source'):
             sfont = _DSSource(**src.attrib)
             for d in src.findall('./location/dimension'):
                 val = (d.get('xvalue', None), d.get("yvalue", None))
                 sfont.addFloatLocation(d.get('name'), None, val)
                 allaxes.setdefault(d.get('name'), set()).add(val)
-            self.srcs[sfont.name] = sfont
-        self.delaxis = set([k for k, v in allaxes.items() if len(v) < 2 and k != "weight"])
-        for inst in self.doc.getroot().findall('instances/instance'):
+            srcs[sfont.name] = sfont
+        delaxis = set([k for k, v in allaxes.items() if len(v) < 2 and k != "weight"])
+        res = []
+        for inst in doc.getroot().findall('instances/instance'):
             if self.kw.get('instances', None) is None or inst.get('name') in self.kw['instances']:
-                self._makefont(inst, True)
+                res.append(self._parseinstance(inst, axesmap, srcs, delaxis, deps))
+        return res
 
-    def _makefont(self, inst, isInstance):
+    def _parseinstance(self, inst, axesmap, srcs, delaxis, deps):
         base = os.path.dirname(self.dspace)
         specialvars = dict(("DS:"+k.upper(), v) for k,v in inst.attrib.items())
         copyvars = specialvars.copy()
         specialvars.update((k+"_"+mk, mv(v)) for k,v in copyvars.items() for mk, mv in self._modifiermap.items())
         specialvars.update(("DS:AXIS_"+e.get("name", "").upper(), e.get("xvalue", "")) for e in inst.findall('location/dimension'))
         specialvars['DS:FILE'] = os.path.join(base, specialvars['DS:FILENAME'])
+        res = {'vars': specialvars}
+        if 'source' in self.kw:
+            return res
+        srcinst = srcs.get(inst.get('name'), None)
+        fsrc = _DSSource(**inst.attrib)
+        for d in inst.findall("./location/dimension"):
+            fsrc.addFloatLocation(d.get('name'), axesmap.get(d.get('name'), None),
+                                  [d.get('xvalue', None), d.get("yvalue", None)])
+        res['axes'] = {str(axesmap.get(k, DSAxesMappings.get(k, k))): v for k, v in fsrc.asDict().items() if k not in delaxis}
+        familyname = inst.get('familyname')
+        res['family'] = familyname
+        res['altfamily'] = inst.get('stylemapfamilyname', familyname)
+        res['ital'] = 1 if 'italic' in inst.get('stylename', '').lower() else 0
+        res['isdefault'] = fsrc.isDefault()
+        if self.kw.get('shortcircuit', False) and 'name' in inst.attrib and srcinst is not None:
+            mfont = srcs[inst.get('name')]
+            masterFName = os.path.join(base, mfont.filename)
+            for sub in ('kern', 'glyphs', 'info', 'lib', 'familyname', 'stylename', 'stylemapstylename', 'stylemapfamilyname'):
+                if inst.find(sub) is not None and len(inst.find(sub)) > 0:
+                    mightbeSame = False
+                    break
+            mightbeSame = srcinst.same(fsrc)
+            if mightbeSame:
+                plistfile = os.path.join(masterFName, 'fontinfo.plist')
+                deps.add(plistfile)
+                fplist = read_plist(plistfile)
+                for sub in ('styleMapStyleName', 'styleMapFamilyName', 'postscriptFontName'):
+                    att = inst.get(sub.lower(), "")
+                    if not len(att):
+                        continue
+                    v = fplist.get(sub, None)
+                    if v is not None and v.text != att:
+                        mightbeSame = False
+                        break
+            if mightbeSame:
+                parmvar = self.kw.get('instanceparams', '')
+                if '-W' in parmvar or '--fixweight' in parmvar:
+                    wt = int(fplist.get('openTypeOS2WeightClass', "0"))
+                    st = fplist.get('styleMapStyleName', fplist.get('styleName', '')).lower()
+                    if (st.startswith('bold') and wt != 700) or wt != 400:
+                        mightbeSame = False
+            if mightbeSame:
+                res['master'] = masterFName
+        return res
+
+    def build_instances(self, bld):
+        """ Build the instances in a few runs of psfcreateinstances, which
+            loads the masters once per run, rather than one run each """
+        if self.isbuilt:
+            return
+        self.isbuilt = True
+        insts = [f.legacy for f in self.fonts if isinstance(getattr(f, 'legacy', None), font.DesignInstance)]
+        if not len(insts):
+            return
+        batch = self.kw['instancebatch']
+        n = max(1, min(bld.jobs if batch is True else int(batch), len(insts)))
+        params = self.kw.get('instanceparams', '')
+        base = os.path.splitext(self.dspace)[0]
+        if n == 1 and len(insts) == len(self.fonts) and self.kw.get('instances', None) is None:
+            # -o .tmp is a dummy so that the ../source in the base path to the designspace file removes the ..
+            bld(rule="psfcreateinstances -q -l '{0}_createinstances.log' -o .tmp {1} ${{SRC}}".format(os.path.basename(base), params),
+                source=self.dspace, target=[x.target for x in insts])
+            return
+        for i in range(n):
+            shard = insts[i * len(insts) // n : (i + 1) * len(insts) // n]
+            # a copy in the build directory with only this shard's instances
+            subnode = bld.path.find_or_declare("{}-instances{}.designspace".format(base, i + 1))
+            bld(rule=pool_rule(subset_designspace, [x.name for x in shard]), source=self.dspace, target=subnode)
+            bld(rule="psfcreateinstances -q -l '{0}_createinstances.log' {1} ${{SRC}}".format(os.path.basename(subnode.name[:-12]), params),
+                source=subnode, target=[x.target for x in shard])
+
+    def _makefont(self, inst):
+        specialvars = dict(inst['vars'])
         # we can insert all kinds of useful defaults in here
         newkw = {}
         if 'source' not in self.kw:
-            if isInstance:
-                srcinst = self.srcs.get(inst.get('name'), None)
-                fsrc = _DSSource(**inst.attrib)
-                for d in inst.findall("./location/dimension"):
-                    fsrc.addFloatLocation(d.get('name'), self.axesmap.get(d.get('name'), None),
-                                          [d.get('xvalue', None), d.get("yvalue", None)])
-                newkw.setdefault('axes', {}).setdefault('axes', self.kw.get('axes', {}).copy()).update(
-                        {str(self.axesmap.get(k, DSAxesMappings.get(k, k))): v for k, v in fsrc.asDict().items() if k not in self.delaxis})
-                familyname = inst.get('familyname')
-                smfn = inst.get('stylemapfamilyname', familyname)
-                newkw['axes']['family'] = familyname
-                newkw['axes'].setdefault('axes', {})['ital'] = 1 if 'italic' in inst.get('stylename', '').lower() else 0
-                newkw['defaultsinaxes'] = fsrc.isDefault() and not newkw['axes']['axes']['ital']
-                if familyname != smfn:
-                    newkw['axes']['altfamily'] = smfn
-                if self.kw.get('shortcircuit', False) and 'name' in inst.attrib and srcinst is not None:
-                    mfont = self.srcs[inst.get('name')]
-                    masterFName = os.path.join(base, mfont.filename)
-                    for sub in ('kern', 'glyphs', 'info', 'lib', 'familyname', 'stylename', 'stylemapstylename', 'stylemapfamilyname'):
-                        if inst.find(sub) is not None and len(inst.find(sub)) > 0:
-                            mightbeSame = False
-                            break
-                    mightbeSame = srcinst.same(fsrc)
-                    if mightbeSame:
-                        fplist = read_plist(os.path.join(masterFName, 'fontinfo.plist'))
-                        for sub in ('styleMapStyleName', 'styleMapFamilyName', 'postscriptFontName'):
-                            att = inst.get(sub.lower(), "")
-                            if not len(att):
-                                continue
-                            v = fplist.get(sub, None)
-                            if v is not None and v.text != att:
-                                mightbeSame = False
-                                break
-                    if mightbeSame:
-                        parmvar = self.kw.get('instanceparams', '')
-                        if '-W' in parmvar or '--fixweight' in parmvar:
-                            wt = int(fplist.get('openTypeOS2WeightClass', "0"))
-                            st = fplist.get('styleMapStyleName', fplist.get('styleName', '')).lower()
-                            if (st.startswith('bold') and wt != 700) or wt != 400:
-                                mightbeSame = False
-                    if mightbeSame:
-                        newkw['source'] = masterFName
-                if 'source' not in newkw:
-                    newkw['source'] = font.DesignInstance(self, specialvars['DS:FILE'], specialvars['DS:NAME'],\
-                                                          self.dspace, params=self.kw.get('instanceparams', ''))
+            newkw['axes'] = {'axes': self.kw.get('axes', {}).copy()}
+            newkw['axes']['axes'].update(inst['axes'])
+            newkw['axes']['family'] = inst['family']
+            newkw['axes']['axes']['ital'] = inst['ital']
+            newkw['defaultsinaxes'] = inst['isdefault'] and not inst['ital']
+            if inst['family'] != inst['altfamily']:
+                newkw['axes']['altfamily'] = inst['altfamily']
+            if 'master' in inst:
+                newkw['source'] = inst['master']
             else:
-                newkw['source'] = specialvars['DS:FILENAME']
+                newkw['source'] = font.DesignInstance(self, specialvars['DS:FILE'], specialvars['DS:NAME'],\
+                                                      self.dspace, params=self.kw.get('instanceparams', ''))
         specialvars['source'] = formatvars(getattr(newkw['source'], 'target', newkw['source']), specialvars)
         newkw.update(dict((k, formatvars(v, specialvars)) for k,v in list(self.kw.items()) if k != 'axes'))
         self.fonts.append(font.Font(**newkw))
 
+def subset_designspace(names, task):
+    """ Copy a designspace file keeping only the named instances. The copy
+        is in the build directory, so the master paths are made relative to it,
+        while instances still go where they would from the original """
+    src = task.inputs[0].abspath()
+    tgt = task.outputs[0].abspath()
+    names = set(names)
+    doc = et.parse(src)
+    for s in doc.getroot().findall('sources/source'):
+        if s.get('filename', None) is not None:
+            s.set('filename', os.path.relpath(os.path.join(os.path.dirname(src), s.get('filename')), os.path.dirname(tgt)))
+    for insts in doc.getroot().findall('instances'):
+        for inst in insts.findall('instance'):
+            if inst.get('name') not in names:
+                insts.remove(inst)
+    doc.write(tgt, encoding='UTF-8', xml_declaration=True)
+    return 0
+
 def make_srcdist(self) :
     res = set(['wscript'])
     files = {}
@@ -716,7 +836,6 @@ def make_srcdist(self) :
             files[f] = n
 
     # now generate the tarball
-    import tarfile
     tarname = getattr(Context.g_module, 'SRCDIST', None)
     if not tarname :
         tarbase = Package.global_package().get_basearc(extras="-src")
@@ -725,8 +844,8 @@ def make_srcdist(self) :
         tarbase = tarname
     tarfilename = os.path.join(getattr(Context.g_module, 'ZIPDIR', 'releases'), tarname) + '.tar.xz'
     tnode = self.path.find_or_declare(tarfilename)
-    tar = tarfile.open(tnode.abspath(), 'w:xz')
     incomplete = False
+    entries = []
 
     for f in sorted(files.keys()) :
         if f.startswith('../') :
@@ -734,8 +853,8 @@ def make_srcdist(self) :
             incomplete = True
             continue
         if files[f] :
-            tar.add(files[f].abspath(), arcname = os.path.join(tarbase, f))
-    tar.close()
+            entries.append((files[f].abspath(), os.path.join(tarbase, f)))
+    archive.write_tarxz(tnode.abspath(), entries, Package.global_package().archive_options())
     Logs.warn('Tarball .tar.xz (-src- source release) generated.')
     if incomplete :
         Logs.error("Not all the sources for the project have been included in the tarball(s) so the wscript in it will not build.")
@@ -779,9 +898,8 @@ class releaseContext(Build.BuildContext) :
         if Options.options.debug :
             import pdb; pdb.set_trace()
         for p in Package.packages() :
-            p.execute_zip(self)
+            p.execute_archives(self)
             Logs.warn('.zip release with build results generated (CR+LF line-endings).')
-            p.execute_tar(self)
             Logs.warn('.tar.xz release with build results generated (LF line-endings).')
 
         # checksums are also created as part of the release target
@@ -832,6 +950,21 @@ class buildinfoContext(Build.BuildContext) :
         subprocess.call(["pip3 freeze"], shell = 1, stdout=open("requirements.txt","w"))
         Logs.warn('Toolchain component versions BUILDINFO.txt and requirements.txt generated.')
 
+class profileContext(Build.BuildContext) :
+    """Report the slowest tasks, per font times and critical path of the last build"""
+    cmd = 'profile'
+
+    def execute(self) :
+        runs = timings.load_history(os.path.join(self.out_dir, timings.HISTFILE))
+        if not len(runs) :
+            Logs.warn("No task timings recorded yet, run a build first")
+            return
+        rep = timings.make_report(runs)
+        if Options.options.json :
+            print(json.dumps(rep, indent=2))
+        else :
+            print(timings.format_report(rep))
+
 class cmdContext(Build.BuildContext) :
     """Build Windows installer"""
     cmd = 'exe' # must have a cmd otherwise this class overrides Build.BuildContext
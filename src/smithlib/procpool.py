@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+''' Process pool for python task functions '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+from waflib import Options, Utils
+from waflib.TaskGen import feature, after
+import threading
+
+# Rule functions run in the build's consumer threads and so share the GIL.
+# A rule made with pool_rule() calls a module level function with picklable
+# arguments and a PoolTask, standing in for the task, that just knows the
+# input and output paths. Such a rule can be run in a worker process instead,
+# either because the task (or its class or task generator) sets procpool, or
+# because --procpool gives the number of workers to use.
+
+_pool = None
+_poollock = threading.Lock()
+
+class PoolNode(object) :
+    """ The parts of a Node that a pooled function may use """
+    __slots__ = ('_abspath', '_bldpath')
+
+    def __init__(self, node) :
+        self._abspath = node.abspath()
+        self._bldpath = node.bldpath()
+
+    def abspath(self) :
+        return self._abspath
+
+    def bldpath(self) :
+        return self._bldpath
+
+    def write(self, data, flags = 'w') :
+        with open(self._abspath, flags) as f :
+            f.write(data)
+
+class PoolTask(object) :
+    """ Picklable stand in for a task passed to a pooled function """
+
+    def __init__(self, task) :
+        self.inputs = [PoolNode(x) for x in task.inputs]
+        self.outputs = [PoolNode(x) for x in task.outputs]
+        # the file being modified by a modify() task, and where it goes
+        if getattr(task, 'dep', None) is not None :
+            self.dep = PoolNode(task.dep)
+            self.tgt = PoolNode(task.tgt.get_bld())
+
+def _numworkers(bld) :
+    return getattr(Options.options, 'procpool', 0) or bld.jobs
+
+def get_pool(bld) :
+    global _pool
+    with _poollock :
+        if _pool is None :
+            import concurrent.futures, multiprocessing
+            # don't fork a process full of running threads
+            _pool = concurrent.futures.ProcessPoolExecutor(_numworkers(bld),
+                            mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+def shutdown() :
+    global _pool
+    with _poollock :
+        if _pool is not None :
+            _pool.shutdown()
+            _pool = None
+
+def use_pool(task) :
+    res = getattr(task, 'procpool', None)
+    if res is None :
+        res = getattr(Options.options, 'procpool', 0)
+    return bool(res)
+
+def pool_rule(fn, *args) :
+    """ Returns a rule function that calls fn(*args, task). fn must be a
+        module level function and args must be picklable. """
+    def run(task) :
+        ptask = PoolTask(task)
+        if use_pool(task) :
+            return get_pool(task.generator.bld).submit(fn, *(args + (ptask,))).result()
+        return fn(*(args + (ptask,)))
+    # the signature depends on what is being called and with what
+    run.code = Utils.h_fun(fn) + repr(args)
+    return run
+
+@feature('*')
+@after('process_rule')
+def process_procpool(tgen) :
+    """ procpool on a task generator chooses how its tasks' functions run """
+    if not hasattr(tgen, 'procpool') : return
+    for t in tgen.tasks :
+        t.procpool = tgen.procpool
+
+def stop_pool(bld) :
+    """ The workers are not kept between builds """
+    shutdown()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+''' Regression tests against reference fonts with cached reference shaping '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+from waflib import Utils
+from smithlib import templates
+import os, json, html
+
+try :
+    import uharfbuzz as hb
+except ImportError :
+    hb = None
+
+# A usestandards test shapes its text with both the font and the reference
+# font every time the font changes, though the reference rarely does. With
+# refcache, an OpenType test is run in process with harfbuzz instead of by
+# cmptxtrender. The shaping of the reference font is kept in CACHEDIR in the
+# build directory, a file for each reference font content, test file content,
+# script, language and features, so only the font being tested gets shaped
+# on each run. The results are a page of our own, not cmptxtrender's report,
+# listing the lines whose glyphs or positions differ.
+
+CACHEDIR = '.smithrefs'
+
+def parse_features(features) :
+    """ Features as a dict of tag to value from a dict or a string like 'smcp,liga=0' """
+    if isinstance(features, dict) :
+        return dict((k, int(v)) for k, v in features.items())
+    res = {}
+    for f in (features or "").split(',') :
+        f = f.strip()
+        if not f : continue
+        if f[0] in '+-' :
+            res[f[1:]] = 1 if f[0] == '+' else 0
+        else :
+            k, sep, v = f.partition('=')
+            res[k.strip()] = int(v) if sep else 1
+    return res
+
+def read_lines(textpath) :
+    with open(textpath, encoding = 'utf-8') as f :
+        return [l.rstrip('\r\n') for l in f]
+
+def shape_lines(fontpath, lines, script, lang, features) :
+    """ Returns, for each line, a list of [glyph, cluster, x advance, y advance,
+        x offset, y offset] from shaping it with the font """
+    with open(fontpath, 'rb') as f :
+        font = hb.Font(hb.Face(hb.Blob(f.read())))
+    res = []
+    for l in lines :
+        buf = hb.Buffer()
+        buf.add_str(l)
+        buf.guess_segment_properties()
+        if script :
+            buf.script = hb.ot_tag_to_script(script)
+        if lang :
+            buf.language = lang
+        hb.shape(font, buf, features)
+        res.append([[font.glyph_to_string(i.codepoint), i.cluster, p.x_advance, p.y_advance, p.x_offset, p.y_offset]
+                    for i, p in zip(buf.glyph_infos, buf.glyph_positions)])
+    return res
+
+def reference_shaping(cachedir, fontpath, textpath, lines, script, lang, features) :
+    """ The shaping of lines by the reference font, from the cache if we can """
+    m = Utils.md5()
+    for x in (Utils.h_file(fontpath), Utils.h_file(textpath),
+              json.dumps([script, lang, sorted(features.items()), hb.__version__]).encode('utf-8')) :
+        m.update(x)
+    path = os.path.join(cachedir, Utils.to_hex(m.digest()) + ".json")
+    try :
+        with open(path, encoding = 'utf-8') as f :
+            return json.load(f)
+    except (OSError, ValueError) :
+        pass
+    res = shape_lines(fontpath, lines, script, lang, features)
+    if not os.path.isdir(cachedir) :
+        os.makedirs(cachedir, exist_ok = True)
+    temp = "{}.{}".format(path, os.getpid())
+    with open(temp, 'w', encoding = 'utf-8') as f :
+        json.dump(res, f)
+    os.replace(temp, path)
+    return res
+
+def glyphstr(glyphs) :
+    return " ".join("{0}@{4},{5}+{2}".format(*g) if not g[3] else "{0}@{4},{5}+{2},{3}".format(*g) for g in glyphs)
+
+def compare(cachedir, script, lang, features, task) :
+    """ Shape the test text in task.inputs[0] with the font and the reference
+        font, inputs[1] and [2], and write the lines that differ as html """
+    temps = templates.RefShape
+    features = parse_features(features)
+    textpath = task.inputs[0].abspath()
+    lines = read_lines(textpath)
+    ref = reference_shaping(cachedir, task.inputs[2].abspath(), textpath, lines, script, lang, features)
+    res = shape_lines(task.inputs[1].abspath(), lines, script, lang, features)
+    out = [temps['head'].format(*map(html.escape, (task.inputs[0].bldpath(), task.inputs[1].bldpath(),
+                    task.inputs[2].bldpath(), script or "", lang or "", ",".join("{}={}".format(*x) for x in sorted(features.items())))))]
+    count = 0
+    for i, (l, r, t) in enumerate(zip(lines, ref, res)) :
+        if r != t :
+            count += 1
+            out.append(temps['row'].format(i + 1, *map(html.escape, (l, glyphstr(r), glyphstr(t)))))
+    out.append(temps['tail'].format(count, len(lines)))
+    with open(task.outputs[0].abspath(), 'w', encoding = 'utf-8') as f :
+        f.write("".join(out))
+    return 0
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+''' Running rule commands without a shell '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+from waflib import Context, Options, Logs, Utils
+from smithlib.zygote import command_words
+import os, re, shutil, threading
+
+# Most rules are compiled to shell command strings, so each task runs /bin/sh
+# which then runs the tool. Where a command uses nothing of the shell but
+# quoting and leading variable assignments, we split it ourselves and run the
+# tool directly, with posix_spawn when the task runs in our own directory
+# and otherwise with subprocess, which forks cheaply (vfork) when it can.
+# Python's posix_spawn has no file action to change directory, and tasks run
+# in the build directory rather than ours, so most commands use subprocess.
+# Only a failure to start the command sends it to the shell instead; once it
+# has started its status is final, so that it is never run twice.
+# Commands whose program is a shell builtin, or can't be found on the PATH,
+# still go to the shell, since a builtin may differ from the program of the
+# same name (echo, printf, test) or only makes sense in the shell (cd, exec).
+# --useshell turns this off. The number of shells saved is reported at the
+# end of the build.
+
+_assign = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*=')
+
+# The POSIX sh special and regular builtins, and others common to sh and bash
+shellbuiltins = frozenset(('.', ':', 'break', 'continue', 'eval', 'exec', 'exit', 'export', 'readonly',
+    'return', 'set', 'shift', 'times', 'trap', 'unset', 'alias', 'bg', 'cd', 'command', 'false', 'fc',
+    'fg', 'getopts', 'hash', 'jobs', 'kill', 'newgrp', 'pwd', 'read', 'true', 'type', 'ulimit', 'umask',
+    'unalias', 'wait', 'echo', 'printf', 'test', '[', 'local', 'source'))
+
+class Spawner(object) :
+
+    def __init__(self) :
+        self.lock = threading.Lock()
+        self.avoided = 0
+
+    def parse(self, cmd, env) :
+        """ Returns (argv, env) to run cmd without a shell, or None """
+        words = command_words(cmd)
+        if words is None :
+            return None
+        i = 0
+        while i < len(words) and _assign.match(words[i]) :
+            i += 1
+        if i == len(words) or words[i] in shellbuiltins :
+            return None
+        if i :
+            env = dict(os.environ if env is None else env)
+            for w in words[:i] :
+                k, _, v = w.partition('=')
+                env[k] = v
+        return (words[i:], env)
+
+    def which(self, prog, cwd, env) :
+        if os.sep in prog :
+            return os.path.join(cwd, prog) if cwd else prog
+        return shutil.which(prog, path = (os.environ if env is None else env).get('PATH', os.defpath))
+
+    def run(self, cmd, cwd, env, stdout = None, stderr = None) :
+        """ Runs cmd without a shell and returns its exit status, or None if it needs one.
+            stdout and stderr may be file descriptors for the output """
+        res = self.parse(cmd, env)
+        if res is None :
+            return None
+        argv, env = res
+        exe = self.which(argv[0], cwd, env)
+        if exe is None :
+            return None
+        if hasattr(os, 'posix_spawn') and hasattr(os, 'wait4') and (cwd is None or os.path.realpath(cwd) == os.getcwd()) :
+            actions = [(os.POSIX_SPAWN_DUP2, fd, i) for i, fd in ((1, stdout), (2, stderr)) if fd is not None]
+            try :
+                pid = os.posix_spawn(exe, argv, os.environ if env is None else env, file_actions = actions)
+            except OSError :
+                return None
+            status, ru = os.wait4(pid, 0)[1:]
+            Utils.add_child_usage(ru.ru_utime + ru.ru_stime, ru.ru_maxrss)
+            ret = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+        else :
+            try :
+                p = Utils.subprocess.Popen(argv, executable = exe, cwd = cwd, env = env, stdout = stdout, stderr = stderr)
+            except OSError :
+                return None
+            ret = Utils.wait_process(p)
+        with self.lock :
+            self.avoided += 1
+        return ret
+
+    def report(self) :
+        if self.avoided :
+            Logs.info("%d commands run without a shell" % self.avoided)
+        self.avoided = 0
+
+spawner = Spawner()
+
+def report_spawns(bld) :
+    spawner.report()
+
+def add_spawn() :
+    old_exec = Context.Context.exec_command
+
+    def exec_command(self, cmd, **kw) :
+        if os.name == 'posix' and isinstance(cmd, str) and not self.logger and not getattr(Options.options, 'useshell', False) \
+                and not (set(kw.keys()) - set(['cwd', 'env', 'shell', 'stdout', 'stderr'])) :
+            Logs.debug('runner: %r' % cmd)
+            res = spawner.run(cmd, kw.get('cwd', None), kw.get('env', None), kw.get('stdout', None), kw.get('stderr', None))
+            if res is not None :
+                return res
+        return old_exec(self, cmd, **kw)
+
+    Context.Context.exec_command = exec_command
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+''' Font dependencies on just some of a font's tables '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+from waflib import Task, Utils
+import os, struct, threading
+
+# A task generator with a tables attribute depends on the fonts among its
+# inputs only through the listed tables: rather than the signature of the font
+# node, its signature takes a digest of the bytes of just those tables, read
+# using the sfnt table directory. tables may also be a dict from shaper ('ot'
+# or 'gr') to a list of tables, in which case the lists for the task's shaper
+# and altshaper are used. Fonts that aren't sfnts are taken whole.
+#
+# Only the parts of head that affect layout are included, so that setting the
+# font revision or timestamps doesn't count as a change.
+
+layout = ('head', 'hhea', 'hmtx', 'vhea', 'vmtx', 'maxp', 'cmap', 'post', 'OS/2',
+          'loca', 'glyf', 'CFF ', 'CFF2', 'fvar', 'gvar', 'avar', 'HVAR', 'VVAR', 'MVAR')
+shaping = {
+    'ot' : layout + ('GDEF', 'GSUB', 'GPOS', 'kern', 'BASE', 'MATH'),
+    'gr' : layout + ('Silf', 'Glat', 'Gloc', 'Feat', 'Sill'),
+}
+
+fontexts = ('.ttf', '.otf')
+sfntversions = (b'\x00\x01\x00\x00', b'OTTO', b'true')
+
+_digests = {}
+_digestlock = threading.Lock()
+
+def read_tables(f, tags) :
+    """ Returns {tag: bytes} for those tags that are in the open sfnt file f,
+        or None if it isn't an sfnt """
+    header = f.read(12)
+    if len(header) < 12 or header[:4] not in sfntversions :
+        return None
+    num = struct.unpack(">H", header[4:6])[0]
+    directory = f.read(16 * num)
+    entries = []
+    for i in range(num) :
+        tag = directory[16*i:16*i+4].decode('latin-1')
+        if tag in tags :
+            offset, length = struct.unpack(">LL", directory[16*i+8:16*i+16])
+            entries.append((offset, tag, length))
+    res = {}
+    for offset, tag, length in sorted(entries) :
+        f.seek(offset)
+        res[tag] = f.read(length)
+    if 'head' in res :
+        # unitsPerEm and flags, bbox, macStyle and the format fields
+        res['head'] = res['head'][12:20] + res['head'][36:54]
+    return res
+
+def table_digest(path, tags) :
+    """ Returns a digest of the given tables of the font at path """
+    tags = tuple(sorted(set(tags)))
+    try :
+        st = os.stat(path)
+    except OSError :
+        return Utils.h_file(path)
+    key = (path, tags)
+    stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+    with _digestlock :
+        v = _digests.get(key)
+        if v is not None and v[0] == stamp :
+            return v[1]
+    with open(path, 'rb') as f :
+        tables = read_tables(f, tags)
+    if tables is None :
+        res = Utils.h_file(path)
+    else :
+        m = Utils.md5()
+        for t in tags :
+            m.update(t.encode('latin-1'))
+            if t in tables :
+                m.update(struct.pack(">L", len(tables[t])))
+                m.update(tables[t])
+            else :
+                m.update(b"\xff\xff\xff\xff")
+        res = m.digest()
+    with _digestlock :
+        _digests[key] = (stamp, res)
+    return res
+
+def task_tables(task) :
+    """ The tables a task depends on, or None for whole fonts """
+    try :
+        return task.tables
+    except AttributeError :
+        pass
+    tables = getattr(task.generator, 'tables', None)
+    if isinstance(tables, dict) :
+        shapers = [getattr(task.generator, x, None) for x in ('shaper', 'altshaper')]
+        res = set()
+        for s in shapers :
+            res.update(tables.get(s, ()))
+        tables = sorted(res) if res else None
+    elif tables is not None :
+        tables = list(tables)
+    task.tables = tables
+    return tables
+
+def keyed(task, node) :
+    """ Does task depend only on some tables of node? """
+    return task_tables(task) is not None and node.name.lower().endswith(fontexts)
+
+def add_tabledeps() :
+    old_sig_explicit_deps = Task.Task.sig_explicit_deps
+
+    def sig_explicit_deps(self) :
+        tables = task_tables(self)
+        if tables is None :
+            return old_sig_explicit_deps(self)
+        inputs, deps = self.inputs, self.dep_nodes
+        fonts = [x for x in inputs + deps if keyed(self, x)]
+        if not fonts :
+            return old_sig_explicit_deps(self)
+        for x in fonts :
+            self.m.update(table_digest(x.abspath(), tables))
+        self.inputs = [x for x in inputs if not keyed(self, x)]
+        self.dep_nodes = [x for x in deps if not keyed(self, x)]
+        try :
+            return old_sig_explicit_deps(self)
+        finally :
+            self.inputs, self.dep_nodes = inputs, deps
+
+    Task.Task.sig_explicit_deps = sig_explicit_deps
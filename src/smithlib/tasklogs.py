@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+''' Streaming the output of tasks to log files '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+from waflib import Context, Task, Options, Utils
+import os, sys, threading, collections
+
+# Tools like fontmake, grcompiler and fontbakery can write a great deal, which
+# in a parallel build interleaves on the terminal. With --tasklogs the output
+# of each task's commands goes down a pipe to a reader thread that writes it
+# to a log in LOGDIR in the build directory, named after the task's first
+# output, up to LOGCAP bytes. The last TAILLINES lines are kept in memory and
+# shown with the error if the task fails.
+#
+# Without --tasklogs output goes to the terminal as before. But where the
+# context has a logger, as during configure, output is now passed to the
+# logger a line at a time as it comes, rather than all collected in memory.
+
+LOGDIR = '.smithlogs'
+LOGCAP = 8 * 1024 * 1024
+TAILLINES = 40
+TAILWIDTH = 1000
+
+class Capture(object) :
+    """ A pipe whose contents go to a log file, keeping the last lines """
+
+    def __init__(self, path, append = False) :
+        self.r, self.w = os.pipe()
+        self.f = open(path, 'ab' if append else 'wb')
+        self.written = 0
+        self.dropped = 0
+        self.tail = collections.deque(maxlen = TAILLINES)
+        self.partial = b""
+        self.thread = threading.Thread(target = self.read)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def read(self) :
+        while True :
+            try :
+                data = os.read(self.r, 65536)
+            except OSError :
+                break
+            if not data :
+                break
+            room = max(0, LOGCAP - self.written)
+            if room :
+                self.f.write(data[:room])
+                self.written += min(room, len(data))
+            self.dropped += max(0, len(data) - room)
+            lines = (self.partial + data).split(b"\n")
+            self.partial = lines.pop()[-TAILWIDTH:]
+            self.tail.extend(l[-TAILWIDTH:] for l in lines[-TAILLINES:])
+        if self.partial :
+            self.tail.append(self.partial)
+        if self.dropped :
+            self.f.write(b"\n[... %d more bytes not logged]\n" % self.dropped)
+        self.f.close()
+        os.close(self.r)
+
+    def finish(self) :
+        """ Closes our end of the pipe, waits for the rest of the output and
+            returns the last lines of it """
+        os.close(self.w)
+        self.thread.join()
+        return b"\n".join(self.tail).decode('utf-8', 'replace')
+
+def log_path(task) :
+    bld = task.generator.bld
+    if task.outputs :
+        name = task.outputs[0].bldpath().replace(os.sep, '_')
+    else :
+        name = "{}_{}".format(task.__class__.__name__, Utils.to_hex(Utils.md5(str(task).encode('utf-8')).digest())[:12])
+    logdir = os.path.join(bld.bldnode.abspath(), LOGDIR)
+    if not os.path.isdir(logdir) :
+        os.makedirs(logdir, exist_ok = True)
+    return os.path.join(logdir, name + ".log")
+
+def start_capture(task) :
+    """ Returns a Capture for the output of a command of task, or None if
+        we aren't capturing """
+    if not getattr(Options.options, 'tasklogs', False) :
+        return None
+    path = log_path(task)
+    # later commands of the same task add to its log
+    res = Capture(path, append = getattr(task, 'logpath', None) == path)
+    task.logpath = path
+    return res
+
+def end_capture(task, cap, status) :
+    if cap is None :
+        return
+    tail = cap.finish()
+    if status :
+        task.logtail = tail
+
+def stream_lines(stream, fn, label) :
+    for l in iter(lambda : stream.readline(65536), b"") :
+        fn('%s: %s' % (label, l.decode(sys.stdout.encoding or 'iso8859-1', 'replace').rstrip('\r\n')))
+    stream.close()
+
+def add_tasklogs() :
+    old_exec = Context.Context.exec_command
+
+    def exec_command(self, cmd, **kw) :
+        if not self.logger :
+            return old_exec(self, cmd, **kw)
+        subprocess = Utils.subprocess
+        kw['shell'] = isinstance(cmd, str)
+        self.logger.info(cmd)
+        kw['stdout'] = kw['stderr'] = subprocess.PIPE
+        try :
+            p = subprocess.Popen(cmd, **kw)
+        except OSError :
+            return -1
+        readers = [threading.Thread(target = stream_lines, args = x) for x in
+                    ((p.stdout, self.logger.debug, 'out'), (p.stderr, self.logger.error, 'err'))]
+        for t in readers :
+            t.start()
+        for t in readers :
+            t.join()
+        return Utils.wait_process(p)
+
+    Context.Context.exec_command = exec_command
+    old_task_exec = Task.Task.exec_command
+
+    def task_exec_command(self, cmd, **kw) :
+        cap = start_capture(self) if 'stdout' not in kw and 'stderr' not in kw else None
+        if cap is None :
+            return old_task_exec(self, cmd, **kw)
+        kw['stdout'] = kw['stderr'] = cap.w
+        ret = 1
+        try :
+            ret = old_task_exec(self, cmd, **kw)
+        finally :
+            end_capture(self, cap, ret)
+        return ret
+
+    Task.Task.exec_command = task_exec_command
+    old_format_error = Task.Task.format_error
+
+    def format_error(self) :
+        res = old_format_error(self)
+        if getattr(self, 'logtail', None) is not None :
+            res += "\n--- last lines of %s ---\n%s" % (self.logpath, self.logtail)
+        return res
+
+    Task.Task.format_error = format_error
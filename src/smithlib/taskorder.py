@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+''' Ordering the tasks of a build group '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+from waflib import Errors, Logs
+from smithlib.tabledeps import keyed
+
+# Before a group of tasks is run, inject_modifiers() links each task that
+# reads a node to the right task in the chain of tasks that make and then
+# modify it, top_sort() orders the tasks and prioritise() puts the longest
+# chains first. Finding the right task in a chain asks whether each task in
+# the chain must run after the reader, which walking run_after each time
+# makes quadratic in the size of the group. Instead, TaskIndex numbers the
+# tasks in chains, including the lone task making a node, and keeps, for each
+# task, the set of chain tasks that must run after it as a bitset of those
+# numbers. The bitsets are worked out once,
+# from those of the tasks that run after each task, and kept up to date as
+# run_after links are added, stopping where nothing changes.
+
+class TaskIndex(object) :
+    """ Answers whether a task in a chain must run after another task, as
+        run_after links are added """
+
+    def __init__(self, tasks, chains) :
+        self.bits = {}
+        for entry in chains :
+            for t in entry :
+                if id(t) not in self.bits :
+                    self.bits[id(t)] = 1 << len(self.bits)
+        self.group = set(id(t) for t in tasks)
+        self.succs = {}         # id(task) -> tasks that run after it
+        for t in tasks :
+            for a in getattr(t, 'run_after', ()) :
+                self.succs.setdefault(id(a), []).append(t)
+        self.after = {}         # id(task) -> bitset of chain tasks that run after it
+
+    def descendants(self, task) :
+        """ Returns the bitset of chain tasks that run after task, directly or not """
+        try :
+            return self.after[id(task)]
+        except KeyError :
+            pass
+        # iterative depth first, working out each task after its successors
+        stack = [(task, False)]
+        seen = set()
+        while stack :
+            t, done = stack.pop()
+            if done :
+                res = 0
+                for s in self.succs.get(id(t), ()) :
+                    res |= self.bits.get(id(s), 0) | self.after.get(id(s), 0)
+                self.after[id(t)] = res
+                continue
+            if id(t) in seen or id(t) in self.after :
+                continue
+            seen.add(id(t))
+            stack.append((t, True))
+            stack.extend((s, False) for s in self.succs.get(id(t), ()) if id(s) not in self.after)
+        return self.after[id(task)]
+
+    def runs_after(self, task, other) :
+        """ Must task, which is in a chain, run after other? """
+        return bool(self.descendants(other) & self.bits[id(task)])
+
+    def set_run_after(self, task, other) :
+        """ Have task run after other """
+        if other in task.run_after :
+            return
+        task.set_run_after(other)
+        self.succs.setdefault(id(other), []).append(task)
+        # other and everything it runs after now come before what task does
+        add = self.bits.get(id(task), 0) | self.descendants(task)
+        stack = [other]
+        while stack :
+            t = stack.pop()
+            v = self.after.get(id(t), None)
+            # tasks not yet worked out will be from their successors
+            if v is None or v & add == add :
+                continue
+            self.after[id(t)] = v | add
+            stack.extend(a for a in getattr(t, 'run_after', ()) if id(a) in self.group)
+
+def runs_after(self, task, cache = None) :
+    """ Returns whether this task must run after another task based on run_after """
+    if cache is None : cache = set()
+    stack = [self]
+    while stack :
+        for t in stack.pop().run_after :
+            if t == task : return True
+            if not id(t) in cache :
+                cache.add(id(t))
+                stack.append(t)
+    return False
+
+def top_sort(tasks) :
+    """ Topologically sort the tasks so that they are processed in
+        dependency order. Regardless of what order they were created in. """
+    if not tasks or len(tasks) < 2 : return tasks
+    icntmap = {}
+    amap = {}
+    roots = []
+    for t in tasks :
+        icntmap[id(t)] = 0
+    for t in tasks :
+        # tasks in other groups have already run
+        preds = [a for a in getattr(t, 'run_after', ()) if id(a) in icntmap]
+        icntmap[id(t)] = len(preds)
+        if not preds : roots.append(t)
+        for a in preds :
+            if id(a) in amap :
+                amap[id(a)].append(t)
+            else :
+                amap[id(a)] = [t]
+    res = []
+    for r in roots :
+        res.append(r)
+        if id(r) in amap :
+            for a in amap[id(r)] :
+                icntmap[id(a)] -= 1
+                if icntmap[id(a)] == 0 :
+                    roots.append(a)
+    # what is left is in a circle or comes after one
+    left = [t for t in tasks if icntmap.get(id(t), 0)]
+    if left :
+        for t in left :
+            Logs.error("Circular dependency: " + str(t))
+            Logs.error("   comes after: " + str(t.run_after))
+        raise Errors.WafError("Circular dependency between %d tasks" % len(left))
+    if Logs.verbose :
+        Logs.debug("order: " + "\n".join(map(repr,res)))
+        for r in res :
+            Logs.debug("after: " + str(r) + " comes after " + str(r.run_after))
+    return res
+
+def content_signed(task) :
+    """ Is a reader of task's outputs signed by their contents alone? A
+        task generator can ask for this with contentsigned, but only along
+        with update_outputs. That has waf set each output's node signature
+        from the file's contents after the task runs, and the reader's
+        signature includes the signatures of its input nodes, so any change
+        in what the producer wrote is seen. Adding the producer's own
+        signature would only have the reader run again when the producer
+        does, even if it wrote the same thing. """
+    gen = task.generator
+    return getattr(gen, 'contentsigned', False) and getattr(gen, 'update_outputs', False)
+
+def inject_modifiers(tasks) :
+    """ Sort out run_after dependency tree taking modifiers into account.
+        Works out where in a chain of modifications a particular dependent task
+        should have its direct run_after dependency set. Such tasks are set as
+        late in the chain as possible. """
+    tmap = {}
+    for t in tasks :
+        for n in getattr(t, 'outputs', []) :
+            if id(n) not in tmap : tmap[id(n)] = []
+            tmap[id(n)].append(t)
+    for t in tasks :
+        tmpnode, outnode = getattr(t, 'tempcopy', (None, None))
+        if outnode :
+            if id(outnode) in tmap :
+                try: t.intasks.append(tmap[id(outnode)][-1])
+                except AttributeError : t.intasks = [tmap[id(outnode)][-1]]
+                t.set_run_after(tmap[id(outnode)][-1])
+                tmap[id(outnode)].append(t)
+            else :
+                tmap[id(outnode)] = [t]
+    index = TaskIndex(tasks, list(tmap.values()))
+    for t in tasks :
+        for n in getattr(t, 'inputs', []) :
+            if id(n) in tmap :
+                entry = tmap[id(n)]
+                res = len(entry)
+                if res == 1 :
+                    # the only task making n, which the reader runs after unless
+                    # they make a circle
+                    if id(entry[0]) == id(t) or (entry[0] not in t.run_after and index.runs_after(entry[0], t)) :
+                        res = 0
+                else :
+                    for i in range(res) :
+                        if id(entry[i]) == id(t) or index.runs_after(entry[i], t) :
+                            res = i
+                            break
+                if res :
+                    e = entry[res - 1]
+                    if not content_signed(e) and not keyed(t, n) :
+                        try: t.intasks.append(e)
+                        except AttributeError : t.intasks = [e]
+                    index.set_run_after(t, e)
+
+def prioritise(tasks, times) :
+    """ Give each task a priority of the expected time from its start to
+        the end of the longest chain of tasks that must run after it, using
+        the times tasks took last time. Returns the tasks in decreasing
+        priority, which is still a topological order. """
+    if not tasks or len(tasks) < 2 : return tasks
+    durations = {}
+    for t in tasks :
+        try : durations[id(t)] = times[t.uid()]
+        except (KeyError, AttributeError) : pass
+    if durations :
+        known = sorted(durations.values())
+        default = known[len(known) // 2]
+    else :
+        default = 1.
+    succs = {}
+    for t in tasks :
+        for a in getattr(t, 'run_after', []) :
+            if id(a) in succs :
+                succs[id(a)].append(t)
+            else :
+                succs[id(a)] = [t]
+    for t in reversed(tasks) :
+        cost = max(durations.get(id(t), default), 0.001)
+        t.priority = cost + max([getattr(s, 'priority', 0) for s in succs.get(id(t), [])] or [0])
+    return sorted(tasks, key=lambda t: -t.priority)
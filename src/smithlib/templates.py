@@ -76,6 +76,27 @@ TestCommand = {
     'cell_tail' : "</td>"
 }
 
+RefShape = {
+    'head' : """<!DOCTYPE html>
+<html><head>
+<meta charset="utf-8">
+<title>{0}</title>
+<style>
+td {{ padding: 2px 7px; vertical-align: top; }}
+.glyphs {{ font-family: monospace; }}
+</style>
+</head><body>
+<p>Text: {0}<br>Font: {1}<br>Reference: {2}<br>Script: {3} Language: {4} Features: {5}</p>
+<table>
+<tr><th>Line</th><th>Text</th><th>Reference</th><th>Result</th></tr>
+""",
+    'row' : '<tr><td>{0}</td><td>{1}</td><td class="glyphs">{2}</td><td class="glyphs">{3}</td></tr>\n',
+    'tail' : """</table>
+<p>{0} of {1} lines differ</p>
+</body></html>
+"""
+}
+
 FtmlTestCommand = {
     'head' : r'''<?xml version="1.0"?>
 <ftml version="1.0">
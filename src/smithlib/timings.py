@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+''' Task timing history and reports '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+from waflib import Logs
+import os, json, time
+
+HISTFILE = '.smithtimings'
+MAXRUNS = 20
+
+# Each run in the history is stored as
+#   {"time": start, "cmd": command, "jobs": n, "wall": seconds, "tasks": [...]}
+# with each task as a list of
+#   [name, font, wall, cpu, maxrss (kB), cache, [indices of tasks it ran after]]
+# where cache is "hit", "miss" or "" if there is no build cache.
+NAME, FONT, WALL, CPU, RSS, CACHE, DEPS = range(7)
+
+def font_targets(bld) :
+    from smithlib import font
+    res = {}
+    for f in font.Font.fonts :
+        n = bld.bldnode.find_node(str(f.target))
+        if n is not None :
+            res[id(n)] = str(f.target)
+    return res
+
+def font_of(task, targets) :
+    """ The font a task makes or modifies, else the first font it uses """
+    nodes = []
+    tempcopy = getattr(task, 'tempcopy', None)
+    if tempcopy :
+        nodes.append(tempcopy[1].get_bld())
+    nodes.extend(getattr(task, 'outputs', []))
+    nodes.extend(getattr(task, 'inputs', []))
+    for n in nodes :
+        if id(n) in targets :
+            return targets[id(n)]
+    return ""
+
+def task_name(task) :
+    return getattr(task.generator, 'name', None) or task.__class__.__name__
+
+def record_run(bld) :
+    """ Add the tasks run by this build to the history in the build directory """
+    start = bld.compile_start
+    tasks = [t for t in getattr(bld, 'returned_tasks', []) if hasattr(t, 'duration')]
+    if not tasks : return
+    targets = font_targets(bld)
+    index = dict((id(t), i) for i, t in enumerate(tasks))
+    caching = bool(bld.cache_global and not bld.nocache)
+    entries = []
+    for t in tasks :
+        cache = ("hit" if getattr(t, 'cached', False) and not getattr(t, 'cache_missed', False) else "miss") if caching else ""
+        entries.append([task_name(t), font_of(t, targets), round(t.duration, 4),
+                        round(getattr(t, 'cputime', 0.), 4), getattr(t, 'maxrss', 0), cache,
+                        sorted(index[id(x)] for x in getattr(t, 'run_after', []) if id(x) in index)])
+    run = {'time' : start, 'cmd' : bld.cmd, 'jobs' : bld.jobs,
+           'wall' : round(time.time() - start, 4), 'tasks' : entries}
+    path = os.path.join(bld.variant_dir, HISTFILE)
+    runs = load_history(path)
+    runs.append(run)
+    runs = runs[-MAXRUNS:]
+    try :
+        with open(path + '.tmp', 'w') as f :
+            json.dump(runs, f, separators=(',', ':'))
+        os.replace(path + '.tmp', path)
+    except OSError as e :
+        Logs.warn("Could not save task timings: %s" % e)
+
+def load_history(path) :
+    try :
+        with open(path) as f :
+            return json.load(f)
+    except (OSError, ValueError) :
+        return []
+
+def critical_path(tasks) :
+    """ Returns the indices of the chain of tasks with the greatest total time """
+    best = {}
+    for i, t in enumerate(tasks) :      # tasks are recorded after those they depend on
+        prev = max([x for x in t[DEPS] if x in best], key=lambda x: best[x][0], default=None)
+        if prev is None :
+            best[i] = (t[WALL], [i])
+        else :
+            best[i] = (best[prev][0] + t[WALL], best[prev][1] + [i])
+    if not best : return (0., [])
+    return max(best.values(), key=lambda x: x[0])
+
+def make_report(runs, count = 20) :
+    """ Analyse the last run in the history, returning a dict """
+    run = runs[-1]
+    tasks = run['tasks']
+    res = {'time' : run['time'], 'cmd' : run['cmd'], 'jobs' : run['jobs'], 'wall' : run['wall'],
+           'tasks' : len(tasks), 'cpu' : round(sum(t[CPU] for t in tasks), 4)}
+    keys = ('name', 'font', 'wall', 'cpu', 'maxrss', 'cache')
+    res['slowest'] = [dict(zip(keys, t[:DEPS])) for t in sorted(tasks, key=lambda x: -x[WALL])[:count]]
+    fonts = {}
+    for t in tasks :
+        if not t[FONT] : continue
+        f = fonts.setdefault(t[FONT], {'tasks' : 0, 'wall' : 0., 'cpu' : 0., 'hits' : 0})
+        f['tasks'] += 1
+        f['wall'] += t[WALL]
+        f['cpu'] += t[CPU]
+        if t[CACHE] == 'hit' : f['hits'] += 1
+    for f in fonts.values() :
+        f['wall'] = round(f['wall'], 4)
+        f['cpu'] = round(f['cpu'], 4)
+    res['fonts'] = fonts
+    length, path = critical_path(tasks)
+    res['critical_path'] = {'wall' : round(length, 4), 'tasks' : [dict(zip(keys, tasks[i][:DEPS])) for i in path]}
+    res['regressions'] = []
+    prev = [r for r in runs[:-1] if r['cmd'] == run['cmd']]
+    if prev :
+        before = {}
+        for t in prev[-1]['tasks'] :
+            before[t[NAME]] = before.get(t[NAME], 0.) + t[WALL]
+        now = {}
+        for t in tasks :
+            now[t[NAME]] = now.get(t[NAME], 0.) + t[WALL]
+        for k, v in now.items() :
+            # ignore noise in short tasks
+            if k in before and v > before[k] * 1.2 and v - before[k] > 0.5 :
+                res['regressions'].append({'name' : k, 'before' : round(before[k], 4), 'after' : round(v, 4)})
+        res['regressions'].sort(key=lambda x: x['before'] - x['after'])
+    return res
+
+def format_report(rep) :
+    lines = []
+    lines.append("'%s' at %s: %d tasks, %.2fs elapsed, %.2fs cpu, -j%d" % (rep['cmd'],
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(rep['time'])), rep['tasks'],
+                rep['wall'], rep['cpu'], rep['jobs']))
+    lines.append("")
+    lines.append("Slowest tasks:")
+    lines.append("%9s %9s %9s %5s  %s" % ("wall", "cpu", "rss(MB)", "cache", "task"))
+    for t in rep['slowest'] :
+        lines.append("%9.2f %9.2f %9.1f %5s  %s" % (t['wall'], t['cpu'], t['maxrss'] / 1024., t['cache'], t['name']))
+    if rep['fonts'] :
+        lines.append("")
+        lines.append("Per font:")
+        lines.append("%9s %9s %6s %5s  %s" % ("wall", "cpu", "tasks", "hits", "font"))
+        for k, v in sorted(rep['fonts'].items(), key=lambda x: -x[1]['wall']) :
+            lines.append("%9.2f %9.2f %6d %5d  %s" % (v['wall'], v['cpu'], v['tasks'], v['hits'], k))
+    lines.append("")
+    lines.append("Critical path (%.2fs):" % rep['critical_path']['wall'])
+    for t in rep['critical_path']['tasks'] :
+        lines.append("%9.2f  %s" % (t['wall'], t['name']))
+    if rep['regressions'] :
+        lines.append("")
+        lines.append("Slower than the previous '%s':" % rep['cmd'])
+        for r in rep['regressions'] :
+            lines.append("%9.2f -> %6.2f  %s" % (r['before'], r['after'], r['name']))
+    return "\n".join(lines)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+''' Variable fonts built a master at a time '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+from waflib import Logs, Utils
+from smithlib.procpool import pool_rule
+from xml.etree import ElementTree as et
+import os, pickle, shlex
+import importlib.util
+
+# fontmake builds a variable font from a designspace in one go. Instead we can
+# compile each master to an interpolatable TTF in its own task and then merge
+# them with varLib, as fontmake does when it can't build variable features.
+# The masters' curves must be converted to quadratics together for them to
+# stay compatible, so one task does just that for all of them, writing the
+# converted outlines of each master to its own file. A master's compile task
+# depends on its UFO and that file, so an edit to one master rarely leads to
+# recompiling the others.
+#
+# Making the tasks only reads the designspace's XML, so that a build that
+# has nothing to do for the font doesn't open it and every UFO. What can only
+# be known from the UFOs, that they use ufo2ft filters or that there is no
+# default master, is found by the curve conversion task. It then writes empty
+# outlines files, the compile tasks empty TTFs and the merge task runs
+# fontmake on the designspace as a font() without buildmasters would.
+
+FILTERSKEY = 'com.github.googlei18n.ufo2ft.filters'
+MAXERR = 0.001      # of the em, as ufo2ft
+
+def have_ufo2ft() :
+    return all(importlib.util.find_spec(m) is not None for m in ('ufo2ft', 'ufoLib2'))
+
+def masters(dspath) :
+    """ Returns the master UFO paths of a designspace if we can build it a
+        master at a time, else None """
+    if not os.path.isfile(dspath) or not have_ufo2ft() :
+        return None
+    try :
+        doc = et.parse(dspath).getroot()
+    except (et.ParseError, OSError) :
+        return None
+    # discrete axes have values rather than a range
+    if any(a.get('values') is not None for a in doc.iter('axis')) or len(doc.findall('variable-fonts/variable-font')) > 1 :
+        return None
+    res = []
+    base = os.path.dirname(os.path.abspath(dspath))
+    for s in doc.findall('sources/source') :
+        # sparse masters need fontmake
+        path = s.get('filename')
+        if s.get('layer') is not None or not path :
+            return None
+        path = os.path.normpath(os.path.join(base, path))
+        if not os.path.isdir(path) :
+            return None
+        res.append(path)
+    return res or None
+
+def build_masters(bld, font, srcnode, targetnode, parms = "") :
+    """ Create the tasks that build font from srcnode. Returns the task
+        generator of the final merge, or None if it must be built by fontmake.
+        parms are for fontmake if it turns out to be needed after all """
+    paths = masters(srcnode.abspath())
+    ufos = [bld.root.find_node(p) for p in paths] if paths is not None else [None]
+    if any(x is None for x in ufos) :
+        Logs.warn("Can't build %s a master at a time, using fontmake" % font.target)
+        return None
+    base = os.path.splitext(font.target)[0] + "_masters/"
+    stems = ["{}{}-{}".format(base, i, os.path.splitext(os.path.basename(p))[0]) for i, p in enumerate(paths)]
+    quads = [bld.path.find_or_declare(s + ".quad") for s in stems]
+    ttfs = [bld.path.find_or_declare(s + ".ttf") for s in stems]
+    # the compile tasks depend on the content of their outlines file, not on this task
+    bld(rule = pool_rule(make_quadratic, MAXERR), source = [srcnode] + ufos, target = quads, update_outputs = True,
+        contentsigned = True)
+    for u, q, t in zip(ufos, quads, ttfs) :
+        bld(rule = pool_rule(compile_master), source = [srcnode, u, q], target = t)
+    return bld(rule = merge_rule(parms), source = [srcnode] + ufos + ttfs, target = targetnode,
+               name = font.target + "_ttf")
+
+def make_quadratic(maxerr, task) :
+    """ Convert the curves of all the masters together and save the outlines
+        of each, or no outlines if fontmake must build the font """
+    import ufoLib2
+    from fontTools.cu2qu.ufo import fonts_to_quadratic
+    from fontTools.designspaceLib import DesignSpaceDocument
+    fonts = [ufoLib2.Font.open(x.abspath()) for x in task.inputs[1:]]
+    # filters that run before curve conversion need fontmake
+    if DesignSpaceDocument.fromfile(task.inputs[0].abspath()).findDefault() is None \
+            or any(FILTERSKEY in f.lib for f in fonts) :
+        for out in task.outputs :
+            with open(out.abspath(), 'wb') as fh :
+                pickle.dump(None, fh, 4)
+        return 0
+    fonts_to_quadratic(fonts, max_err_em = maxerr, reverse_direction = True)
+    for f, out in zip(fonts, task.outputs) :
+        outlines = {}
+        for name in sorted(f.keys()) :
+            outlines[name] = [[(p.x, p.y, p.type, p.smooth) for p in c] for c in f[name].contours]
+        with open(out.abspath(), 'wb') as fh :
+            pickle.dump(outlines, fh, 4)
+    return 0
+
+def compile_master(task) :
+    """ Compile a master, with its outlines from make_quadratic, to an
+        interpolatable TTF, or write an empty file if there are none """
+    with open(task.inputs[2].abspath(), 'rb') as f :
+        outlines = pickle.load(f)
+    if outlines is None :
+        task.outputs[0].write(b"", 'wb')
+        return 0
+    import ufo2ft, ufoLib2
+    from fontTools.designspaceLib import DesignSpaceDocument
+    doc = DesignSpaceDocument.fromfile(task.inputs[0].abspath())
+    ufo = ufoLib2.Font.open(task.inputs[1].abspath())
+    for name, contours in outlines.items() :
+        g = ufo[name]
+        g.clearContours()
+        pen = g.getPointPen()
+        for c in contours :
+            pen.beginPath()
+            for x, y, t, s in c :
+                pen.addPoint((x, y), t, s)
+            pen.endPath()
+    # the curves are already quadratic and reversed
+    ttf = next(iter(ufo2ft.compileInterpolatableTTFs([ufo], reverseDirection = False, useProductionNames = False,
+                    skipExportGlyphs = doc.lib.get('public.skipExportGlyphs', None),
+                    postProcessorClass = None)))
+    ttf.save(task.outputs[0].abspath())
+    return 0
+
+def merge_masters(task) :
+    """ Merge the compiled masters into a variable font """
+    import ufoLib2
+    from fontTools import varLib
+    from fontTools.designspaceLib import DesignSpaceDocument
+    from ufo2ft.postProcessor import PostProcessor
+    doc = DesignSpaceDocument.fromfile(task.inputs[0].abspath())
+    num = (len(task.inputs) - 1) // 2
+    ufos = [x.abspath() for x in task.inputs[1:num+1]]
+    ttfs = dict((s.path, t.abspath()) for s, t in zip(doc.sources, task.inputs[num+1:]))
+    vf = varLib.build(doc, master_finder = lambda p : ttfs[p])[0]
+    default = os.path.realpath(doc.findDefault().path)
+    ufo = ufoLib2.Font.open(next(x for x in ufos if os.path.realpath(x) == default))
+    vf = PostProcessor(vf, ufo, info = doc.lib.get('public.fontInfo', None)).process()
+    vf.save(task.outputs[0].abspath())
+    return 0
+
+def merge_rule(parms) :
+    """ Returns the rule of the merge task, which has fontmake build the font
+        if the masters weren't compiled """
+    merge = pool_rule(merge_masters)
+    def run(task) :
+        num = (len(task.inputs) - 1) // 2
+        if not any(os.path.getsize(x.abspath()) == 0 for x in task.inputs[num+1:]) :
+            return merge(task)
+        Logs.warn("Building %s with fontmake, as its masters use ufo2ft filters or it has no default master"
+                    % task.outputs[0].bldpath())
+        return task.exec_command(Utils.to_list(task.env.FONTMAKE) + shlex.split(parms)
+                    + ['-o', 'variable', '-m', task.inputs[0].abspath(), '--output-path', task.outputs[0].abspath()])
+    run.code = merge.code + repr(parms)
+    return run
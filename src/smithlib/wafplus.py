@@ -8,8 +8,21 @@ __license__ = 'Released under the 3-Clause BSD License (http://opensource.org/li
 
 
 from waflib import Task, Build, Logs, Context, Utils, Configure, Options, Errors, Node
-import os, importlib, types, operator, optparse, sys, re, shlex
+import os, importlib, types, operator, optparse, sys, re, shlex, time
 from waflib.TaskGen import feature, after
+from smithlib.cache import add_build_cache, finish_cache
+from smithlib.hashcache import add_hash_cache, save_hashes
+from smithlib.procpool import stop_pool
+from smithlib.timings import record_run
+from smithlib.fingerprint import add_fingerprint
+from smithlib.builddb import add_builddb
+from smithlib.modifiers import group_modifys
+from smithlib.zygote import add_zygote
+from smithlib.spawn import add_spawn, report_spawns
+from smithlib.tasklogs import add_tasklogs
+from smithlib.tabledeps import add_tabledeps
+from smithlib.taskorder import inject_modifiers, top_sort, prioritise, runs_after
+from smithlib.fastcopy import copy_file
 
 def _parsearg(a, o, res):
     if a.startswith(o['opt']) :
@@ -76,6 +89,9 @@ def process_tempcopy(tgen) :
             t.tgt = outnode
         fn = t.__class__.run
         def f(self) :
+            bld = self.generator.bld
+            if bld.cache_global and not bld.nocache and self.can_retrieve_cache() :
+                return 0
             if os.path.exists(tmpnode.abspath()) :
                 os.remove(tmpnode.abspath())
             Logs.debug("runner: " + outnode.abspath() + "-->" + tmpnode.abspath())
@@ -85,7 +101,8 @@ def process_tempcopy(tgen) :
             else :
                 sourcenode = outnode.get_src()
                 Logs.debug("runner: Can't copy built, copying " + str(sourcenode.abspath()))
-                shutil.copy2(sourcenode.abspath(), tmpnode.abspath())
+                copy_file(sourcenode.abspath(), tmpnode.abspath())
+                shutil.copystat(sourcenode.abspath(), tmpnode.abspath())
                 t.outputs.append(outnode.get_bld())
             ret = fn(self)
             if not ret : os.remove(tmpnode.abspath())
@@ -107,8 +124,10 @@ def process_taskgens(tg) :
         if og :
             t = tg.tasks[0]
             ot = og.tasks[-1]
-            try: t.intasks.append(ot)
-            except AttributeError : t.intasks = [ot]
+            # tables says which parts of the fonts matter, not the tasks that made them
+            if getattr(tg, 'tables', None) is None :
+                try: t.intasks.append(ot)
+                except AttributeError : t.intasks = [ot]
             #if og in tg.bld.get_group(None) :
             t.set_run_after(ot)
 
@@ -183,7 +202,8 @@ def build_modifys(bld) :
                 return cmp(a, b)
         outnode = bld.path.find_or_declare(key)
         # print(key, len(item))
-        for i in sorted(range(len(item)), key=lambda x:(item[x][3].get('late', 0), x)):
+        item = group_modifys([item[x] for x in sorted(range(len(item)), key=lambda x:(item[x][3].get('late', 0), x))])
+        for i in range(len(item)) :
             # print(i, item[i])
             tmpnode = make_tempnode(outnode, bld)
             if 'nochange' in item[i][3] :
@@ -244,101 +264,17 @@ def add_reasons() :
 def add_sort_tasks(base) :
     old_biter = base.get_build_iterator
 
-    def top_sort(tasks) :
-        """ Topologically sort the tasks so that they are processed in
-            dependency order. Regardless of what order they were created in. """
-        if not tasks or len(tasks) < 2 : return tasks
-        icntmap = {}
-        amap = {}
-        roots = []
-        for t in tasks :
-            icntmap[id(t)] = 0
-        for t in tasks :
-            if getattr(t, 'run_after', None) :
-                icntmap[id(t)] = len(t.run_after)
-                if len(t.run_after) == 0 : roots.append(t)
-                for a in t.run_after :
-                    if id(a) in amap :
-                        amap[id(a)].append(t)
-                    else :
-                        amap[id(a)] = [t]
-            else :
-                roots.append(t)
-        res = []
-        for r in roots :
-            res.append(r)
-            if id(r) in amap :
-                for a in amap[id(r)] :
-                    icntmap[id(a)] -= 1
-                    if icntmap[id(a)] == 0 :
-                        roots.append(a)
-        for t in tasks :
-            if icntmap.get(id(t), 0):
-                if any(icntmap.get(id(x), 0) for x in t.run_after):
-                    print("Circular dependency: " + str(t))
-                    print("   comes after: " + str(t.run_after))
-                res.append(t)
-        Logs.debug("order: " + "\n".join(map(repr,res)))
-        for r in res :
-            Logs.debug("after: " + str(r) + " comes after " + str(r.run_after))
-        return res
-
-    def inject_modifiers(tasks) :
-        """ Sort out run_after dependency tree taking modifiers into account.
-            Works out where in a chain of modifications a particular dependent task
-            should have its direct run_after dependency set. Such tasks are set as
-            late in the chain as possible. """
-        tmap = {}
-        for t in tasks :
-            for n in getattr(t, 'outputs', []) :
-                if id(n) not in tmap : tmap[id(n)] = []
-                tmap[id(n)].append(t)
-        for t in tasks :
-            tmpnode, outnode = getattr(t, 'tempcopy', (None, None))
-            if outnode :
-                if id(outnode) in tmap :
-                    try: t.intasks.append(tmap[id(outnode)][-1])
-                    except AttributeError : t.intasks = [tmap[id(outnode)][-1]]
-                    t.set_run_after(tmap[id(outnode)][-1])
-                    tmap[id(outnode)].append(t)
-                else :
-                    tmap[id(outnode)] = [t]
-        for t in tasks :
-            for n in getattr(t, 'inputs', []) :
-                if id(n) in tmap :
-                    entry = tmap[id(n)]
-                    res = len(entry)
-                    for i in range(res) :
-                        if entry[i].runs_after(t) or id(entry[i]) == id(t) :
-                            res = i
-                            break
-                    if res :
-                        e = entry[res - 1]
-                        try: t.intasks.append(e)
-                        except AttributeError : t.intasks = [e]
-                        t.set_run_after(e)
-
     def wrap_biter(self) :
         for b in old_biter(self) :
             inject_modifiers(b)
 #            print(b)
-            tlist = top_sort(b)
+            tlist = prioritise(top_sort(b), getattr(self, 'task_times', {}))
             yield tlist
 #            yield b
 
     base.get_build_iterator = wrap_biter
     Task.TaskBase.runs_after = runs_after
 
-def runs_after(self, task, cache = set()) :
-    """ Returns whether this task must run after another task based on run_after """
-    res = False
-    for t in self.run_after :
-        if t == task : return True
-        if not id(t) in cache :
-            cache.add(id(t))
-            res = res or t.runs_after(task, cache = cache)
-    return res
-
 def add_build_wafplus() :
     old_pre_recurse = Context.Context.pre_recurse
 
@@ -372,6 +308,28 @@ def add_build_wafplus() :
     Build.BuildContext.pre_build = pre_build
     Build.BuildContext.execute = execute
 
+def add_compile_ends(*fns) :
+    """ Call each of fns with the build context when the build has run its
+        tasks, even if it failed, and even if an earlier one of fns fails.
+        bld.compile_start is when the tasks started. """
+    old_compile = Build.BuildContext.compile
+
+    def finish(bld, fns) :
+        if not fns : return
+        try :
+            fns[0](bld)
+        finally :
+            finish(bld, fns[1:])
+
+    def compile(bld) :
+        bld.compile_start = time.time()
+        try :
+            old_compile(bld)
+        finally :
+            finish(bld, fns)
+
+    Build.BuildContext.compile = compile
+
 def add_unicode_exec() :
     """ tweak to allow commands to be passed unicode strings and to run
         commands containing unicode characters
@@ -402,13 +360,20 @@ def add_options() :
         gr.add_option('-r','--release', action = 'store_true', help = 'Build for release, no special version numbers')
         gr.add_option('--standards', help = 'Alternative source of base files for testing')
         gr.add_option('--extratestdir', help = 'Set the EXTRATESTDIR from a ; separated list of paths')
+        gr.add_option('--procpool', type = 'int', default = 0, help = 'Run python task functions in this many worker processes, rather than threads')
+        gr.add_option('--json', action = 'store_true', help = 'Output reports, such as profile, as JSON')
+        gr.add_option('--cachesize', help = 'Maximum size of the WAFCACHE build cache, e.g. 2G [5G]')
+        gr.add_option('--zygote', action = 'store_true', help = 'Run python console script tools in processes forked from one with fontTools etc. already imported')
+        gr.add_option('--tasklogs', action = 'store_true', help = 'Write the output of each task to a log in .smithlogs in the build directory, showing the end of it if the task fails')
+        gr.add_option('--useshell', action = 'store_true', help = 'Run rule commands through the shell even when they need none of its features')
+        gr.add_option('--batchtests', action = 'store_true', help = "Batch the runs of tests that don't set batch, a few tasks for each font and shaper")
+        gr.add_option('--nofingerprint', action = 'store_true', help = "Run the whole build even if nothing has changed since the last one")
 
     Options.opt_parser.__init__ = init
 
 def patch_waf() :
     """ Patch various waflib methods and functions:
             Node.find_resource
-            Utils.h_file
     """
     def find_resource(self, lst):
         if isinstance(lst, str):
@@ -423,24 +388,6 @@ def patch_waf() :
         return node
     Node.Node.find_resource = find_resource
 
-    def h_file(filename) :
-        m = Utils.md5()
-        if os.path.isdir(filename) :
-            for (dp, ds, fs) in os.walk(filename) :
-                st = os.stat(dp)
-                m.update(str(st.st_mtime).encode("utf-8"))
-                m.update(str(st.st_size).encode("utf-8"))
-                m.update(dp.encode("utf-8"))
-        else :
-            f = open(filename, 'rb')
-            try :
-                while filename :
-                    filename = f.read(100000)
-                    m.update(filename)
-            finally :
-                f.close()
-        return m.digest()
-    Utils.h_file = h_file
 
 def make_dot(self):
     self.restore()
@@ -537,6 +484,15 @@ add_reasons()
 add_intasks(Task.Task)
 add_build_wafplus()
 add_options()
+add_build_cache()
+add_hash_cache()
+add_fingerprint()
+add_builddb()
+add_tasklogs()
+add_spawn()
+add_zygote()
+add_tabledeps()
+add_compile_ends(finish_cache, save_hashes, stop_pool, record_run, report_spawns)
 patch_waf()
 #add_unicode_exec()
 Context.load_module = load_module
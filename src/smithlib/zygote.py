@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+''' Pre-imported worker for python console script tools '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+import os, sys, re, pickle, shlex, shutil, signal, socket, struct, threading, atexit, array
+
+# Most of the tools smith runs (psfufo2ttf, psfbuildfea, makefea, ...) are
+# python console scripts that spend much of a small task starting python and
+# importing fontTools. With --zygote, smith starts one python process (the
+# zygote) that imports the heavy modules once and then forks a child for each
+# such command. The child changes to the task's directory and environment,
+# sets sys.argv and calls the script's entry point, with the same stdout and
+# stderr a subprocess would have, or those the command was given. Anything
+# that is not a plain call of a console script for this python, or any
+# trouble with the zygote, runs the command as a subprocess as usual.
+#
+# Requests go down a socket and results come back on a pipe, each as a
+# pickle. A request starts with its length, sent with any file descriptors
+# the command's output is to go to (as --tasklogs gives), which the child
+# puts in place of its stdout and stderr. A child writes its own result, in a
+# single write so that results don't interleave, then exits. The zygote
+# then reports the exit status of every child it reaps, for those that die
+# or exit without writing a result.
+
+preload = ('fontTools.ttLib', 'fontTools.feaLib.builder', 'fontTools.designspaceLib',
+           'ufoLib2', 'defcon', 'ufo2ft', 'silfont.core')
+
+_scripts = {}
+_zygote = None
+_zygotelock = threading.Lock()
+
+def script_entry(path) :
+    """ Returns (module, function) if path is a console script that this
+        python could run, else None """
+    if path in _scripts : return _scripts[path]
+    res = None
+    try :
+        with open(path, 'rb') as f :
+            text = f.read(4096).decode('utf-8')
+    except (OSError, UnicodeDecodeError) :
+        text = ''
+    lines = text.splitlines()
+    if lines and lines[0].startswith('#!') and same_python(lines[0][2:].split()) :
+        m = re.search(r'^from ([\w.]+) import (\w+)\s*$', text, re.M)
+        if m and 'sys.exit(' in text :
+            import importlib.util
+            try :
+                if importlib.util.find_spec(m.group(1)) is not None :
+                    res = (m.group(1), m.group(2))
+            except (ImportError, ValueError) :
+                pass
+    _scripts[path] = res
+    return res
+
+def same_python(shebang) :
+    if not shebang : return False
+    exe = shebang[0]
+    if os.path.basename(exe) == 'env' and len(shebang) > 1 :
+        exe = shutil.which(shebang[1])
+        if exe is None : return False
+    if os.path.abspath(exe) == os.path.abspath(sys.executable) :
+        return True
+    # a venv's python links to the real one but has its own site-packages
+    return sys.prefix == sys.base_prefix and os.path.realpath(exe) == os.path.realpath(sys.executable)
+
+def command_words(cmd) :
+    """ Returns the words of a shell command that uses no shell features
+        other than quoting and variable assignments, else None """
+    if re.search(r'[$`*?\[\]~#\n]', cmd) :
+        return None
+    try :
+        lex = shlex.shlex(cmd, posix = True, punctuation_chars = True)
+        lex.whitespace_split = True
+        words = list(lex)
+    except ValueError :
+        return None
+    if not words or any(a and all(c in '();<>|&' for c in a) for a in words) :
+        return None
+    return words
+
+def command_argv(cmd) :
+    """ Returns the argv of a command that needs no shell, else None """
+    if isinstance(cmd, (list, tuple)) :
+        return [str(x) for x in cmd] if cmd else None
+    argv = command_words(cmd)
+    if not argv or '=' in argv[0] :
+        return None
+    return argv
+
+class Zygote(object) :
+
+    def __init__(self) :
+        from waflib import Utils
+        r, w = os.pipe()
+        self.sock, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        srcdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        boot = "import sys; sys.path.insert(0, %r); from smithlib.zygote import serve; serve()" % srcdir
+        self.proc = Utils.subprocess.Popen([sys.executable, '-c', boot, str(w), str(theirs.fileno())] + list(preload),
+                        stdin = Utils.subprocess.DEVNULL, pass_fds = (w, theirs.fileno()), close_fds = True)
+        os.close(w)
+        theirs.close()
+        self.results = os.fdopen(r, 'rb')
+        self.lock = threading.Lock()
+        self.waiting = {}
+        self.count = 0
+        self.alive = True
+        self.reader = threading.Thread(target = self.read_results)
+        self.reader.daemon = True
+        self.reader.start()
+
+    def read_results(self) :
+        while True :
+            try :
+                rid, res = pickle.load(self.results)
+            except Exception :
+                break
+            with self.lock :
+                w = self.waiting.pop(rid, None)
+            if w is not None :
+                w[1] = res
+                w[0].set()
+        with self.lock :
+            self.alive = False
+            waiting = list(self.waiting.values())
+            self.waiting = {}
+        for w in waiting :
+            w[0].set()
+
+    def run(self, entry, argv, cwd, env, fds = ()) :
+        """ Returns (status, cpu, maxrss), or None if the zygote couldn't run it.
+            fds is a list of (fd in the child, our fd to put there) """
+        w = [threading.Event(), None]
+        with self.lock :
+            if not self.alive : return None
+            self.count += 1
+            rid = self.count
+            self.waiting[rid] = w
+            data = pickle.dumps((rid, entry, argv, cwd, env, [x[0] for x in fds]), pickle.HIGHEST_PROTOCOL)
+            anc = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', [x[1] for x in fds]))] if fds else []
+            try :
+                self.sock.sendmsg([struct.pack(">L", len(data))], anc)
+                self.sock.sendall(data)
+            except (OSError, ValueError) :
+                self.alive = False
+                del self.waiting[rid]
+                return None
+        w[0].wait()
+        return w[1]
+
+    def close(self) :
+        try :
+            self.sock.close()
+        except OSError :
+            pass
+        self.proc.wait()
+
+def get_zygote() :
+    global _zygote
+    with _zygotelock :
+        if _zygote is None :
+            _zygote = Zygote()
+            atexit.register(shutdown)
+        return _zygote
+
+def shutdown() :
+    global _zygote
+    with _zygotelock :
+        if _zygote is not None :
+            _zygote.close()
+            _zygote = None
+
+def run_command(cmd, cwd, env, stdout = None, stderr = None) :
+    """ Run cmd in the zygote if we can. Returns the exit status or None.
+        stdout and stderr may be file descriptors for the output """
+    argv = command_argv(cmd)
+    if argv is None : return None
+    exe = argv[0] if os.path.isabs(argv[0]) else shutil.which(argv[0])
+    entry = script_entry(exe) if exe else None
+    if entry is None : return None
+    fds = [(i, fd) for i, fd in ((1, stdout), (2, stderr)) if fd is not None]
+    res = get_zygote().run(entry, [exe] + argv[1:], cwd or os.getcwd(), dict(env if env is not None else os.environ), fds)
+    if res is None : return None
+    from waflib import Utils
+    status, cpu, maxrss = res
+    Utils.add_child_usage(cpu, maxrss)
+    return status
+
+def call_script(fn) :
+    """ Call a console script entry point, with sys.argv set, and return its
+        exit status """
+    try :
+        res = fn()
+        return res if isinstance(res, int) else (0 if res is None else 1)
+    except SystemExit as e :
+        if e.code is None :
+            return 0
+        elif isinstance(e.code, int) :
+            return e.code
+        sys.stderr.write(str(e.code) + "\n")
+        return 1
+
+# The zygote process
+
+def child(resfd, rid, entry, argv, cwd, env, fds) :
+    """ Run a console script entry point in a forked child, with the
+        (fd, received fd) pairs in fds in place. Never returns """
+    import importlib, random, resource, traceback
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, [signal.SIGCHLD])
+    status = 1
+    try :
+        nul = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(nul, 0)
+        os.close(nul)
+        for dest, fd in fds :
+            os.dup2(fd, dest)
+        for fd in set(x[1] for x in fds) :
+            os.close(fd)
+        random.seed()
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(env)
+        sys.argv = argv
+        sys.path[0] = os.path.dirname(argv[0])
+        status = call_script(getattr(importlib.import_module(entry[0]), entry[1]))
+    except BaseException :
+        traceback.print_exc()
+        status = 1
+    try :
+        sys.stdout.flush()
+        sys.stderr.flush()
+    except Exception :
+        pass
+    ru = resource.getrusage(resource.RUSAGE_SELF)
+    os.write(resfd, pickle.dumps((rid, (status & 0xff, ru.ru_utime + ru.ru_stime, ru.ru_maxrss)), pickle.HIGHEST_PROTOCOL))
+    os._exit(status & 0xff)
+
+def recv_exact(sock, n) :
+    res = b""
+    while len(res) < n :
+        data = sock.recv(n - len(res))
+        if not data :
+            raise EOFError
+        res += data
+    return res
+
+def recv_request(sock) :
+    """ Returns a request and the fds that came with it """
+    fds = array.array('i')
+    head, anc, flags, addr = sock.recvmsg(4, socket.CMSG_SPACE(2 * fds.itemsize))
+    if not head :
+        raise EOFError
+    for level, kind, data in anc :
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS :
+            fds.frombytes(data[:len(data) - (len(data) % fds.itemsize)])
+    head += recv_exact(sock, 4 - len(head))
+    req = pickle.loads(recv_exact(sock, struct.unpack(">L", head)[0]))
+    return req, list(fds)
+
+def serve() :
+    """ Main loop of the zygote: sys.argv is the result fd, the request
+        socket fd and modules to preload """
+    import importlib
+    resfd = int(sys.argv[1])
+    reqs = socket.socket(fileno = int(sys.argv[2]))
+    for m in sys.argv[3:] :
+        try :
+            importlib.import_module(m)
+        except Exception :
+            pass
+    running = {}
+
+    def reap(signum, frame) :
+        while True :
+            try :
+                pid, st = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError :
+                return
+            if pid == 0 : return
+            rid = running.pop(pid, None)
+            # a child that wrote its result has this one ignored
+            if rid is not None :
+                status = -os.WTERMSIG(st) if os.WIFSIGNALED(st) else os.WEXITSTATUS(st)
+                os.write(resfd, pickle.dumps((rid, (status, 0., 0)), pickle.HIGHEST_PROTOCOL))
+
+    signal.signal(signal.SIGCHLD, reap)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)     # smith deals with ^C
+    while True :
+        try :
+            (rid, entry, argv, cwd, env, dests), fds = recv_request(reqs)
+        except (EOFError, OSError) :
+            break
+        # warm the module for the next time
+        try :
+            importlib.import_module(entry[0])
+        except Exception :
+            pass
+        # don't reap the child before we know which request it is for
+        signal.pthread_sigmask(signal.SIG_BLOCK, [signal.SIGCHLD])
+        pid = os.fork()
+        if pid == 0 :
+            child(resfd, rid, entry, argv, cwd, env, list(zip(dests, fds)))
+        for fd in fds :
+            os.close(fd)
+        running[pid] = rid
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, [signal.SIGCHLD])
+
+def add_zygote() :
+    from waflib import Context, Options
+    old_exec = Context.Context.exec_command
+
+    def exec_command(self, cmd, **kw) :
+        if getattr(Options.options, 'zygote', False) and not self.logger and hasattr(os, 'fork') \
+                and not (set(kw.keys()) - set(['cwd', 'env', 'shell', 'stdout', 'stderr'])) \
+                and all(kw.get(x, None) is None or (isinstance(kw[x], int) and kw[x] >= 0) for x in ('stdout', 'stderr')) :
+            res = run_command(cmd, kw.get('cwd', None), kw.get('env', None), kw.get('stdout', None), kw.get('stderr', None))
+            if res is not None :
+                return res
+        return old_exec(self, cmd, **kw)
+
+    Context.Context.exec_command = exec_command
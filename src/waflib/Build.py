@@ -27,7 +27,7 @@ INSTALL = 1337
 UNINSTALL = -1337
 """Negative value '<-' uninstall, see :py:attr:`waflib.Build.BuildContext.is_install`"""
 
-SAVED_ATTRS = 'root node_deps raw_deps task_sigs'.split()
+SAVED_ATTRS = 'root node_deps raw_deps task_sigs task_times'.split()
 """Build class members to save between the runs (root, node_deps, raw_deps, task_sigs)"""
 
 CFG_FILES = 'cfg_files'
@@ -86,6 +86,9 @@ class BuildContext(Context.Context):
 		self.raw_deps = {}
 		"""Dict of custom data returned by :py:meth:`waflib.Task.Task.scan` (persists between build executions)"""
 
+		self.task_times = {}
+		"""Time taken to run each task, keyed by task uid (persists between build executions)"""
+
 		# list of folders that are already scanned
 		# so that we do not need to stat them one more time
 		self.cache_dir_contents = {}
@@ -290,7 +293,9 @@ class BuildContext(Context.Context):
 						Logs.debug('build: could not pickle the build cache %s: %r' % (dbfn, e))
 					else:
 						for x in SAVED_ATTRS:
-							setattr(self, x, data[x])
+							# databases from older versions may lack newer attributes
+							if x in data:
+								setattr(self, x, data[x])
 				finally:
 					waflib.Node.pickle_lock.release()
 		finally:
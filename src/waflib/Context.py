@@ -26,6 +26,9 @@ ABI = 98
 DBFILE = '.smithpickle-%d' % ABI
 """Name of the pickle file for storing the build data"""
 
+SQLDBFILE = '.smithdb-%d.sqlite' % ABI
+"""Name of the sqlite build database, see :py:mod:`smithlib.builddb`"""
+
 APPNAME = 'APPNAME'
 """Default application name (used by ``waf dist``)"""
 
@@ -169,7 +172,7 @@ class Context(ctx):
 		# binds the context to the nodes in use to avoid a context singleton
 		class node_class(waflib.Node.Node):
 			pass
-		self.node_class = type('Nod3', (waflib.Node.Node,), {})
+		self.node_class = type('Nod3', (waflib.Node.Node,), {'__slots__' : ()})
 		self.node_class.__module__ = "waflib.Node"
 		# self.node_class.__name__ = "Nod3"
 		self.node_class.ctx = self
@@ -334,7 +337,7 @@ class Context(ctx):
 				return p.returncode
 			else:
 				p = subprocess.Popen(cmd, **kw)
-				return p.wait()
+				return Utils.wait_process(p)
 		except OSError:
 			return -1
 
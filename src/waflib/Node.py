@@ -101,7 +101,8 @@ class Node(object):
 
 	__slots__ = ('name', 'sig', 'children', 'parent', 'cache_abspath', 'cache_isdir')
 	def __init__(self, name, parent):
-		self.name = name
+		# the same names recur in every ufo, share the strings
+		self.name = name = sys.intern(name)
 		self.parent = parent
 
 		if parent:
@@ -111,7 +112,7 @@ class Node(object):
 
 	def __setstate__(self, data):
 		"Deserializes from data"
-		self.name = data[0]
+		self.name = sys.intern(data[0])
 		self.parent = data[1]
 		if data[2] is not None:
 			self.children = data[2]
@@ -830,6 +831,6 @@ pickle_lock = Utils.threading.Lock()
 
 class Nod3(Node):
 	"""Mandatory subclass for thread-safe node serialization"""
-	pass # do not remove
+	__slots__ = () # do not remove, nodes have no __dict__
 
 
@@ -7,16 +7,17 @@ Runner.py: Task scheduling and execution
 
 """
 
-import random, atexit
+import heapq, atexit
 try:
 	from queue import Queue
 except:
 	from Queue import Queue
 from waflib import Utils, Task, Errors
 
-GAP = 10
+GAP = 1
 """
-Wait for free tasks if there are at least ``GAP * njobs`` in queue
+Wait for free tasks if there are at least ``GAP * njobs`` in queue. Keeping the queue
+short lets the tasks with the highest :py:attr:`waflib.Task.TaskBase.priority` go first
 """
 
 class TaskConsumer(Utils.threading.Thread):
@@ -120,6 +121,15 @@ class Parallel(object):
 		self.frozen = []
 		"""List of :py:class:`waflib.Task.TaskBase` that cannot be executed immediately"""
 
+		self.waiting = {}
+		"""Tasks that cannot be executed until a particular task has run, keyed by the id of that task"""
+
+		self.released = []
+		"""Heap of tasks whose blocking task has run, ordered by priority"""
+
+		self.seq = 0
+		"""Tie breaker for the heap of released tasks"""
+
 		self.out = Queue(0)
 		"""List of :py:class:`waflib.Task.TaskBase` returned by the task consumers"""
 
@@ -147,54 +157,80 @@ class Parallel(object):
 
 		:rtype: :py:class:`waflib.Task.TaskBase`
 		"""
+		if self.released:
+			if not self.outstanding or -self.released[0][0] >= getattr(self.outstanding[0], 'priority', 0):
+				return heapq.heappop(self.released)[2]
 		if not self.outstanding:
 			return None
 		return self.outstanding.pop(0)
 
 	def postpone(self, tsk):
 		"""
-		A task cannot be executed at this point, put it in the list :py:attr:`waflib.Runner.Parallel.frozen`.
+		A task cannot be executed at this point. If it waits on a task that has not run, then
+		keep it in :py:attr:`waflib.Runner.Parallel.waiting` until that task is done, else put it
+		in the list :py:attr:`waflib.Runner.Parallel.frozen`.
 
 		:param tsk: task
 		:type tsk: :py:class:`waflib.Task.TaskBase`
 		"""
-		if random.randint(0, 1):
-			self.frozen.insert(0, tsk)
-		else:
-			self.frozen.append(tsk)
+		for x in getattr(tsk, 'run_after', []):
+			if not x.hasrun:
+				try:
+					self.waiting[id(x)].append(tsk)
+				except KeyError:
+					self.waiting[id(x)] = [tsk]
+				return
+		self.frozen.append(tsk)
+
+	def release(self, tsk):
+		"""
+		A task has run (or been skipped), so the tasks waiting on it may be considered again
+
+		:param tsk: task
+		:type tsk: :py:class:`waflib.Task.TaskBase`
+		"""
+		for x in self.waiting.pop(id(tsk), []):
+			self.seq += 1
+			heapq.heappush(self.released, (-getattr(x, 'priority', 0), self.seq, x))
 
 	def refill_task_list(self):
 		"""
 		Put the next group of tasks to execute in :py:attr:`waflib.Runner.Parallel.outstanding`.
 		"""
-		while self.count > self.numjobs * GAP:
+		while self.count >= self.numjobs * GAP:
 			self.get_out()
 
-		while not self.outstanding:
+		while not self.outstanding and not self.released:
 			if self.count:
 				self.get_out()
-			elif self.frozen:
-				try:
-					cond = self.deadlock == self.processed
-				except:
-					pass
-				else:
-					if cond:
-						msg = 'check the build order for the tasks'
-						for tsk in self.frozen:
-							if not tsk.run_after:
-								msg = 'check the methods runnable_status'
-								break
-						lst = []
-						for tsk in self.frozen:
-							lst.append('%s\t-> %r' % (repr(tsk), [id(x) for x in tsk.run_after]))
-						raise Errors.WafError('Deadlock detected: %s%s' % (msg, ''.join(lst)))
-				self.deadlock = self.processed
+			else:
+				# nothing is running, so whatever is still waiting must be looked at again
+				for lst in self.waiting.values():
+					self.frozen.extend(lst)
+				self.waiting = {}
+				if self.frozen:
+					try:
+						cond = self.deadlock == self.processed
+					except:
+						pass
+					else:
+						if cond:
+							msg = 'check the build order for the tasks'
+							for tsk in self.frozen:
+								if not tsk.run_after:
+									msg = 'check the methods runnable_status'
+									break
+							lst = []
+							for tsk in self.frozen:
+								lst.append('%s\t-> %r' % (repr(tsk), [id(x) for x in tsk.run_after]))
+							raise Errors.WafError('Deadlock detected: %s%s' % (msg, ''.join(lst)))
+					self.deadlock = self.processed
 
 			if self.frozen:
+				self.frozen.sort(key=lambda x: -getattr(x, 'priority', 0))
 				self.outstanding += self.frozen
 				self.frozen = []
-			elif not self.count:
+			elif not self.count and not self.released:
 				self.outstanding.extend(next(self.biter))
 				self.total = self.bld.total()
 				break
@@ -218,6 +254,7 @@ class Parallel(object):
 		:rtype: :py:attr:`waflib.Task.TaskBase`
 		"""
 		tsk = self.out.get()
+		self.release(tsk)
 		if not self.stop:
 			self.add_more_tasks(tsk)
 		self.count -= 1
@@ -303,6 +340,7 @@ class Parallel(object):
 			if tsk.hasrun:
 				# if the task is marked as "run", just skip it
 				self.processed += 1
+				self.release(tsk)
 				continue
 
 			if self.stop: # stop immediately after a failure was detected
@@ -321,6 +359,7 @@ class Parallel(object):
 				tsk.err_msg = Utils.ex_stack()
 				tsk.hasrun = Task.EXCEPTION
 				self.error_handler(tsk)
+				self.release(tsk)
 				continue
 
 			if st == Task.ASK_LATER:
@@ -334,6 +373,7 @@ class Parallel(object):
 			elif st == Task.SKIP_ME:
 				self.processed += 1
 				tsk.hasrun = Task.SKIPPED
+				self.release(tsk)
 				self.add_more_tasks(tsk)
 			else:
 				# run me: put the task in ready queue
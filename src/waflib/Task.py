@@ -6,7 +6,7 @@
 Tasks represent atomic operations such as processes.
 """
 
-import os, shutil, re, tempfile
+import os, shutil, re, tempfile, time
 from waflib import Utils, Logs, Errors
 
 # task states
@@ -236,7 +236,15 @@ class TaskBase(evil):
 		try:
 			self.generator.bld.returned_tasks.append(self)
 			self.log_display(self.generator.bld)
-			ret = self.run()
+			start = time.time()
+			cpu = time.thread_time()
+			Utils.reset_child_usage()
+			try:
+				ret = self.run()
+			finally:
+				self.duration = time.time() - start
+				self.cputime = time.thread_time() - cpu + Utils.child_usage.cpu
+				self.maxrss = Utils.child_usage.maxrss
 		except Exception:
 			self.err_msg = Utils.ex_stack()
 			self.hasrun = EXCEPTION
@@ -259,6 +267,11 @@ class TaskBase(evil):
 				self.hasrun = EXCEPTION
 			else:
 				self.hasrun = SUCCESS
+				# remember how long the task took, to schedule the next build
+				try:
+					self.generator.bld.task_times[self.uid()] = self.duration
+				except AttributeError:
+					pass
 		if self.hasrun != SUCCESS:
 			m.error_handler(self)
 
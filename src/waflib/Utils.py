@@ -196,6 +196,41 @@ def h_file(filename):
 		f.close()
 	return m.digest()
 
+child_usage = threading.local()
+"""Processor time (``cpu``) and peak resident size in kB (``maxrss``) of the processes run by the current thread"""
+
+def reset_child_usage():
+	"""Clear :py:data:`waflib.Utils.child_usage` for the current thread"""
+	child_usage.cpu = 0.0
+	child_usage.maxrss = 0
+
+def add_child_usage(cpu, maxrss):
+	"""Add the processor time and peak resident size of a finished process to :py:data:`waflib.Utils.child_usage`"""
+	child_usage.cpu = getattr(child_usage, 'cpu', 0.0) + cpu
+	child_usage.maxrss = max(getattr(child_usage, 'maxrss', 0), maxrss)
+
+def wait_process(p):
+	"""
+	Wait for a process started with subprocess.Popen and add its resource usage to
+	:py:data:`waflib.Utils.child_usage`
+
+	:param p: process
+	:type p: subprocess.Popen
+	:return: exit status of the process
+	"""
+	if not hasattr(os, 'wait4'):
+		return p.wait()
+	try:
+		pid, status, ru = os.wait4(p.pid, 0)
+	except ChildProcessError:
+		return p.wait()
+	if os.WIFSIGNALED(status):
+		p.returncode = -os.WTERMSIG(status)
+	else:
+		p.returncode = os.WEXITSTATUS(status)
+	add_child_usage(ru.ru_utime + ru.ru_stime, ru.ru_maxrss)
+	return p.returncode
+
 try:
 	x = ''.encode('hex')
 except:
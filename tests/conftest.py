@@ -0,0 +1,9 @@
+''' Shared setup for the smith tests '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+from waflib import Logs
+
+# smith sets up waf's logging before anything can log
+Logs.init_log()
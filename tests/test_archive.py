@@ -0,0 +1,114 @@
+''' Tests of incremental release archives '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+import os, zipfile
+import pytest
+from smithlib import archive
+
+BASE = 'pkg-1.0'
+
+@pytest.fixture
+def src(tmp_path) :
+    d = tmp_path / 'src'
+    d.mkdir()
+    (d / 'README.txt').write_text('one\ntwo\n')
+    (d / 'font.ttf').write_bytes(bytes(range(256)) * 64)
+    (d / 'OFL.txt').write_text('licence\n')
+    return d
+
+def members(src) :
+    return [archive.Member(n, BASE + '/' + n, str(src / n), n.endswith('.txt'))
+            for n in ('README.txt', 'font.ttf', 'OFL.txt')]
+
+@pytest.fixture
+def opts() :
+    return archive.Options(threads = 2, deterministic = True)
+
+@pytest.fixture
+def calls(monkeypatch) :
+    """ Records which members are copied raw and which compressed """
+    res = {'copied' : [], 'compressed' : []}
+    copy_member, compress_member = archive.copy_member, archive.compress_member
+    def copy(oldzip, oldinfo, arcname, zf) :
+        res['copied'].append(arcname)
+        return copy_member(oldzip, oldinfo, arcname, zf)
+    def compress(m, opts) :
+        res['compressed'].append(m.arcname)
+        return compress_member(m, opts)
+    monkeypatch.setattr(archive, 'copy_member', copy)
+    monkeypatch.setattr(archive, 'compress_member', compress)
+    return res
+
+def raw(path, name) :
+    with zipfile.ZipFile(path) as z :
+        return archive.read_raw(z, z.getinfo(name))
+
+def check(path, src) :
+    with zipfile.ZipFile(path) as z :
+        assert z.testzip() is None
+        assert z.namelist() == [BASE + '/' + n for n in ('README.txt', 'font.ttf', 'OFL.txt')]
+        assert z.read(BASE + '/README.txt') == (src / 'README.txt').read_bytes().replace(b'\n', b'\r\n')
+        assert z.read(BASE + '/font.ttf') == (src / 'font.ttf').read_bytes()
+        assert z.getinfo(BASE + '/README.txt').internal_attr == 1
+        assert z.getinfo(BASE + '/font.ttf').internal_attr == 0
+
+def test_write_and_reuse(tmp_path, src, opts, calls) :
+    path = str(tmp_path / 'pkg.zip')
+    first = archive.write_zip(path, BASE, members(src), {}, opts)
+    check(path, src)
+    assert calls['copied'] == [] and len(calls['compressed']) == 3
+    assert first['members']['README.txt'].endswith('t') and first['members']['font.ttf'].endswith('b')
+    before = dict((n, raw(path, BASE + '/' + n)) for n in ('README.txt', 'OFL.txt'))
+
+    # a changed member is compressed again and the others copied as they were
+    (src / 'font.ttf').write_bytes(b'new font' * 100)
+    calls['copied'][:] = calls['compressed'][:] = []
+    second = archive.write_zip(path, BASE, members(src), first, opts)
+    check(path, src)
+    assert calls['compressed'] == [BASE + '/font.ttf']
+    assert sorted(calls['copied']) == [BASE + '/OFL.txt', BASE + '/README.txt']
+    for n, data in before.items() :
+        assert raw(path, BASE + '/' + n) == data
+    assert second['members']['font.ttf'] != first['members']['font.ttf']
+    assert second['members']['README.txt'] == first['members']['README.txt']
+
+    # and the same as writing it afresh
+    fresh = str(tmp_path / 'fresh.zip')
+    archive.write_zip(fresh, BASE, members(src), {}, opts)
+    with open(path, 'rb') as a, open(fresh, 'rb') as b :
+        assert a.read() == b.read()
+
+def test_unchanged(tmp_path, src, opts, calls) :
+    path = str(tmp_path / 'pkg.zip')
+    old = archive.write_zip(path, BASE, members(src), {}, opts)
+    stamp = os.stat(path).st_mtime_ns
+    os.utime(path, ns = (stamp - 10**9, stamp - 10**9))
+    calls['compressed'][:] = []
+    assert archive.write_zip(path, BASE, members(src), old, opts) is old
+    assert calls == {'copied' : [], 'compressed' : []}
+    assert os.stat(path).st_mtime_ns == stamp - 10**9
+    assert archive.unchanged(old, path, BASE, members(src))
+    assert not archive.unchanged(old, path, 'pkg-1.1', members(src))
+    assert not archive.unchanged(old, path, BASE, members(src)[:2])
+    assert not archive.unchanged(old, str(tmp_path / 'other.zip'), BASE, members(src))
+    (src / 'OFL.txt').write_text('changed\n')
+    assert not archive.unchanged(old, path, BASE, members(src))
+
+def test_deterministic_change_rewrites(tmp_path, src, opts, calls) :
+    path = str(tmp_path / 'pkg.zip')
+    old = archive.write_zip(path, BASE, members(src), {}, archive.Options(threads = 1))
+    calls['compressed'][:] = []
+    archive.write_zip(path, BASE, members(src), old, opts)
+    assert len(calls['compressed']) == 3 and calls['copied'] == []
+    check(path, src)
+
+def test_threads_give_the_same_zip(tmp_path, src) :
+    outs = []
+    for threads in (1, 4) :
+        path = str(tmp_path / ('pkg%d.zip' % threads))
+        archive.write_zip(path, BASE, members(src), {}, archive.Options(threads = threads, deterministic = True))
+        with open(path, 'rb') as f :
+            outs.append(f.read())
+    assert outs[0] == outs[1]
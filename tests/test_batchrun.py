@@ -0,0 +1,72 @@
+''' Tests of running many invocations of one command as a single task '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+import os
+import pytest
+from waflib import ConfigSet
+from smithlib import batchrun
+
+class Node(object) :
+    def __init__(self, name) :
+        self.name = name
+
+    def path_from(self, node) :
+        return self.name
+
+    def abspath(self) :
+        return '/build/' + self.name
+
+class Bld(object) :
+    bldnode = None
+
+class Gen(object) :
+    def __init__(self, rule, items, **kw) :
+        self.bld = Bld()
+        self.batchrule = rule
+        self.items = items
+        for k, v in kw.items() :
+            setattr(self, k, v)
+
+def make_task(rule, inputs = True, **kw) :
+    env = ConfigSet.ConfigSet()
+    env.TOOL = 'mytool'
+    items = [([Node('a.txt')] if inputs else [], Node('a.out')), ([Node('b.txt')] if inputs else [], Node('b.out'))]
+    return batchrun.cmdbatch(env = env, generator = Gen(rule, items, **kw))
+
+@pytest.mark.parametrize('shell, cmds', [
+    (True, [' mytool a.txt -o a.out ', ' mytool b.txt -o b.out ']),
+    (False, [['mytool', 'a.txt', '-o', 'a.out'], ['mytool', 'b.txt', '-o', 'b.out']]),
+])
+def test_commands(shell, cmds) :
+    t = make_task('${TOOL} ${SRC} -o ${TGT}', shell = shell)
+    assert t.commands() == cmds
+    assert t.dvars == ['TOOL']
+
+def test_item_sig_of_list() :
+    t = make_task('${TOOL} -o ${TGT}', inputs = False, shell = False)
+    assert t.item_sig(0) != t.item_sig(1)
+    assert t.item_sig(0) == make_task('${TOOL} -o ${TGT}', inputs = False, shell = False).item_sig(0)
+    assert t.item_sig(0) != make_task('${TOOL} -o ${TGT}', inputs = False, shell = True).item_sig(0)
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason = 'needs fork')
+def test_run_batch_forks(tmp_path) :
+    """ Each item runs in a fresh child, so neither what one leaves behind
+        nor how it exits affects the others """
+    (tmp_path / 'bmod.py').write_text("""import os, sys
+count = 0
+def main() :
+    global count
+    count += 1
+    if sys.argv[1] == 'exit' :
+        os._exit(3)
+    print(sys.argv[1], count)
+    return 0 if count == 1 else 1
+""")
+    exe = str(tmp_path / 'btool')
+    argvs = [[exe, 'one'], [exe, 'exit'], [exe, 'two']]
+    with open(str(tmp_path / 'log'), 'wb') as out :
+        res = batchrun.run_batch(('bmod', 'main'), argvs, str(tmp_path), dict(os.environ), out.fileno())
+    assert res == [0, 3, 0]
+    assert (tmp_path / 'log').read_text() == 'one 1\ntwo 1\n'
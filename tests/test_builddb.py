@@ -0,0 +1,65 @@
+''' Tests of the sqlite build database '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+import pytest
+from waflib import Node
+from smithlib import builddb
+
+pytestmark = pytest.mark.skipif(builddb.sqlite3 is None, reason = 'needs sqlite3')
+
+class Bld(object) :
+    def __init__(self, path) :
+        self.root = Node.Node('', None)
+        self.bldnode = self.root.make_node([x for x in Node.split_path(path) if x])
+
+def reopen(path, db = None) :
+    if db is not None :
+        db.store()
+        db.close()
+    bld = Bld(path)
+    bld.builddb = builddb.BuildDB(bld, path + '/db.sqlite')
+    bld.builddb.attach()
+    return bld
+
+def test_values_persist(tmp_path) :
+    path = str(tmp_path)
+    bld = reopen(path)
+    bld.task_sigs['a'] = b'siga'
+    bld.raw_deps['b'] = [1, 2]
+    bld = reopen(path, bld.builddb)
+    assert bld.task_sigs['a'] == b'siga'
+    assert bld.raw_deps.get('b') == [1, 2]
+    assert 'c' not in bld.task_sigs
+
+@pytest.mark.parametrize('remove', [
+    lambda d : d.__delitem__('a'),
+    lambda d : d.pop('a'),
+    lambda d : d.pop('a', None),
+    lambda d : d.clear(),
+    lambda d : d.popitem() if len(d) == 1 else None,
+], ids = ['del', 'pop', 'pop_default', 'clear', 'popitem'])
+def test_removal_persists(tmp_path, remove) :
+    path = str(tmp_path)
+    bld = reopen(path)
+    bld.task_sigs['a'] = b'siga'
+    bld = reopen(path, bld.builddb)
+    # the key is only in the database, not yet fetched
+    remove(bld.task_sigs)
+    bld = reopen(path, bld.builddb)
+    assert 'a' not in bld.task_sigs
+    assert bld.task_sigs.pop('a', None) is None
+    with pytest.raises(KeyError) :
+        bld.task_sigs.pop('a')
+
+def test_setdefault_and_update_persist(tmp_path) :
+    path = str(tmp_path)
+    bld = reopen(path)
+    bld.task_sigs['a'] = b'old'
+    bld = reopen(path, bld.builddb)
+    assert bld.task_sigs.setdefault('a', b'new') == b'old'
+    assert bld.task_sigs.setdefault('b', b'new') == b'new'
+    bld.task_sigs.update({'c' : b'c'}, d = b'd')
+    bld = reopen(path, bld.builddb)
+    assert sorted(bld.task_sigs.items()) == [('a', b'old'), ('b', b'new'), ('c', b'c'), ('d', b'd')]
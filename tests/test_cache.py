@@ -0,0 +1,105 @@
+''' Tests of the content addressed build cache '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+import os, json
+import pytest
+from smithlib import cache
+
+class Node(object) :
+    def __init__(self, path) :
+        self.path = path
+        self.name = os.path.basename(path)
+
+    def abspath(self) :
+        return self.path
+
+class Gen(object) :
+    name = 'gen'
+
+class FakeTask(object) :
+    def __init__(self, outputs, uid = b'uid', sig = b'sig') :
+        self.outputs = outputs
+        self.generator = Gen()
+        self._uid = uid
+        self._sig = sig
+
+    def uid(self) :
+        return self._uid
+
+    def signature(self) :
+        return self._sig
+
+@pytest.mark.parametrize('text, size', [
+    ('500M', 500 * 1024 ** 2),
+    ('10G', 10 * 1024 ** 3),
+    ('2g', 2 * 1024 ** 3),
+    ('3MB', 3 * 1024 ** 2),
+    ('1.5K', 1536),
+    ('1T', 1024 ** 4),
+    ('4096', 4096),
+    (' 2G ', 2 * 1024 ** 3),
+])
+def test_parse_size(text, size) :
+    assert cache.parse_size(text) == size
+
+@pytest.mark.parametrize('text', [None, '', 'lots', 'G'])
+def test_parse_size_default(text) :
+    assert cache.parse_size(text) == cache.defaultsize
+
+def write(path, data) :
+    with open(path, 'wb') as f :
+        f.write(data)
+    return path
+
+def test_store_and_retrieve(tmp_path) :
+    c = cache.BuildCache(str(tmp_path / 'cache'))
+    out = write(str(tmp_path / 'out.ttf'), b'font data')
+    t = FakeTask([Node(out)])
+    assert c.store(t)
+    os.remove(out)
+    assert c.retrieve(t)
+    with open(out, 'rb') as f :
+        assert f.read() == b'font data'
+    assert c.stats == {'gen' : [1, 0]}
+    # another signature is a miss
+    assert c.retrieve(FakeTask([Node(out)], sig = b'other')) is None
+    assert c.stats == {'gen' : [1, 1]}
+
+def test_same_contents_stored_once(tmp_path) :
+    c = cache.BuildCache(str(tmp_path / 'cache'))
+    a = write(str(tmp_path / 'a'), b'same')
+    b = write(str(tmp_path / 'b'), b'same')
+    assert c.put_blob(a) == c.put_blob(b)
+    blobs = [f for dp, ds, fs in os.walk(c.blobdir) for f in fs]
+    assert len(blobs) == 1
+
+def test_trim_evicts_least_recently_used(tmp_path) :
+    c = cache.BuildCache(str(tmp_path / 'cache'), maxsize = 3000)
+    tasks = []
+    for i in range(5) :
+        out = write(str(tmp_path / ('out%d' % i)), bytes([i]) * 1000)
+        t = FakeTask([Node(out)], uid = b'task%d' % i)
+        assert c.store(t)
+        tasks.append(t)
+    # the blobs were used in order, oldest first
+    for i, t in enumerate(tasks) :
+        with open(c.manifestpath(t)) as f :
+            h = json.load(f)['outputs'][0]['hash']
+        os.utime(c.blobpath(h), (1000000 + i, 1000000 + i))
+    assert c.trim() == 3
+    # down to no more than 90% of the maximum, keeping the newest
+    blobs = [os.path.join(dp, f) for dp, ds, fs in os.walk(c.blobdir) for f in fs]
+    assert sum(os.path.getsize(b) for b in blobs) <= 2700
+    assert [os.path.exists(c.manifestpath(t)) for t in tasks] == [False, False, False, True, True]
+    assert c.retrieve(tasks[0]) is None
+    assert c.retrieve(tasks[4])
+
+def test_trim_within_size(tmp_path) :
+    c = cache.BuildCache(str(tmp_path / 'cache'), maxsize = 10000)
+    out = write(str(tmp_path / 'out'), b'x' * 1000)
+    t = FakeTask([Node(out)])
+    c.store(t)
+    assert c.trim() == 0
+    assert c.retrieve(t)
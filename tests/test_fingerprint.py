@@ -0,0 +1,87 @@
+''' Tests of the fingerprint that skips unchanged builds '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+import os, sys
+import pytest
+from waflib import Context
+from smithlib import fingerprint
+
+@pytest.fixture
+def project(tmp_path, monkeypatch) :
+    top = tmp_path / 'project'
+    out = top / 'results'
+    (top / 'source').mkdir(parents = True)
+    out.mkdir()
+    (top / 'wscript').write_text("APPNAME = 'test'\n")
+    (top / 'source' / 'font.ufo').write_text('glyphs')
+    (out / 'font.ttf').write_bytes(b'font')
+    monkeypatch.setattr(Context, 'top_dir', str(top))
+    monkeypatch.setattr(Context, 'out_dir', str(out))
+    monkeypatch.setattr(sys, 'argv', ['smith', 'build'])
+    monkeypatch.delenv('SMITHARGS', raising = False)
+    # trust files however recently they changed
+    monkeypatch.setattr(fingerprint, 'SETTLE', -60)
+    return top
+
+def built() :
+    """ Record the fingerprint as a successful build would """
+    assert not fingerprint.check()
+    fingerprint.save()
+    assert fingerprint.check()
+
+def touch(path) :
+    st = os.stat(str(path))
+    os.utime(str(path), ns = (st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+def test_unchanged(project) :
+    built()
+    # nor do the build's own records in the build directory count
+    (project / 'results' / '.smithsomething').write_text('x')
+    assert fingerprint.check()
+
+def test_new_source_file(project) :
+    built()
+    (project / 'source' / 'new.fea').write_text('feature')
+    assert not fingerprint.check()
+
+def test_edited_wscript(project) :
+    built()
+    (project / 'wscript').write_text("APPNAME = 'tset'\n")
+    touch(project / 'wscript')
+    assert not fingerprint.check()
+
+def test_env(project, monkeypatch) :
+    built()
+    monkeypatch.setenv('SMITH_TEST_SETTING', '1')
+    assert not fingerprint.check()
+    fingerprint.save()
+    assert fingerprint.check()
+    # but not those that change from one shell to the next
+    monkeypatch.setenv('OLDPWD', '/somewhere/else')
+    assert fingerprint.check()
+
+def test_argv(project, monkeypatch) :
+    built()
+    monkeypatch.setattr(sys, 'argv', ['smith', 'build', '-r'])
+    assert not fingerprint.check()
+
+def test_deleted_output(project) :
+    built()
+    os.remove(str(project / 'results' / 'font.ttf'))
+    assert not fingerprint.check()
+
+def test_other_commands(project, monkeypatch) :
+    built()
+    monkeypatch.setattr(sys, 'argv', ['smith', 'clean'])
+    assert not fingerprint.check()
+    assert not os.path.exists(fingerprint.fpfile())
+    monkeypatch.setattr(sys, 'argv', ['smith', 'build', '--nofingerprint'])
+    assert not fingerprint.check()
+
+def test_recent_change_not_recorded(project, monkeypatch) :
+    monkeypatch.setattr(fingerprint, 'SETTLE', 60)
+    assert not fingerprint.check()
+    fingerprint.save()
+    assert not os.path.exists(fingerprint.fpfile())
@@ -0,0 +1,139 @@
+''' Tests of in process modify() commands '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+import io, shutil, subprocess
+import pytest
+from smithlib import modifiers
+
+needs_fonttools = pytest.mark.skipif(modifiers.TTFont is None, reason = 'needs fontTools')
+
+class Node(object) :
+    def __init__(self, path) :
+        self.path = path
+
+    def abspath(self) :
+        return self.path
+
+class FakeTask(object) :
+    def __init__(self, dep, tgt) :
+        self.dep = Node(dep)
+        self.tgt = Node(tgt)
+
+def make_font(path) :
+    from fontTools.fontBuilder import FontBuilder
+    from fontTools.pens.ttGlyphPen import TTGlyphPen
+    from fontTools.ttLib.tables.DefaultTable import DefaultTable
+    fb = FontBuilder(1000, isTTF = True)
+    fb.setupGlyphOrder(['.notdef', 'A'])
+    fb.setupCharacterMap({0x41 : 'A'})
+    pen = TTGlyphPen(None)
+    pen.moveTo((0, 0))
+    pen.lineTo((500, 700))
+    pen.lineTo((0, 700))
+    pen.closePath()
+    fb.setupGlyf({'.notdef' : TTGlyphPen(None).glyph(), 'A' : pen.glyph()})
+    fb.setupHorizontalMetrics({'.notdef' : (500, 0), 'A' : (500, 0)})
+    fb.setupHorizontalHeader(ascent = 800, descent = -200)
+    fb.setupNameTable({'familyName' : 'Test', 'styleName' : 'Regular'})
+    fb.setupOS2()
+    fb.setupPost()
+    # stand ins for graphite and other tables, odd lengths to need padding
+    for tag, data in (('Silf', b'silf data'), ('Glat', b'glat'), ('Xtra', b'extra!')) :
+        t = DefaultTable(tag)
+        t.data = data
+        fb.font[tag] = t
+    fb.save(path)
+    return path
+
+def step(cmd, inputs = None, **kw) :
+    return (cmd, inputs or [], 0, kw)
+
+@pytest.mark.parametrize('cmd, op', [
+    ('${TTFTABLE} -d graphite ${DEP} ${TGT}', ('delete', modifiers.tablegroups['graphite'])),
+    ('${TTFTABLE} -delete GDEF,Xtra,"cvt " ${DEP} ${TGT}', ('delete', ('GDEF', 'Xtra', 'cvt '))),
+    ('${TTFTABLE} -d vtt,volt ${DEP} ${TGT}', ('delete', modifiers.tablegroups['vtt'] + modifiers.tablegroups['volt'])),
+    ('${TTFTABLE} -d cvt ${DEP} ${TGT}', None),
+    ('${TTFTABLE} -d hinting ${DEP} ${TGT}', None),
+    ('${TTFTABLE} -d GDEF, ${DEP} ${TGT}', None),
+    ('${TTFTABLE} -d ${DEP} ${TGT}', None),
+    ('${TTFTABLE} -s latn ${DEP} ${TGT}', None),
+    ('${TTFTABLE} -d toolong ${DEP} ${TGT}', None),
+    ('${TTFSETVER} 1.2 ${DEP} ${TGT}', None),
+    ('ttftable -d GDEF ${DEP} ${TGT}', None),
+    ('${TTFTABLE} -d "GDEF ${DEP} ${TGT}', None),
+])
+def test_parse(cmd, op) :
+    assert modifiers.parse(cmd) == op
+
+@needs_fonttools
+def test_group_modifys_fuses_runs() :
+    steps = [step('${TTFTABLE} -d graphite ${DEP} ${TGT}'),
+             step('${TTFTABLE} -d Xtra ${DEP} ${TGT}', late = 1),
+             step('${TTFAUTOHINT} ${DEP} ${TGT}'),
+             step('${TTFTABLE} -d GDEF ${DEP} ${TGT}', ['other.txt']),
+             step('${TTFTABLE} -d GPOS ${DEP} ${TGT}', nochange = 1),
+             step('${TTFTABLE} -d opentype ${DEP} ${TGT}')]
+    res = modifiers.group_modifys(steps)
+    assert len(res) == 5
+    fused, hint, withinput, nochange, last = res
+    assert callable(fused[0]) and fused[1:] == ([], 0, {'late' : 1})
+    assert repr((('delete', modifiers.tablegroups['graphite']), ('delete', ('Xtra',)))) in fused[0].code
+    assert (hint, withinput, nochange) == tuple(steps[2:5])
+    assert callable(last[0]) and repr((('delete', modifiers.tablegroups['opentype']),)) in last[0].code
+
+@needs_fonttools
+def test_group_modifys_leaves_others() :
+    steps = [step('${TTFAUTOHINT} ${DEP} ${TGT}'), step(lambda task : 0)]
+    assert modifiers.group_modifys(steps) == steps
+
+@needs_fonttools
+def test_apply_deletes_tables(tmp_path) :
+    src = make_font(str(tmp_path / 'in.ttf'))
+    out = str(tmp_path / 'out.ttf')
+    ops = (modifiers.parse('${TTFTABLE} -d graphite ${DEP} ${TGT}'), modifiers.parse('${TTFTABLE} -d Xtra,GDEF ${DEP} ${TGT}'))
+    assert modifiers.apply_modifiers(ops, FakeTask(src, out)) == 0
+    before = modifiers.read_sfnt(src)
+    after = modifiers.read_sfnt(out)
+    assert sorted(after[1].keys()) == sorted(k for k in before[1].keys() if k not in ('Silf', 'Glat', 'Xtra'))
+    for k, v in after[1].items() :
+        if k != 'head' :
+            assert v == before[1][k]
+    # the whole font sums to the magic number, and fontTools checks each table
+    with open(out, 'rb') as f :
+        assert modifiers.checksum(f.read()) == 0xB1B0AFBA
+    modifiers.TTFont(out, checkChecksums = 2).close()
+
+@needs_fonttools
+@pytest.mark.parametrize('tables', ['graphite', 'Xtra', 'graphite,Xtra,GDEF', 'cmap,head'])
+def test_apply_matches_fonttools(tmp_path, tables) :
+    """ fontTools writes the same sfnt of the tables that are left """
+    from fontTools.ttLib.sfnt import SFNTReader, SFNTWriter
+    src = make_font(str(tmp_path / 'in.ttf'))
+    ours = str(tmp_path / 'ours.ttf')
+    op = modifiers.parse('${TTFTABLE} -d %s ${DEP} ${TGT}' % tables)
+    assert modifiers.apply_modifiers((op,), FakeTask(src, ours)) == 0
+    theirs = io.BytesIO()
+    with open(src, 'rb') as f :
+        reader = SFNTReader(f)
+        tags = sorted(t for t in reader.keys() if t not in op[1])
+        writer = SFNTWriter(theirs, len(tags), reader.sfntVersion)
+        for t in tags :
+            writer[t] = reader[t]
+        writer.close()
+    with open(ours, 'rb') as f :
+        assert f.read() == theirs.getvalue()
+
+@needs_fonttools
+@pytest.mark.skipif(shutil.which('ttftable') is None, reason = 'needs ttftable')
+@pytest.mark.parametrize('tables', ['graphite', 'Xtra', 'graphite,Xtra,GDEF', 'cmap'])
+def test_apply_matches_ttftable(tmp_path, tables) :
+    src = make_font(str(tmp_path / 'in.ttf'))
+    ours = str(tmp_path / 'ours.ttf')
+    theirs = str(tmp_path / 'theirs.ttf')
+    cmd = '${TTFTABLE} -d %s ${DEP} ${TGT}' % tables
+    assert modifiers.apply_modifiers((modifiers.parse(cmd),), FakeTask(src, ours)) == 0
+    subprocess.check_call(['ttftable', '-d', tables, src, theirs])
+    with open(ours, 'rb') as a, open(theirs, 'rb') as b :
+        assert a.read() == b.read()
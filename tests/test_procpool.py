@@ -0,0 +1,87 @@
+''' Tests of the process pool for python task functions '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+import os, optparse, pickle
+import pytest
+from waflib import Options
+from smithlib import procpool
+
+def write_pid(prefix, task) :
+    """ A rule function that says which process ran it """
+    task.outputs[0].write("%s %d" % (prefix, os.getpid()))
+    return 0
+
+class Node(object) :
+    def __init__(self, path) :
+        self.path = path
+
+    def abspath(self) :
+        return self.path
+
+    def bldpath(self) :
+        return os.path.basename(self.path)
+
+    def get_bld(self) :
+        return self
+
+class Bld(object) :
+    jobs = 2
+
+class Gen(object) :
+    def __init__(self) :
+        self.bld = Bld()
+
+class FakeTask(object) :
+    def __init__(self, output, **kw) :
+        self.generator = Gen()
+        self.inputs = []
+        self.outputs = [Node(output)]
+        for k, v in kw.items() :
+            setattr(self, k, v)
+
+@pytest.fixture
+def options(monkeypatch) :
+    def set_procpool(n) :
+        monkeypatch.setattr(Options, 'options', optparse.Values({'procpool' : n}))
+    set_procpool(0)
+    yield set_procpool
+    procpool.shutdown()
+
+def ran_by(path) :
+    with open(path) as f :
+        prefix, pid = f.read().split()
+    return prefix, int(pid)
+
+def test_runs_in_pool(tmp_path, options) :
+    out = str(tmp_path / 'out.txt')
+    rule = procpool.pool_rule(write_pid, 'pooled')
+    options(2)
+    assert rule(FakeTask(out)) == 0
+    prefix, pid = ran_by(out)
+    assert prefix == 'pooled' and pid != os.getpid()
+    # and a task can say not to
+    assert rule(FakeTask(out, procpool = False)) == 0
+    assert ran_by(out)[1] == os.getpid()
+
+def test_runs_in_thread(tmp_path, options) :
+    out = str(tmp_path / 'out.txt')
+    rule = procpool.pool_rule(write_pid, 'here')
+    assert rule(FakeTask(out)) == 0
+    assert ran_by(out) == ('here', os.getpid())
+    # unless the task asks for the pool
+    assert rule(FakeTask(out, procpool = True)) == 0
+    assert ran_by(out)[1] != os.getpid()
+
+def test_signature() :
+    assert procpool.pool_rule(write_pid, 'a').code == procpool.pool_rule(write_pid, 'a').code
+    assert procpool.pool_rule(write_pid, 'a').code != procpool.pool_rule(write_pid, 'b').code
+
+def test_pool_task(tmp_path) :
+    task = FakeTask(str(tmp_path / 'out.txt'), dep = Node(str(tmp_path / 'in.ttf')), tgt = Node(str(tmp_path / 'out.ttf')))
+    task.inputs = [Node(str(tmp_path / 'in.txt'))]
+    ptask = pickle.loads(pickle.dumps(procpool.PoolTask(task)))
+    assert [x.abspath() for x in ptask.inputs] == [str(tmp_path / 'in.txt')]
+    assert [x.bldpath() for x in ptask.outputs] == ['out.txt']
+    assert (ptask.dep.abspath(), ptask.tgt.abspath()) == (str(tmp_path / 'in.ttf'), str(tmp_path / 'out.ttf'))
@@ -0,0 +1,80 @@
+''' Tests of the task scheduler '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+import itertools, time
+from waflib import Runner, Task
+
+class Bld(object) :
+    keep = 0
+    progress_bar = 0
+    cache_global = None
+    nocache = True
+
+    def __init__(self) :
+        self.groups = []
+        self.returned_tasks = []
+        self.task_sigs = {}
+
+    def total(self) :
+        return sum(len(g) for g in self.groups)
+
+    def to_log(self, s) :
+        pass
+
+class Rec(Task.TaskBase) :
+    """ Records when it runs, and runs only after the tasks in run_after """
+
+    def __init__(self, bld, name, log, after = (), priority = 0, delay = 0.) :
+        Task.TaskBase.__init__(self)
+        self.bld = bld
+        self.name = name
+        self.log = log
+        self.run_after = set(after)
+        self.priority = priority
+        self.delay = delay
+
+    def runnable_status(self) :
+        for t in self.run_after :
+            if not t.hasrun :
+                return Task.ASK_LATER
+        return Task.RUN_ME
+
+    def display(self) :
+        return ''
+
+    def run(self) :
+        self.log.append(('start', self.name))
+        time.sleep(self.delay)
+        self.log.append(('end', self.name))
+        return 0
+
+def run_groups(bld, groups, jobs) :
+    bld.groups = groups
+    p = Runner.Parallel(bld, jobs)
+    p.biter = itertools.chain(iter(groups), itertools.repeat([]))
+    p.start()
+    return p
+
+def test_postponed_task_finishes_before_next_group() :
+    log = []
+    bld = Bld()
+    a = Rec(bld, 'a', log, delay = 0.2)
+    # b must wait for a, so it is postponed and then released when a is done
+    b = Rec(bld, 'b', log, after = [a], delay = 0.1)
+    # a high priority task in the next group would go before b if it could
+    c = Rec(bld, 'c', log, priority = 10)
+    p = run_groups(bld, [[a, b], [c]], 2)
+    assert not p.error
+    assert log == [('start', 'a'), ('end', 'a'), ('start', 'b'), ('end', 'b'), ('start', 'c'), ('end', 'c')]
+
+def test_released_tasks_by_priority() :
+    log = []
+    bld = Bld()
+    a = Rec(bld, 'a', log, delay = 0.2)
+    low = Rec(bld, 'low', log, after = [a], priority = 1)
+    high = Rec(bld, 'high', log, after = [a], priority = 5)
+    p = run_groups(bld, [[a, low, high]], 2)
+    assert not p.error
+    assert [x[1] for x in log if x[0] == 'start'] == ['a', 'high', 'low']
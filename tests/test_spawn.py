@@ -0,0 +1,76 @@
+''' Tests of running rule commands without a shell '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+import os
+import pytest
+from smithlib import spawn
+from smithlib.zygote import command_words
+
+@pytest.mark.parametrize('cmd, words', [
+    ('tool -o out.ttf in.ufo', ['tool', '-o', 'out.ttf', 'in.ufo']),
+    ('''tool 'a b' "c d" e\\ f "it's"''', ['tool', 'a b', 'c d', 'e f', "it's"]),
+    ('tool ""', ['tool', '']),
+    ('A=1 B="x y" tool', ['A=1', 'B=x y', 'tool']),
+    # redirects, pipes and lists
+    ('tool in > out', None),
+    ('tool in>out', None),
+    ('tool < in', None),
+    ('tool 2>&1', None),
+    ('tool | other', None),
+    ('tool && other', None),
+    ('tool ; other', None),
+    ('tool &', None),
+    ('(tool)', None),
+    # expansions
+    ('tool $HOME', None),
+    ('tool "${SRC}"', None),
+    ('tool `date`', None),
+    ('tool *.ttf', None),
+    ('tool ~/x', None),
+    ('tool # comment', None),
+    # bad quoting
+    ('tool "open', None),
+    ('', None),
+])
+def test_command_words(cmd, words) :
+    assert command_words(cmd) == words
+
+@pytest.mark.parametrize('cmd, argv, assigns', [
+    ('tool a b', ['tool', 'a', 'b'], {}),
+    ('LANG=C tool a', ['tool', 'a'], {'LANG' : 'C'}),
+    ('A=1 B="x y" tool C=2', ['tool', 'C=2'], {'A' : '1', 'B' : 'x y'}),
+    ('A=1 B=2', None, None),
+    ('1A=1 tool', ['1A=1', 'tool'], {}),
+    ('tool > out', None, None),
+    ('echo hello', None, None),
+    ('printf "%s\\n" x', None, None),
+    ('test -f x', None, None),
+    ('A=1 cd build', None, None),
+    ('exec tool', None, None),
+])
+def test_parse(cmd, argv, assigns) :
+    env = {'PATH' : '/bin', 'A' : 'old'}
+    res = spawn.Spawner().parse(cmd, env)
+    if argv is None :
+        assert res is None
+        return
+    assert res[0] == argv
+    if assigns :
+        assert res[1] == dict(env, **assigns)
+        assert env['A'] == 'old'
+    else :
+        assert res[1] is env
+
+@pytest.mark.skipif(os.name != 'posix', reason = 'needs posix')
+def test_run(tmp_path) :
+    sp = spawn.Spawner()
+    env = dict(os.environ, GREETING = 'hi')
+    with open(str(tmp_path / 'out'), 'wb') as f :
+        assert sp.run('sh -c "exit 4"', str(tmp_path), env) == 4
+        assert sp.run('X=there env', str(tmp_path), env, stdout = f.fileno()) == 0
+    out = (tmp_path / 'out').read_text().splitlines()
+    assert 'GREETING=hi' in out and 'X=there' in out
+    assert sp.run('no-such-tool-here x', str(tmp_path), env) is None
+    assert sp.avoided == 2
@@ -0,0 +1,81 @@
+''' Tests of dependencies on some of a font's tables '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+import struct
+import pytest
+from waflib import Utils
+from smithlib import tabledeps
+from smithlib.modifiers import write_sfnt
+
+def head(revision = 1, created = 0, upem = 1000, flags = 3) :
+    """ A head table with the fields we care about """
+    return (struct.pack(">LLLLHH", 0x10000, revision, 0, 0x5F0F3CF5, flags, upem)
+            + struct.pack(">QQ", created, created) + b"\0" * 18)
+
+def font(path, **tables) :
+    tables = dict((k.replace('_', '/').ljust(4), v) for k, v in tables.items())
+    write_sfnt(str(path), b'\0\1\0\0', tables)
+    return str(path)
+
+def test_read_tables(tmp_path) :
+    path = font(tmp_path / 'a.ttf', head = head(), cmap = b'cmap data', name = b'names', OS_2 = b'os2')
+    with open(path, 'rb') as f :
+        res = tabledeps.read_tables(f, ('cmap', 'OS/2', 'GSUB'))
+    assert res == {'cmap' : b'cmap data', 'OS/2' : b'os2'}
+
+def test_read_tables_not_sfnt(tmp_path) :
+    path = tmp_path / 'a.ttf'
+    path.write_bytes(b'<?xml version="1.0"?>')
+    with open(str(path), 'rb') as f :
+        assert tabledeps.read_tables(f, ('cmap',)) is None
+    assert tabledeps.table_digest(str(path), ('cmap',)) == Utils.h_file(str(path))
+
+def test_head_layout_fields_only(tmp_path) :
+    with open(font(tmp_path / 'a.ttf', head = head()), 'rb') as f :
+        res = tabledeps.read_tables(f, ('head',))
+    # the magic number, flags and unitsPerEm, then the bbox to glyphDataFormat
+    assert res['head'] == struct.pack(">LHH", 0x5F0F3CF5, 3, 1000) + b"\0" * 18
+
+@pytest.mark.parametrize('changes, same', [
+    ({'revision' : 2}, True),
+    ({'created' : 12345}, True),
+    ({'upem' : 2048}, False),
+    ({'flags' : 11}, False),
+])
+def test_digest_head(tmp_path, changes, same) :
+    a = font(tmp_path / 'a.ttf', head = head(), cmap = b'cmap')
+    b = font(tmp_path / 'b.ttf', head = head(**changes), cmap = b'cmap')
+    tags = ('cmap', 'head')
+    assert (tabledeps.table_digest(a, tags) == tabledeps.table_digest(b, tags)) == same
+
+def test_digest_other_tables(tmp_path) :
+    tags = ('cmap', 'GSUB')
+    a = font(tmp_path / 'a.ttf', cmap = b'cmap', name = b'one')
+    b = font(tmp_path / 'b.ttf', cmap = b'cmap', name = b'two', Silf = b'graphite')
+    c = font(tmp_path / 'c.ttf', cmap = b'cmaq', name = b'one')
+    d = font(tmp_path / 'd.ttf', cmap = b'cmap', name = b'one', GSUB = b'')
+    assert tabledeps.table_digest(a, tags) == tabledeps.table_digest(b, tags)
+    assert tabledeps.table_digest(a, tags) != tabledeps.table_digest(c, tags)
+    # an empty table is not the same as none
+    assert tabledeps.table_digest(a, tags) != tabledeps.table_digest(d, tags)
+    # nor does the order of the tags matter
+    assert tabledeps.table_digest(a, tags) == tabledeps.table_digest(a, ('GSUB', 'cmap', 'cmap'))
+
+class Gen(object) :
+    pass
+
+class FakeTask(object) :
+    def __init__(self, **kw) :
+        self.generator = Gen()
+        for k, v in kw.items() :
+            setattr(self.generator, k, v)
+
+def test_task_tables() :
+    assert tabledeps.task_tables(FakeTask()) is None
+    assert tabledeps.task_tables(FakeTask(tables = ('cmap', 'GSUB'))) == ['cmap', 'GSUB']
+    tables = {'ot' : ['GSUB', 'cmap'], 'gr' : ['Silf', 'cmap']}
+    assert tabledeps.task_tables(FakeTask(tables = tables, shaper = 'ot')) == ['GSUB', 'cmap']
+    assert tabledeps.task_tables(FakeTask(tables = tables, shaper = 'ot', altshaper = 'gr')) == ['GSUB', 'Silf', 'cmap']
+    assert tabledeps.task_tables(FakeTask(tables = tables, shaper = 'hb')) is None
@@ -0,0 +1,106 @@
+''' Tests of streaming the output of tasks to log files '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+import os, optparse
+import pytest
+from waflib import Context, Options, Task, Utils
+from smithlib import tasklogs
+
+def capture(path, chunks, **kw) :
+    cap = tasklogs.Capture(str(path), **kw)
+    for c in chunks :
+        os.write(cap.w, c)
+    return cap.finish()
+
+def test_cap(tmp_path, monkeypatch) :
+    monkeypatch.setattr(tasklogs, 'LOGCAP', 100)
+    tail = capture(tmp_path / 'a.log', [b'x' * 60 + b'\n', b'y' * 89 + b'\n', b'end\n'])
+    assert (tmp_path / 'a.log').read_bytes() == b'x' * 60 + b'\n' + b'y' * 39 + b'\n[... 55 more bytes not logged]\n'
+    # the tail is of everything, logged or not
+    assert tail == 'x' * 60 + '\n' + 'y' * 89 + '\nend'
+
+def test_tail(tmp_path) :
+    lines = [b'line %d' % i for i in range(100)]
+    data = b'\n'.join(lines) + b'\n' + b'z' * (tasklogs.TAILWIDTH + 10)
+    # in pieces that split lines
+    tail = capture(tmp_path / 'a.log', [data[i:i+37] for i in range(0, len(data), 37)])
+    assert (tmp_path / 'a.log').read_bytes() == data
+    assert tail.split('\n') == ['line %d' % i for i in range(100 - tasklogs.TAILLINES + 1, 100)] + ['z' * tasklogs.TAILWIDTH]
+
+def test_append(tmp_path) :
+    capture(tmp_path / 'a.log', [b'first\n'])
+    capture(tmp_path / 'a.log', [b'second\n'], append = True)
+    assert (tmp_path / 'a.log').read_bytes() == b'first\nsecond\n'
+    capture(tmp_path / 'a.log', [b'third\n'])
+    assert (tmp_path / 'a.log').read_bytes() == b'third\n'
+
+class Node(object) :
+    def __init__(self, path) :
+        self.path = path
+
+    def abspath(self) :
+        return self.path
+
+    def bldpath(self) :
+        return self.path
+
+class Bld(object) :
+    def __init__(self, path) :
+        self.bldnode = Node(path)
+        self.variant_dir = path
+
+    def exec_command(self, cmd, **kw) :
+        return Utils.subprocess.Popen(cmd, shell = True, **kw).wait()
+
+class Gen(object) :
+    pass
+
+@pytest.fixture
+def logged(tmp_path, monkeypatch) :
+    """ --tasklogs, with the methods add_tasklogs() replaces put back after """
+    for cls, name in ((Context.Context, 'exec_command'), (Task.Task, 'exec_command'), (Task.Task, 'format_error')) :
+        monkeypatch.setattr(cls, name, getattr(cls, name))
+    monkeypatch.setattr(Options, 'options', optparse.Values({'tasklogs' : True}))
+    tasklogs.add_tasklogs()
+    gen = Gen()
+    gen.bld = Bld(str(tmp_path))
+    return gen
+
+def make_task(gen, output) :
+    t = Task.Task(generator = gen, env = None)
+    t.outputs = [Node(output)]
+    return t
+
+def test_task_commands(logged, tmp_path) :
+    t = make_task(logged, os.path.join('out', 'font.ttf'))
+    assert t.exec_command('echo one; echo two >&2') == 0
+    assert t.exec_command('echo three') == 0
+    path = str(tmp_path / tasklogs.LOGDIR / ('out_font.ttf.log'))
+    assert t.logpath == path
+    with open(path) as f :
+        assert f.read().split() == ['one', 'two', 'three']
+    assert getattr(t, 'logtail', None) is None
+    # another task starts its own log
+    other = make_task(logged, os.path.join('out', 'other.ttf'))
+    assert other.exec_command('echo four') == 0
+    with open(path) as f :
+        assert f.read().split() == ['one', 'two', 'three']
+
+def test_format_error(logged) :
+    t = make_task(logged, 'font.ttf')
+    assert t.exec_command('for i in 1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 16 17 18 19 20 21 22 23 24 25 26 27 28 29 30 '
+                          '31 32 33 34 35 36 37 38 39 40 41 42 43 44 45; do echo line $i; done; exit 3') == 3
+    t.hasrun = Task.CRASHED
+    t.err_code = 3
+    res = t.format_error()
+    head, _, tail = res.partition("\n--- last lines of %s ---\n" % t.logpath)
+    assert 'exit status 3' in head
+    assert tail.split('\n') == ['line %d' % i for i in range(6, 46)]
+
+def test_no_capture(logged, monkeypatch) :
+    monkeypatch.setattr(Options, 'options', optparse.Values({'tasklogs' : False}))
+    t = make_task(logged, 'font.ttf')
+    assert t.exec_command('true') == 0
+    assert getattr(t, 'logpath', None) is None
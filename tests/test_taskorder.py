@@ -0,0 +1,156 @@
+''' Tests of the ordering of a group of tasks '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+import random
+import pytest
+from waflib import Errors, Task
+from smithlib import taskorder
+
+class Gen(object) :
+    pass
+
+class Node(object) :
+    def __init__(self, name) :
+        self.name = name
+
+class FakeTask(Task.Task) :
+    def __init__(self, name, inputs = (), outputs = (), tempcopy = None) :
+        super(FakeTask, self).__init__(generator = Gen(), env = None)
+        self.name = name
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        if tempcopy :
+            self.tempcopy = tempcopy
+
+    def __repr__(self) :
+        return self.name
+
+def random_dag(seed, num = 40, links = 60) :
+    """ Tasks with run_after links only from later to earlier ones """
+    rnd = random.Random(seed)
+    tasks = [FakeTask('t%d' % i) for i in range(num)]
+    for i in range(links) :
+        a, b = sorted(rnd.sample(range(num), 2))
+        tasks[b].set_run_after(tasks[a])
+    rnd.shuffle(tasks)
+    return tasks, rnd
+
+def check_index(index, tasks, chain) :
+    for t in chain :
+        for o in tasks :
+            assert index.runs_after(t, o) == taskorder.runs_after(t, o), (t, o)
+
+@pytest.mark.parametrize('seed', range(20))
+def test_index_matches_walk(seed) :
+    tasks, rnd = random_dag(seed)
+    chain = rnd.sample(tasks, 10)
+    index = taskorder.TaskIndex(tasks, [chain[:5], chain[5:]])
+    check_index(index, tasks, chain)
+    # and stays right as links are added that make no circle
+    for i in range(30) :
+        a, b = rnd.sample(tasks, 2)
+        if not taskorder.runs_after(b, a) :
+            index.set_run_after(a, b)
+    check_index(index, tasks, chain)
+
+@pytest.mark.parametrize('seed', range(10))
+def test_top_sort(seed) :
+    tasks, rnd = random_dag(seed)
+    res = taskorder.top_sort(tasks)
+    assert sorted(map(id, res)) == sorted(map(id, tasks))
+    pos = dict((id(t), i) for i, t in enumerate(res))
+    for t in tasks :
+        for a in t.run_after :
+            assert pos[id(a)] < pos[id(t)]
+
+def test_top_sort_circle() :
+    a, b, c, d = [FakeTask(x) for x in 'abcd']
+    b.set_run_after(a)
+    c.set_run_after(b)
+    b.set_run_after(c)
+    d.set_run_after(c)
+    with pytest.raises(Errors.WafError) :
+        taskorder.top_sort([a, b, c, d])
+
+def old_inject_modifiers(tasks) :
+    """ Finding the place in each chain by walking run_after, as it was done """
+    tmap = {}
+    for t in tasks :
+        for n in getattr(t, 'outputs', []) :
+            tmap.setdefault(id(n), []).append(t)
+    for t in tasks :
+        tmpnode, outnode = getattr(t, 'tempcopy', (None, None))
+        if outnode :
+            if id(outnode) in tmap :
+                t.set_run_after(tmap[id(outnode)][-1])
+                tmap[id(outnode)].append(t)
+            else :
+                tmap[id(outnode)] = [t]
+    for t in tasks :
+        for n in getattr(t, 'inputs', []) :
+            if id(n) in tmap :
+                entry = tmap[id(n)]
+                res = len(entry)
+                for i in range(res) :
+                    if taskorder.runs_after(entry[i], t) or id(entry[i]) == id(t) :
+                        res = i
+                        break
+                if res :
+                    t.set_run_after(entry[res - 1])
+
+def make_group(seed) :
+    """ Fonts each made, modified a random number of times, read by tests,
+        indexed and then modified again after the index """
+    rnd = random.Random(seed)
+    tasks = []
+    for f in range(3) :
+        font = Node('font%d' % f)
+        tmp = Node('font%d.tmp' % f)
+        build = FakeTask('build%d' % f, outputs = [font])
+        mods = [FakeTask('modify%d_%d' % (f, m), tempcopy = (tmp, font)) for m in range(rnd.randint(0, 4))]
+        tests = [FakeTask('test%d_%d' % (f, t), inputs = [font], outputs = [Node('res%d_%d' % (f, t))]) for t in range(5)]
+        for t in tests :
+            t.set_run_after(build)
+        index = FakeTask('index%d' % f, inputs = [t.outputs[0] for t in tests])
+        # as set_file_constraints would have it
+        for t in tests :
+            index.set_run_after(t)
+        late = FakeTask('late%d' % f, tempcopy = (tmp, font))
+        late.set_run_after(index)
+        group = [build] + mods + tests + [index, late]
+        tasks.extend(group)
+    return tasks
+
+@pytest.mark.parametrize('seed', range(5))
+def test_inject_modifiers_matches_walk(seed) :
+    new = make_group(seed)
+    old = make_group(seed)
+    taskorder.inject_modifiers(new)
+    old_inject_modifiers(old)
+    for n, o in zip(new, old) :
+        assert sorted(x.name for x in n.run_after) == sorted(x.name for x in o.run_after), n
+    # the tests read the font after the last modifier but before the late one
+    for t in new :
+        if t.name.startswith('test') :
+            f = t.name[4:].split('_')[0]
+            mods = [x for x in new if x.name.startswith('modify%s_' % f)]
+            if mods :
+                assert mods[-1] in t.run_after
+            assert not any(x.name == 'late' + f for x in t.run_after)
+
+def test_inject_modifiers_single_producer() :
+    """ A reader is linked to the only task making its input unless that
+        task already has to run after it, even by a link added on the way """
+    n1, n2, n3 = Node('n1'), Node('n2'), Node('n3')
+    p = FakeTask('p', inputs = [n2], outputs = [n1])
+    t = FakeTask('t', inputs = [n1], outputs = [n2])
+    r = FakeTask('r', inputs = [n1], outputs = [n3])
+    q = FakeTask('q', inputs = [n3])
+    taskorder.inject_modifiers([p, t, r, q])
+    assert p.run_after == set([t])
+    assert t.run_after == set()
+    assert r.run_after == set([p])
+    assert q.run_after == set([r])
+    assert taskorder.top_sort([q, r, p, t]) == [t, p, r, q]
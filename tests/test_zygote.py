@@ -0,0 +1,60 @@
+''' Tests of the zygote that runs python console scripts '''
+__url__ = 'http://github.com/silnrsi/smith'
+__copyright__ = 'Copyright (c) 2025 SIL Global (http://www.sil.org)'
+__license__ = 'Released under the 3-Clause BSD License (http://opensource.org/licenses/BSD-3-Clause)'
+
+import os, sys, threading
+import pytest
+from smithlib import zygote
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork'), reason = 'needs fork')
+
+script = """#!{}
+import sys
+from {} import main
+if __name__ == '__main__' :
+    sys.exit(main())
+"""
+
+@pytest.fixture
+def tool(tmp_path, monkeypatch) :
+    """ Makes a console script in tmp_path that calls main() with body """
+    monkeypatch.syspath_prepend(str(tmp_path))
+    def make(name, body) :
+        (tmp_path / (name + 'mod.py')).write_text("import os, sys\ndef main() :\n" + body)
+        path = tmp_path / name
+        path.write_text(script.format(sys.executable, name + 'mod'))
+        path.chmod(0o755)
+        return str(path)
+    yield make
+    zygote.shutdown()
+
+def run(cmd, cwd, **kw) :
+    """ run_command, failing rather than hanging if it doesn't return """
+    res = []
+    t = threading.Thread(target = lambda : res.append(zygote.run_command(cmd, cwd, dict(os.environ), **kw)))
+    t.daemon = True
+    t.start()
+    t.join(30)
+    assert not t.is_alive(), "the zygote didn't return a result"
+    return res[0]
+
+def test_exit_status(tool, tmp_path) :
+    exe = tool('zstatus', "    sys.exit(5)\n")
+    assert zygote.script_entry(exe) == ('zstatusmod', 'main')
+    assert run(exe, str(tmp_path)) == 5
+
+def test_exit_without_result(tool, tmp_path) :
+    exe = tool('zexit', "    os._exit(3)\n")
+    assert run(exe, str(tmp_path)) == 3
+
+def test_killed(tool, tmp_path) :
+    exe = tool('zkill', "    import signal\n    os.kill(os.getpid(), signal.SIGKILL)\n")
+    assert run(exe, str(tmp_path)) == -9
+
+def test_output_fds(tool, tmp_path) :
+    exe = tool('zout', "    print('to out ' + sys.argv[1])\n    sys.stderr.write('to err\\n')\n")
+    with open(str(tmp_path / 'out'), 'wb') as out, open(str(tmp_path / 'err'), 'wb') as err :
+        assert run(exe + ' x', str(tmp_path), stdout = out.fileno(), stderr = err.fileno()) == 0
+    assert (tmp_path / 'out').read_text() == 'to out x\n'
+    assert (tmp_path / 'err').read_text() == 'to err\n'